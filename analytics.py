@@ -0,0 +1,235 @@
+"""
+Leave analytics for HR and supervisors.
+
+Data is pulled once per scope as a single joined SELECT into a DataFrame of
+compact dtypes (categoricals, float32, datetime64) and every figure below is
+a groupby or vectorized expression over that frame - no per-row ORM access.
+
+When a snapshot store exists (see snapshots.py) the frames are built from
+the memory-mapped columnar files instead, and the database is not queried.
+"""
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from datetime import datetime
+from sqlalchemy import select
+
+from database import read_engine, User, UserProfile, LeaveType, LeaveBalance, LeaveRequest
+import snapshots
+
+SENIORITY_BINS = [0, 1, 3, 5, 10, 100]
+SENIORITY_LABELS = ["<1 yr", "1-3 yrs", "3-5 yrs", "5-10 yrs", "10+ yrs"]
+
+CATEGORY_COLUMNS = ["department", "leave_type", "status", "duration_type"]
+
+def _compact(df):
+    """Downcast a freshly loaded frame to compact dtypes"""
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    for column in ["total_days", "allocated_days", "used_days", "carry_over_days"]:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column]).astype("float32")
+    for column in ["start_date", "starting_date"]:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column])
+    return df
+
+def use_snapshots():
+    """Read analytics from the snapshot store when one has been exported"""
+    return snapshots.has_snapshots()
+
+def _snapshot_profiles(supervisor_id=None):
+    profiles = snapshots.read_snapshot("user_profiles").to_pandas()
+    if supervisor_id:
+        profiles = profiles[profiles["supervisor_id"] == supervisor_id]
+    return profiles.rename(columns={"id": "profile_id"})
+
+def _snapshot_leave_types():
+    return snapshots.read_snapshot("leave_types").to_pandas().rename(
+        columns={"id": "leave_type_id", "name": "leave_type"}
+    )
+
+def _requests_from_snapshot(supervisor_id=None, since_year=None):
+    years = range(since_year, datetime.now().year + 2) if since_year else None
+    requests = snapshots.read_snapshot("leave_requests", years=years).select(
+        ["id", "employee_id", "leave_type_id", "start_date", "total_days", "status", "duration_type"]
+    ).to_pandas()
+    profiles = _snapshot_profiles(supervisor_id)[
+        ["profile_id", "employee_id", "department", "starting_date", "is_senior"]
+    ]
+    df = requests.merge(
+        profiles, left_on="employee_id", right_on="profile_id", suffixes=("_fk", "")
+    ).merge(_snapshot_leave_types()[["leave_type_id", "leave_type"]], on="leave_type_id")
+    return df.drop(columns=["employee_id_fk", "profile_id", "leave_type_id"])
+
+def _balances_from_snapshot(year, supervisor_id=None):
+    balances = snapshots.read_snapshot("leave_balances", years=[year]).to_pandas()
+    profiles = _snapshot_profiles(supervisor_id)
+    profiles = profiles[profiles["is_active"]]
+    profiles = profiles.assign(name=profiles["first_name"] + " " + profiles["last_name"])[
+        ["profile_id", "employee_id", "name", "department"]
+    ]
+    df = balances.merge(profiles, left_on="user_id", right_on="profile_id").merge(
+        _snapshot_leave_types()[["leave_type_id", "leave_type"]], on="leave_type_id"
+    )
+    return df[["employee_id", "name", "department", "leave_type", "allocated_days", "used_days", "carry_over_days"]]
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_requests(supervisor_id=None, since_year=None):
+    """All leave requests in scope as one columnar pull"""
+    if use_snapshots():
+        return _compact(_requests_from_snapshot(supervisor_id, since_year))
+    
+    query = select(
+        LeaveRequest.id,
+        LeaveRequest.start_date,
+        LeaveRequest.total_days,
+        LeaveRequest.status,
+        LeaveRequest.duration_type,
+        LeaveType.name.label("leave_type"),
+        UserProfile.employee_id,
+        UserProfile.department,
+        UserProfile.starting_date,
+        UserProfile.is_senior,
+    ).join(LeaveType, LeaveType.id == LeaveRequest.leave_type_id).join(
+        UserProfile, UserProfile.id == LeaveRequest.employee_id
+    )
+    if supervisor_id:
+        query = query.where(UserProfile.supervisor_id == supervisor_id)
+    if since_year:
+        query = query.where(LeaveRequest.start_date >= datetime(since_year, 1, 1).date())
+
+    with read_engine().connect() as conn:
+        df = pd.read_sql(query, conn)
+    return _compact(df)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_balances(year, supervisor_id=None):
+    """All leave balances for a year in scope as one columnar pull"""
+    if use_snapshots():
+        return _compact(_balances_from_snapshot(year, supervisor_id))
+    
+    query = select(
+        UserProfile.employee_id,
+        (User.first_name + " " + User.last_name).label("name"),
+        UserProfile.department,
+        LeaveType.name.label("leave_type"),
+        LeaveBalance.allocated_days,
+        LeaveBalance.used_days,
+        LeaveBalance.carry_over_days,
+    ).join(LeaveType, LeaveType.id == LeaveBalance.leave_type_id).join(
+        UserProfile, UserProfile.id == LeaveBalance.user_id
+    ).join(User, User.id == UserProfile.user_id).where(
+        LeaveBalance.year == year,
+        UserProfile.is_active == True
+    )
+    if supervisor_id:
+        query = query.where(UserProfile.supervisor_id == supervisor_id)
+
+    with read_engine().connect() as conn:
+        df = pd.read_sql(query, conn)
+    return _compact(df)
+
+# Computations - all vectorized over the loaded frames
+def usage_trends(requests):
+    """Approved leave days per month and leave type"""
+    approved = requests[requests["status"] == "approved"]
+    month = approved["start_date"].dt.to_period("M").dt.to_timestamp()
+    return (
+        approved.groupby([month.rename("month"), "leave_type"], observed=True)["total_days"]
+        .sum()
+        .reset_index()
+    )
+
+def department_comparison(requests):
+    """Approved days, request counts and days per employee by department"""
+    approved = requests[requests["status"] == "approved"]
+    summary = approved.groupby("department", observed=True).agg(
+        total_days=("total_days", "sum"),
+        requests=("id", "count"),
+        employees=("employee_id", "nunique"),
+    )
+    summary["days_per_employee"] = summary["total_days"] / summary["employees"]
+    return summary.sort_values("total_days", ascending=False).reset_index()
+
+def seniority_breakdown(requests):
+    """Approved days by years of service at the start of the leave"""
+    approved = requests[requests["status"] == "approved"]
+    tenure_years = (approved["start_date"] - approved["starting_date"]).dt.days / 365.25
+    bucket = pd.cut(tenure_years, bins=SENIORITY_BINS, labels=SENIORITY_LABELS, right=False)
+    return (
+        approved.groupby([bucket.rename("seniority"), "leave_type"], observed=True)["total_days"]
+        .sum()
+        .reset_index()
+    )
+
+def top_balance_holders(balances, leave_type=None, limit=10):
+    """Employees with the most available days"""
+    if leave_type:
+        balances = balances[balances["leave_type"] == leave_type]
+    available = balances["allocated_days"] + balances["carry_over_days"] - balances["used_days"]
+    result = balances.assign(available_days=available)
+    return result.nlargest(limit, "available_days")[
+        ["employee_id", "name", "department", "leave_type", "available_days", "used_days"]
+    ]
+
+def analytics_page(profile, company_wide=False):
+    """Render the analytics page"""
+    st.title("📈 Leave Analytics")
+
+    supervisor_id = None if company_wide else profile.id
+    scope = "Company-wide" if company_wide else "Your team"
+    if use_snapshots():
+        scope += " · from the latest analytics snapshot"
+    st.caption(scope)
+
+    current_year = datetime.now().year
+    years_back = st.slider("Years of history", min_value=1, max_value=10, value=3)
+
+    with st.spinner("Loading leave data..."):
+        requests = load_requests(supervisor_id=supervisor_id, since_year=current_year - years_back + 1)
+        balances = load_balances(current_year, supervisor_id=supervisor_id)
+
+    if requests.empty and balances.empty:
+        st.info("No leave data available yet.")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    approved = requests["status"] == "approved"
+    with col1:
+        st.metric("Approved Days", f"{requests.loc[approved, 'total_days'].sum():.1f}")
+    with col2:
+        st.metric("Requests", len(requests))
+    with col3:
+        st.metric("Employees", requests["employee_id"].nunique())
+
+    st.subheader("Usage Trends by Leave Type")
+    trends = usage_trends(requests)
+    if not trends.empty:
+        st.plotly_chart(
+            px.line(trends, x="month", y="total_days", color="leave_type", markers=True),
+            use_container_width=True
+        )
+
+    st.subheader("Department Comparison")
+    departments = department_comparison(requests)
+    if not departments.empty:
+        st.plotly_chart(
+            px.bar(departments, x="department", y="days_per_employee", hover_data=["total_days", "requests"]),
+            use_container_width=True
+        )
+
+    st.subheader("Seniority Breakdown")
+    seniority = seniority_breakdown(requests)
+    if not seniority.empty:
+        st.plotly_chart(
+            px.bar(seniority, x="seniority", y="total_days", color="leave_type", barmode="stack"),
+            use_container_width=True
+        )
+
+    st.subheader("Top Balance Holders")
+    leave_types = sorted(balances["leave_type"].cat.categories) if not balances.empty else []
+    selected_type = st.selectbox("Leave Type", ["All"] + leave_types)
+    top = top_balance_holders(balances, None if selected_type == "All" else selected_type)
+    st.dataframe(top, use_container_width=True, hide_index=True)
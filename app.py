@@ -1,14 +1,23 @@
+import startup
 import streamlit as st
-import pandas as pd
 from datetime import datetime, date, timedelta
-from database import *
+with startup.timed("import database"):
+    from database import *
+import schema_migrations
+import metrics
+import querywatch
+import profiling
+import dashboard_tables
+from leave_service import ServiceError
+from leave_service.sqlalchemy_store import service as leave_service
 from streamlit_option_menu import option_menu
-import plotly.express as px
-import plotly.graph_objects as go
 from sqlalchemy.orm import sessionmaker, joinedload
 from sqlalchemy import and_, or_, func
 import hashlib
 import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
 
 # Page config
 st.set_page_config(
@@ -18,18 +27,39 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Initialize database
+# Initialize database (once per process; pandas and plotly load lazily per page)
 @st.cache_resource
 def init_db():
-    init_database()
-    create_initial_data()
-    return SessionLocal()
+    with startup.timed("schema check"):
+        if not schema_migrations.schema_is_current():
+            if engine.dialect.name != "sqlite":
+                st.error("The database schema is out of date. Run `python deploy.py migrate`.")
+                st.stop()
+            # Local SQLite has no deploy step: migrate in place
+            schema_migrations.migrate()
+    with startup.timed("initial data"):
+        create_initial_data()
+    startup.log_report()
+    return True
+
+def startup_timings():
+    """Cold start report in the sidebar, when enabled"""
+    if not startup.show_timings(st.query_params):
+        return
+    with st.expander("⏱️ Startup timings"):
+        for name, seconds in startup.timings():
+            st.caption(f"{name}: {seconds * 1000:.0f} ms")
+        st.caption(f"Process up: {startup.since_process_start():.1f} s")
 
 # Authentication functions
 def verify_email_domain(email):
     """Check if email is from tempo.fit domain"""
     return email.endswith('@tempo.fit')
 
+def is_hr(profile):
+    """HR staff see company-wide analytics"""
+    return profile.department == "HR"
+
 def authenticate_user(email):
     """Authenticate user by email"""
     if not verify_email_domain(email):
@@ -108,15 +138,7 @@ def simple_login():
 
 def get_leave_balances(user_profile_id):
     """Get leave balances for a user"""
-    db = SessionLocal()
-    try:
-        balances = db.query(LeaveBalance).options(joinedload(LeaveBalance.leave_type)).filter(
-            LeaveBalance.user_id == user_profile_id,
-            LeaveBalance.year == datetime.now().year
-        ).all()
-        return balances
-    finally:
-        db.close()
+    return leave_service().balances(user_profile_id)
 
 def get_leave_requests(user_id=None, employee_id=None, status=None):
     """Get leave requests"""
@@ -143,25 +165,147 @@ def get_leave_requests(user_id=None, employee_id=None, status=None):
     finally:
         db.close()
 
-def create_leave_request(employee_id, leave_type_id, start_date, end_date, duration_type, total_days, reason=None):
-    """Create a new leave request"""
+def get_leave_requests_page(employee_id=None, supervisor_id=None, status=None, cursor=None, limit=10):
+    """Get one keyset page of leave requests, newest first.
+
+    The cursor is the (created_at, id) of the last row on the previous page,
+    so every page is a bounded index range scan however long the history is.
+    Returns (requests, next_cursor); next_cursor is None on the last page.
+    """
     db = SessionLocal()
     try:
-        leave_request = LeaveRequest(
-            employee_id=employee_id,
-            leave_type_id=leave_type_id,
-            start_date=start_date,
-            end_date=end_date,
-            duration_type=duration_type,
-            total_days=total_days,
-            reason=reason
+        query = db.query(LeaveRequest).options(
+            joinedload(LeaveRequest.employee).joinedload(UserProfile.user),
+            joinedload(LeaveRequest.leave_type),
+            joinedload(LeaveRequest.approved_by)
         )
-        db.add(leave_request)
-        db.commit()
-        return leave_request
+        
+        if employee_id:
+            query = query.filter(LeaveRequest.employee_id == employee_id)
+        if supervisor_id:
+            team_ids = db.query(UserProfile.id).filter(
+                UserProfile.supervisor_id == supervisor_id,
+                UserProfile.is_active == True
+            )
+            query = query.filter(LeaveRequest.employee_id.in_(team_ids))
+        if status:
+            query = query.filter(LeaveRequest.status == status)
+        if cursor:
+            created_at, last_id = cursor
+            query = query.filter(or_(
+                LeaveRequest.created_at < created_at,
+                and_(LeaveRequest.created_at == created_at, LeaveRequest.id < last_id)
+            ))
+        
+        # Fetch one extra row to know whether there is a next page
+        rows = query.order_by(
+            LeaveRequest.created_at.desc(), LeaveRequest.id.desc()
+        ).limit(limit + 1).all()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1].created_at, rows[-1].id)
+        return rows, next_cursor
     finally:
         db.close()
 
+def keyset_navigation(key, next_cursor):
+    """Render "Load more" / "Newest" buttons for a keyset-paginated list.
+
+    The stack of cursors visited is kept in session state under `key`.
+    """
+    stack = st.session_state.setdefault(key, [])
+    col1, col2 = st.columns(2)
+    with col1:
+        if stack and st.button("⏫ Newest", key=f"{key}_newest"):
+            st.session_state[key] = []
+            st.rerun()
+    with col2:
+        if next_cursor and st.button("⏬ Load more", key=f"{key}_more"):
+            stack.append(next_cursor)
+            st.rerun()
+
+def current_cursor(key):
+    """Get the cursor for the page currently shown under `key`"""
+    stack = st.session_state.get(key) or []
+    return stack[-1] if stack else None
+
+def create_leave_request(employee_id, leave_type_id, start_date, end_date, duration_type, reason=None):
+    """Create a new leave request (validated by the shared leave rules; raises ServiceError)"""
+    request = leave_service().create_request(
+        employee_id, leave_type_id, start_date, end_date,
+        duration_type=duration_type, reason=reason or ""
+    )
+    pin_to_primary()
+    return request
+
+def pin_to_primary():
+    """Read from the primary for a while after this user's own write (read-your-writes)"""
+    st.session_state.primary_until = time.time() + REPLICA_PIN_SECONDS
+
+def reads_pinned():
+    return time.time() < st.session_state.get("primary_until", 0)
+
+# N+1 detection and per-page query budgets, for development (see querywatch.py)
+QUERY_WATCH, QUERY_BUDGET_DEFAULT, QUERY_REPEAT_THRESHOLD = querywatch.settings_from_env()
+PAGE_QUERY_BUDGETS = {
+    "Dashboard": 8,
+    "Employee View": 8,
+    "Supervisor View": 8,
+    "Analytics": 4,
+}
+
+# On-demand profiling of page renders, from the sidebar (see profiling.py)
+PROFILE_MODES = {"Sampling (flamegraph)": "sample", "cProfile": "cprofile"}
+
+def can_profile(profile):
+    return profile.is_supervisor or is_hr(profile)
+
+def profiling_toggle():
+    """Sidebar switch to profile the following page renders; returns the slot for the result"""
+    st.session_state.last_profile = None
+    if not st.toggle("🔬 Profile this page", key="profile_pages"):
+        return None
+    st.radio("Profiler", list(PROFILE_MODES), key="profile_mode", horizontal=True)
+    return st.empty()
+
+def profile_downloads(slot):
+    """Summary and downloads of the profile taken during this rerun"""
+    profile = st.session_state.get("last_profile")
+    if profile is None:
+        return
+    with slot.container():
+        with open(profile.files["json"]) as handle:
+            summary = json.load(handle)
+        st.caption(
+            f"{profile.name}: {summary['duration_ms']:.0f} ms, "
+            f"{summary['query_count']} queries ({summary['query_ms']:.0f} ms)"
+        )
+        for kind, path in sorted(profile.files.items()):
+            with open(path, "rb") as handle:
+                st.download_button(
+                    f"Download .{kind}", handle.read(), file_name=os.path.basename(path),
+                    mime=profiling.FILE_KINDS[kind], key=f"profile_{kind}"
+                )
+
+@contextmanager
+def page_render(page):
+    """Render a page: timed, checked for N+1s, profiled on request and reading from the replica (if any)"""
+    watch = querywatch.watch(
+        f"page {page}",
+        budget=PAGE_QUERY_BUDGETS.get(page, QUERY_BUDGET_DEFAULT),
+        repeat_threshold=QUERY_REPEAT_THRESHOLD,
+        action=QUERY_WATCH
+    ) if QUERY_WATCH else nullcontext()
+    capture = profiling.capture(
+        f"page {page}", mode=PROFILE_MODES[st.session_state.get("profile_mode", "Sampling (flamegraph)")]
+    ) if st.session_state.get("profile_pages") else nullcontext()
+    with capture as profile, metrics.timed_page(page), watch, replica_reads(enabled=not reads_pinned()):
+        yield
+    if profile is not None:
+        st.session_state.last_profile = profile
+
 def employee_dashboard():
     """Employee dashboard"""
     user = st.session_state.user
@@ -212,21 +356,13 @@ def employee_dashboard():
     
     # Recent requests
     st.subheader("📋 Recent Requests")
-    requests = get_leave_requests(user_id=user.id)
+    requests, next_cursor = get_leave_requests_page(
+        employee_id=profile.id,
+        cursor=current_cursor("history_cursors")
+    )
     
     if requests:
-        request_data = []
-        for req in requests[:10]:  # Show last 10 requests
-            request_data.append({
-                "Date": req.created_at.strftime("%Y-%m-%d"),
-                "Leave Type": req.leave_type.name,
-                "Period": f"{req.start_date} to {req.end_date}",
-                "Days": float(req.total_days),
-                "Status": req.status.title(),
-                "ID": req.id
-            })
-        
-        df = pd.DataFrame(request_data)
+        df = dashboard_tables.request_table(startup.lazy_import("pandas"), requests)
         
         # Color code status
         def color_status(val):
@@ -240,6 +376,7 @@ def employee_dashboard():
         
         styled_df = df.style.applymap(color_status, subset=['Status'])
         st.dataframe(styled_df, use_container_width=True)
+        keyset_navigation("history_cursors", next_cursor)
     else:
         st.info("No leave requests yet. Create your first request below!")
     
@@ -270,15 +407,9 @@ def supervisor_dashboard():
     st.title(f"Supervisor Dashboard - {user.first_name} 👨‍💼")
     st.markdown(f"**{profile.position}** | **{profile.department}**")
     
-    # Get subordinates
-    db = SessionLocal()
-    try:
-        subordinates = db.query(UserProfile).filter(
-            UserProfile.supervisor_id == profile.id,
-            UserProfile.is_active == True
-        ).all()
-    finally:
-        db.close()
+    # Team members with their balances and request counts (a fixed number of queries)
+    team = leave_service().team_summary(profile.id)
+    subordinates = [entry["employee"] for entry in team]
     
     # Summary metrics
     col1, col2, col3, col4 = st.columns(4)
@@ -287,21 +418,13 @@ def supervisor_dashboard():
         st.metric("Team Size", len(subordinates))
     
     with col2:
-        pending_requests = []
-        for sub in subordinates:
-            pending = get_leave_requests(employee_id=sub.id, status="pending")
-            pending_requests.extend(pending)
-        st.metric("Pending Requests", len(pending_requests))
+        st.metric("Pending Requests", sum(entry["pending_requests"] for entry in team))
     
     with col3:
-        # Total team leave days this month
-        current_month = datetime.now().month
-        monthly_requests = []
-        for sub in subordinates:
-            requests = get_leave_requests(employee_id=sub.id, status="approved")
-            monthly_requests.extend([r for r in requests if r.start_date.month == current_month])
-        total_days = sum(float(r.total_days) for r in monthly_requests)
-        st.metric("Team Leave Days (This Month)", f"{total_days:.1f}")
+        # Approved leave days starting this month across the team
+        now = datetime.now()
+        usage = leave_service().team_monthly_usage(profile.id, now.year, now.month)
+        st.metric("Team Leave Days (This Month)", f"{float(usage['total_days']):.1f}")
     
     with col4:
         st.metric("Departments", len(set(sub.department for sub in subordinates)))
@@ -309,15 +432,21 @@ def supervisor_dashboard():
     st.markdown("---")
     
     # Pending requests that need approval
+    pending_requests, next_cursor = get_leave_requests_page(
+        supervisor_id=profile.id,
+        status="pending",
+        cursor=current_cursor("inbox_cursors")
+    )
     if pending_requests:
         st.subheader("⏳ Pending Approvals")
         
         for request in pending_requests:
-            with st.expander(f"{request.user.first_name} {request.user.last_name} - {request.leave_type.name} ({request.start_date} to {request.end_date})"):
+            employee_user = request.employee.user
+            with st.expander(f"{employee_user.first_name} {employee_user.last_name} - {request.leave_type.name} ({request.start_date} to {request.end_date})"):
                 col1, col2 = st.columns([2, 1])
                 
                 with col1:
-                    st.write(f"**Employee:** {request.user.first_name} {request.user.last_name}")
+                    st.write(f"**Employee:** {employee_user.first_name} {employee_user.last_name}")
                     st.write(f"**Position:** {request.employee.position}")
                     st.write(f"**Department:** {request.employee.department}")
                     st.write(f"**Leave Type:** {request.leave_type.name}")
@@ -328,75 +457,43 @@ def supervisor_dashboard():
                 
                 with col2:
                     if st.button("✅ Approve", key=f"approve_{request.id}"):
-                        approve_request(request.id, profile.id)
-                        st.success("Request approved!")
-                        st.rerun()
+                        try:
+                            approve_request(request.id, profile.id)
+                            st.success("Request approved!")
+                            st.rerun()
+                        except ServiceError as e:
+                            st.error(str(e))
                     
                     if st.button("❌ Reject", key=f"reject_{request.id}"):
-                        reject_request(request.id, profile.id)
-                        st.error("Request rejected!")
-                        st.rerun()
+                        try:
+                            reject_request(request.id, profile.id)
+                            st.error("Request rejected!")
+                            st.rerun()
+                        except ServiceError as e:
+                            st.error(str(e))
+        
+        keyset_navigation("inbox_cursors", next_cursor)
     
     # Team overview
     st.subheader("👥 Team Overview")
     
-    if subordinates:
-        team_data = []
-        for sub in subordinates:
-            balances = get_leave_balances(sub.id)
-            requests = get_leave_requests(employee_id=sub.id)
-            pending = [r for r in requests if r.status == "pending"]
-            
-            team_data.append({
-                "Name": f"{sub.user.first_name} {sub.user.last_name}",
-                "Employee ID": sub.employee_id,
-                "Department": sub.department,
-                "Position": sub.position,
-                "Pending Requests": len(pending),
-                "Total Requests": len(requests)
-            })
-        
-        df = pd.DataFrame(team_data)
+    if team:
+        df = dashboard_tables.team_table(startup.lazy_import("pandas"), team)
         st.dataframe(df, use_container_width=True)
     else:
         st.info("No team members found.")
 
 def approve_request(request_id, supervisor_id):
-    """Approve a leave request"""
-    db = SessionLocal()
-    try:
-        request = db.query(LeaveRequest).filter(LeaveRequest.id == request_id).first()
-        if request:
-            request.status = "approved"
-            request.approved_by_id = supervisor_id
-            request.approved_date = datetime.now()
-            
-            # Update leave balance
-            balance = db.query(LeaveBalance).filter(
-                LeaveBalance.user_id == request.employee_id,
-                LeaveBalance.leave_type_id == request.leave_type_id,
-                LeaveBalance.year == datetime.now().year
-            ).first()
-            
-            if balance:
-                balance.used_days += request.total_days
-            
-            db.commit()
-    finally:
-        db.close()
+    """Approve a leave request (raises ServiceError if not allowed)"""
+    request = leave_service().approve(request_id, supervisor_id)
+    pin_to_primary()
+    return request
 
 def reject_request(request_id, supervisor_id):
-    """Reject a leave request"""
-    db = SessionLocal()
-    try:
-        request = db.query(LeaveRequest).filter(LeaveRequest.id == request_id).first()
-        if request:
-            request.status = "rejected"
-            request.approved_by_id = supervisor_id
-            request.approved_date = datetime.now()
-            db.commit()
-    finally:
-        db.close()
+    """Reject a leave request (raises ServiceError if not allowed)"""
+    request = leave_service().reject(request_id, supervisor_id)
+    pin_to_primary()
+    return request
 
 def new_leave_request():
     """Create new leave request form"""
@@ -406,12 +503,8 @@ def new_leave_request():
     profile = st.session_state.user_profile
     
     with st.form("leave_request_form"):
-        # Get leave types
-        db = SessionLocal()
-        try:
-            leave_types = db.query(LeaveType).filter(LeaveType.is_active == True).all()
-        finally:
-            db.close()
+        # Get leave types (cached by the leave service)
+        leave_types = leave_service().leave_types()
         
         leave_type_options = {lt.name: lt.id for lt in leave_types}
         selected_leave_type = st.selectbox("Leave Type", options=leave_type_options.keys())
@@ -429,40 +522,111 @@ def new_leave_request():
         submitted = st.form_submit_button("Submit Request", type="primary")
         
         if submitted:
-            if start_date > end_date:
-                st.error("End date must be after start date")
-                return
-            
-            # Calculate total days
-            if duration_type == "full_day":
-                total_days = (end_date - start_date).days + 1
-            else:  # half_day
-                total_days = 0.5
-            
-            # Check if reason is required
-            leave_type_obj = next(lt for lt in leave_types if lt.name == selected_leave_type)
-            if leave_type_obj.requires_reason and not reason:
-                st.error("Reason is required for this type of leave")
-                return
-            
-            # Create request
+            # Dates, reason and balance are checked by the shared leave rules
             try:
                 request = create_leave_request(
-                    user_id=user.id,
                     employee_id=profile.id,
                     leave_type_id=leave_type_options[selected_leave_type],
                     start_date=start_date,
                     end_date=end_date,
                     duration_type=duration_type,
-                    total_days=total_days,
                     reason=reason
                 )
-                
-                st.success("Leave request submitted successfully!")
-                st.session_state.show_new_request = False
-                st.rerun()
+            except ServiceError as e:
+                for message in e.messages:
+                    st.error(message)
+                return
             except Exception as e:
                 st.error(f"Error creating request: {str(e)}")
+                return
+            
+            st.success("Leave request submitted successfully!")
+            st.session_state.show_new_request = False
+            st.rerun()
+
+def slow_queries_panel(pd):
+    """Slowest statement shapes by total time, with their EXPLAIN plans"""
+    st.markdown(f"**Slow queries** (over {SLOW_QUERY_MS:g} ms)" if SLOW_QUERY_MS else "**Slow queries** (off)")
+    db = SessionLocal()
+    try:
+        slow = db.query(SlowQuery).order_by(SlowQuery.total_ms.desc()).limit(20).all()
+    finally:
+        db.close()
+    if not slow:
+        st.info("No slow queries recorded.")
+        return
+    st.dataframe(pd.DataFrame([
+        {
+            "Query": row.fingerprint[:120],
+            "Count": row.count,
+            "Mean (ms)": round(row.total_ms / row.count, 1),
+            "Max (ms)": round(row.max_ms, 1),
+            "Total (ms)": round(row.total_ms, 1),
+            "Database": row.database,
+            "Call site": row.call_site,
+            "Last seen": row.last_seen,
+        }
+        for row in slow
+    ]), use_container_width=True, hide_index=True)
+    choice = st.selectbox("Plan for", range(len(slow)), format_func=lambda index: slow[index].fingerprint[:120])
+    row = slow[choice]
+    st.code(row.fingerprint, language="sql")
+    st.caption(f"Parameters (redacted): {row.sample_params}")
+    st.code(row.plan or "Not explained (only SELECTs are)", language="text")
+
+def metrics_panel():
+    """Runtime metrics of this app process (HR only)"""
+    st.subheader("📈 Metrics")
+    st.caption("Since this app process started. The Django app serves the same metrics at /metrics.")
+    pd = startup.lazy_import("pandas")
+    
+    # Page latency and queries per page
+    queries = {row["page"]: row for row in metrics.PAGE_QUERIES.summary()}
+    db_time = {row["page"]: row for row in metrics.PAGE_DB_SECONDS.summary()}
+    pages = [
+        {
+            "Page": row["page"],
+            "Renders": row["count"],
+            "Mean (ms)": round(row["mean"] * 1000, 1),
+            "p50 (ms)": round(row["p50"] * 1000, 1),
+            "p95 (ms)": round(row["p95"] * 1000, 1),
+            "Queries / render": round(queries[row["page"]]["mean"], 1),
+            "DB time / render (ms)": round(db_time[row["page"]]["mean"] * 1000, 1),
+        }
+        for row in metrics.PAGE_SECONDS.summary()
+    ]
+    st.markdown("**Pages**")
+    if pages:
+        st.dataframe(pd.DataFrame(pages), use_container_width=True, hide_index=True)
+    else:
+        st.info("No pages rendered yet.")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Database**")
+        for row in metrics.DB_QUERY_SECONDS.summary():
+            st.metric(f"Queries ({row['database']})", row["count"], f"p95 {row['p95'] * 1000:.1f} ms", delta_color="off")
+        pool = {(dict(labels)["engine"], dict(labels)["state"]): value for name, labels, value in metrics.DB_POOL_CONNECTIONS.samples()}
+        for engine_name in sorted({engine_name for engine_name, state in pool}):
+            st.write(
+                f"Pool **{engine_name}**: {pool.get((engine_name, 'checked_out'), 0)} in use, "
+                f"{pool.get((engine_name, 'idle'), 0)} idle, {pool.get((engine_name, 'overflow'), 0)} overflow "
+                f"(size {pool.get((engine_name, 'size'), 0)})"
+            )
+    with col2:
+        st.markdown("**Caches**")
+        ratios = metrics.cache_hit_ratios()
+        if not ratios:
+            st.write("No cache lookups yet.")
+        for cache_name, (hits, misses, ratio) in sorted(ratios.items()):
+            st.metric(cache_name, f"{ratio:.0%}", f"{hits} hits / {misses} misses", delta_color="off")
+    
+    slow_queries_panel(pd)
+    
+    with st.expander("Prometheus format"):
+        text = metrics.render()
+        st.code(text, language="text")
+        st.download_button("Download", text, file_name="metrics.prom", mime="text/plain")
 
 def main():
     """Main application"""
@@ -485,8 +649,16 @@ def main():
         if st.session_state.user_profile.is_supervisor:
             selected = option_menu(
                 "Navigation",
-                ["Employee View", "Supervisor View", "Profile", "Logout"],
-                icons=['person', 'people', 'gear', 'box-arrow-right'],
+                ["Employee View", "Supervisor View", "Analytics", "Profile", "Logout"],
+                icons=['person', 'people', 'graph-up', 'gear', 'box-arrow-right'],
+                menu_icon="cast",
+                default_index=0,
+            )
+        elif is_hr(st.session_state.user_profile):
+            selected = option_menu(
+                "Navigation",
+                ["Dashboard", "Analytics", "Metrics", "Profile", "Logout"],
+                icons=['house', 'graph-up', 'speedometer', 'gear', 'box-arrow-right'],
                 menu_icon="cast",
                 default_index=0,
             )
@@ -499,16 +671,28 @@ def main():
                 default_index=0,
             )
         
+        startup_timings()
+        profile_slot = profiling_toggle() if can_profile(st.session_state.user_profile) else None
+        
         if selected == "Logout":
             del st.session_state.user
             del st.session_state.user_profile
             st.rerun()
     
-    # Main content area
+    # Main content area (see page_render)
     if selected == "Dashboard" or selected == "Employee View":
-        employee_dashboard()
+        with page_render(selected):
+            employee_dashboard()
     elif selected == "Supervisor View":
-        supervisor_dashboard()
+        with page_render(selected):
+            supervisor_dashboard()
+    elif selected == "Analytics":
+        analytics = startup.lazy_import("analytics")
+        profile = st.session_state.user_profile
+        with page_render(selected):
+            analytics.analytics_page(profile, company_wide=is_hr(profile))
+    elif selected == "Metrics":
+        metrics_panel()
     elif selected == "Profile":
         st.subheader("👤 Profile")
         profile = st.session_state.user_profile
@@ -526,6 +710,9 @@ def main():
             st.write(f"**Country:** {profile.country}")
             st.write(f"**Status:** {'Senior' if profile.is_senior else 'Regular'}")
     
+    if profile_slot is not None:
+        profile_downloads(profile_slot)
+    
     # Handle modal dialogs
     if 'show_new_request' in st.session_state and st.session_state.show_new_request:
         new_leave_request()
@@ -0,0 +1,232 @@
+"""
+Micro-benchmarks for the leave computations on hot paths, tracked against a
+stored baseline:
+
+    python manage.py run_benchmarks              # run and compare with the baseline
+    python manage.py run_benchmarks --save       # record this run as the new baseline
+    python manage.py run_benchmarks --filter form
+
+Benchmarks are registered with @benchmark: the decorated function does the
+setup (building data at a realistic size) and returns the callable to time.
+Framework-neutral ones live here, the Django ones in leaves.benchmarks.
+
+Timing follows timeit: the loop count is calibrated until a run takes about
+0.2 s, the run is repeated REPEAT times and the best time per call is kept,
+as the slower runs mostly measure noise. A benchmark slower than its
+baseline by more than the threshold (20% by default) is a regression.
+
+The baseline file holds the current baseline of each benchmark and a
+history of saved runs with the commit and machine they were recorded on.
+Timings only compare on the same machine, so keep one baseline per machine
+(e.g. the CI runner's).
+"""
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+import json
+import os
+import platform
+import statistics
+import subprocess
+import timeit
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(PROJECT_ROOT, "benchmark_baseline.json")
+DEFAULT_THRESHOLD = 0.2
+REPEAT = 5
+HISTORY_LIMIT = 100
+
+# Realistic sizes: a company-wide balance list, a supervisor's team, one dashboard page
+BALANCE_COUNT = 1000
+TEAM_SIZE = 50
+PAGE_SIZE = 10
+
+Benchmark = namedtuple("Benchmark", ["name", "setup", "description"])
+Timing = namedtuple("Timing", ["best", "median", "loops"])
+
+_registry = {}
+
+def benchmark(name, description=None):
+    """Register a benchmark; the decorated setup function returns the callable to time"""
+    def register(setup):
+        _registry[name] = Benchmark(name, setup, description or (setup.__doc__ or "").strip())
+        return setup
+    return register
+
+def registered(patterns=None):
+    """Benchmarks whose name contains any of the patterns (all by default), by name"""
+    return [
+        _registry[name] for name in sorted(_registry)
+        if not patterns or any(pattern.lower() in name.lower() for pattern in patterns)
+    ]
+
+def time_call(func, repeat=REPEAT):
+    """Best and median seconds per call of func()"""
+    timer = timeit.Timer(func)
+    loops, _ = timer.autorange()
+    runs = [elapsed / loops for elapsed in timer.repeat(repeat, loops)]
+    return Timing(min(runs), statistics.median(runs), loops)
+
+def run(benchmarks, repeat=REPEAT, log=print):
+    """Time each benchmark; {name: Timing}"""
+    results = {}
+    for bench in benchmarks:
+        func = bench.setup()
+        results[bench.name] = time_call(func, repeat)
+        log(f"{bench.name:<45} {format_seconds(results[bench.name].best):>10}")
+    return results
+
+def format_seconds(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+# Baseline file
+def machine():
+    """What the timings depend on besides the code"""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_baseline(path=BASELINE_FILE):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return {"baseline": {}, "history": []}
+
+def save_run(results, path=BASELINE_FILE):
+    """Append a run to the history and make it the baseline of its benchmarks"""
+    data = load_baseline(path)
+    recorded = {
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": current_commit(),
+        "machine": machine(),
+    }
+    data["history"].append({**recorded, "results": {name: timing.best for name, timing in results.items()}})
+    data["history"] = data["history"][-HISTORY_LIMIT:]
+    for name, timing in results.items():
+        data["baseline"][name] = {"seconds": timing.best, **recorded}
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as handle:
+        json.dump(data, handle, indent=2, sort_keys=True)
+    os.replace(temporary, path)
+
+Comparison = namedtuple("Comparison", ["name", "before", "now", "change", "status"])
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """One Comparison per result; status is new, ok, faster or regression"""
+    comparisons = []
+    for name, timing in results.items():
+        entry = baseline.get("baseline", {}).get(name)
+        if entry is None:
+            comparisons.append(Comparison(name, None, timing.best, None, "new"))
+            continue
+        change = (timing.best - entry["seconds"]) / entry["seconds"]
+        if change > threshold:
+            status = "regression"
+        elif change < -threshold:
+            status = "faster"
+        else:
+            status = "ok"
+        comparisons.append(Comparison(name, entry["seconds"], timing.best, change, status))
+    return comparisons
+
+def other_machine(results, baseline):
+    """Whether any of these benchmarks has a baseline recorded elsewhere"""
+    here = machine()
+    return any(
+        baseline.get("baseline", {}).get(name, {}).get("machine", here) != here
+        for name in results
+    )
+
+def format_comparison(comparisons):
+    lines = [f"{'Benchmark':<45} {'baseline':>10} {'now':>10} {'change':>8}  status"]
+    for row in comparisons:
+        before = format_seconds(row.before) if row.before is not None else "-"
+        change = f"{row.change * 100:+.0f}%" if row.change is not None else "-"
+        lines.append(f"{row.name:<45} {before:>10} {format_seconds(row.now):>10} {change:>8}  {row.status}")
+    return "\n".join(lines)
+
+# Framework-neutral benchmarks
+@benchmark("service.calculate_total_days")
+def _total_days():
+    """Day counting for a dashboard's worth of mixed requests"""
+    from leave_service import calculate_total_days
+
+    start = date(2025, 3, 3)
+    requests = [
+        ("full_day", start, start + timedelta(days=index % 10), None, None) if index % 3 == 0 else
+        ("half_day", start, start, None, None) if index % 3 == 1 else
+        ("hours", start, start, time(9), time(13))
+        for index in range(PAGE_SIZE * 10)
+    ]
+    return lambda: [calculate_total_days(*request) for request in requests]
+
+@benchmark("service.request_errors")
+def _request_errors():
+    """Stateless request rules over valid and invalid requests"""
+    from leave_service import request_errors
+
+    today = date(2025, 3, 3)
+    leave_type = SimpleNamespace(requires_reason=True)
+    requests = [
+        (leave_type, today + timedelta(days=index % 5), today + timedelta(days=index % 7),
+         "hours" if index % 2 else "full_day", "" if index % 4 else "Family event",
+         time(9), time(9 + index % 10))
+        for index in range(PAGE_SIZE * 10)
+    ]
+    return lambda: [request_errors(*request, today=today) for request in requests]
+
+def _people(count):
+    return [
+        SimpleNamespace(
+            user=SimpleNamespace(first_name="Employee", last_name=str(index)),
+            employee_id=f"E{index:05d}", department=f"Department {index % 8}", position="Engineer",
+        )
+        for index in range(count)
+    ]
+
+@benchmark("dashboard.request_table")
+def _request_table():
+    """The employee dashboard's page of recent requests as a DataFrame"""
+    import pandas as pd
+    import dashboard_tables
+
+    leave_type = SimpleNamespace(name="PTO")
+    requests = [
+        SimpleNamespace(
+            id=index, created_at=datetime(2025, 1, 1, 9) + timedelta(days=index), leave_type=leave_type,
+            start_date=date(2025, 2, 1) + timedelta(days=index), end_date=date(2025, 2, 2) + timedelta(days=index),
+            total_days=Decimal("2"), status=("pending", "approved", "rejected")[index % 3],
+        )
+        for index in range(PAGE_SIZE)
+    ]
+    return lambda: dashboard_tables.request_table(pd, requests)
+
+@benchmark("dashboard.team_table")
+def _team_table():
+    """The supervisor dashboard's team overview as a DataFrame"""
+    import pandas as pd
+    import dashboard_tables
+
+    team = [
+        {"employee": person, "pending_requests": index % 3, "total_requests": index % 20}
+        for index, person in enumerate(_people(TEAM_SIZE))
+    ]
+    return lambda: dashboard_tables.team_table(pd, team)
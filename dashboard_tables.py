@@ -0,0 +1,36 @@
+"""
+Tables shown on the Streamlit dashboards.
+
+Kept apart from app.py (which configures the page on import) so the
+benchmarks can build them at realistic sizes. pandas is passed in because
+app.py imports it lazily per page.
+"""
+
+def request_table(pd, requests):
+    """An employee's requests, one row each"""
+    return pd.DataFrame([
+        {
+            "Date": req.created_at.strftime("%Y-%m-%d"),
+            "Leave Type": req.leave_type.name,
+            "Period": f"{req.start_date} to {req.end_date}",
+            "Days": float(req.total_days),
+            "Status": req.status.title(),
+            "ID": req.id
+        }
+        for req in requests
+    ])
+
+def team_table(pd, team):
+    """A supervisor's team overview from LeaveService.team_summary()"""
+    rows = []
+    for entry in team:
+        sub = entry["employee"]
+        rows.append({
+            "Name": f"{sub.user.first_name} {sub.user.last_name}",
+            "Employee ID": sub.employee_id,
+            "Department": sub.department,
+            "Position": sub.position,
+            "Pending Requests": entry["pending_requests"],
+            "Total Requests": entry["total_requests"]
+        })
+    return pd.DataFrame(rows)
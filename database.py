@@ -1,12 +1,23 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, ForeignKey, Date, Time, Text
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, ForeignKey, Date, Time, Text, Float, JSON, Index, UniqueConstraint, func, extract, case, insert, update
 from sqlalchemy.types import Numeric
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, Session
+from sqlalchemy.sql import Select
+from sqlalchemy.exc import IntegrityError
+from contextlib import contextmanager
 from datetime import datetime, date
 from decimal import Decimal
 import streamlit as st
+import contextvars
 import os
 
+import metrics
+import querywatch
+import slowlog
+
+# Allocation rules are shared with the Django app
+from leave_service.core import default_allocation
+
 # Database configuration - simplified for Streamlit Cloud
 def get_database_url():
     """Get database URL with fallback logic"""
@@ -31,11 +42,75 @@ def get_database_url():
         # Local development: Use SQLite
         return 'sqlite:///leave_management.db'
 
+def get_replica_url():
+    """Read replica URL (Streamlit secrets or environment), or None"""
+    try:
+        db_url = st.secrets.get("REPLICA_DATABASE_URL", None)
+        if db_url:
+            return db_url
+    except:
+        pass
+    return os.environ.get("REPLICA_DATABASE_URL") or None
+
 DATABASE_URL = get_database_url()
+REPLICA_DATABASE_URL = get_replica_url()
+# How long a user's reads stay on the primary after they change something
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 10))
 
-# Create engine
+# Create engines (the replica falls back to the primary)
 engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+replica_engine = create_engine(REPLICA_DATABASE_URL) if REPLICA_DATABASE_URL else engine
+
+# Query timings and pool usage for the Metrics page
+metrics.instrument_engine(engine, "primary")
+if replica_engine is not engine:
+    metrics.instrument_engine(replica_engine, "replica")
+
+# N+1 detection in development (LEAVE_QUERY_WATCH=log or raise)
+if querywatch.settings_from_env()[0]:
+    for watched_engine in {engine, replica_engine}:
+        querywatch.instrument_engine(watched_engine)
+
+class _ReadRouting:
+    def __init__(self):
+        self.wrote = False
+
+_read_routing = contextvars.ContextVar("read_routing", default=None)
+
+@contextmanager
+def replica_reads(enabled=True):
+    """
+    Send plain reads in the block (dashboards, reports) to the replica.
+    Pass enabled=False while the user is pinned to the primary after a write.
+    """
+    token = _read_routing.set(_ReadRouting() if enabled and replica_engine is not engine else None)
+    try:
+        yield
+    finally:
+        _read_routing.reset(token)
+
+def read_engine():
+    """Engine for a Core read: the replica inside replica_reads(), else the primary"""
+    routing = _read_routing.get()
+    return replica_engine if routing is not None and not routing.wrote else engine
+
+class RoutingSession(Session):
+    """
+    Writes, locking reads and sessions marked info["primary"] use the primary;
+    other reads inside replica_reads() use the replica until the block writes.
+    """
+    def get_bind(self, mapper=None, clause=None, **kw):
+        routing = _read_routing.get()
+        if routing is None:
+            return engine
+        if self._flushing or not isinstance(clause, Select) or clause._for_update_arg is not None:
+            routing.wrote = True
+            return engine
+        if routing.wrote or self.info.get("primary"):
+            return engine
+        return replica_engine
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 # Database Models
@@ -93,6 +168,10 @@ class LeaveType(Base):
 
 class LeaveBalance(Base):
     __tablename__ = "leave_balances"
+    __table_args__ = (
+        # Current-year balances of one employee
+        Index("ix_leave_balances_user_year", "user_id", "year"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("user_profiles.id"))
@@ -112,6 +191,11 @@ class LeaveBalance(Base):
 
 class LeaveRequest(Base):
     __tablename__ = "leave_requests"
+    __table_args__ = (
+        # Keyset pagination of request history and approval inboxes
+        Index("ix_leave_requests_employee_created", "employee_id", "created_at", "id"),
+        Index("ix_leave_requests_status_created", "status", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey("user_profiles.id"))
@@ -124,6 +208,8 @@ class LeaveRequest(Base):
     total_days = Column(Numeric(6, 2))
     reason = Column(Text)
     status = Column(String, default="pending")  # pending, approved, rejected, cancelled
+    # Requester's department when the request was made; keys the usage rollup
+    department = Column(String)
     
     # Approval fields
     approved_by_id = Column(Integer, ForeignKey("user_profiles.id"))
@@ -142,6 +228,108 @@ class LeaveRequest(Base):
     leave_type = relationship("LeaveType", back_populates="leave_requests")
     approved_by = relationship("UserProfile", foreign_keys=[approved_by_id])
 
+class LeaveHistory(Base):
+    """Audit trail of a request: created, approved, rejected, cancelled"""
+    __tablename__ = "leave_history"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    leave_request_id = Column(Integer, ForeignKey("leave_requests.id"), index=True)
+    action = Column(String)
+    performed_by_id = Column(Integer, ForeignKey("user_profiles.id"))
+    timestamp = Column(DateTime, default=datetime.utcnow)
+    comments = Column(Text, default="")
+    
+    leave_request = relationship("LeaveRequest")
+    performed_by = relationship("UserProfile")
+
+class LeaveUsageRollup(Base):
+    """Monthly leave usage per department, leave type and status.
+
+    Kept in step with leave_requests by record_usage_change() in the same
+    session commit as the status change; rebuild with rebuild_usage_rollup().
+    Requests are counted in the month they start, under the department
+    stored on the request when it was made.
+    """
+    __tablename__ = "leave_usage_rollups"
+    __table_args__ = (
+        UniqueConstraint("department", "leave_type_id", "year", "month", "status", name="uq_leave_usage_rollup_bucket"),
+        Index("ix_leave_usage_rollups_period", "year", "month", "status"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    department = Column(String)
+    leave_type_id = Column(Integer, ForeignKey("leave_types.id"))
+    year = Column(Integer)
+    month = Column(Integer)
+    status = Column(String)
+    total_days = Column(Numeric(10, 2), default=0)
+    request_count = Column(Integer, default=0)
+    
+    leave_type = relationship("LeaveType")
+
+class SlowQuery(Base):
+    """Statements over LEAVE_SLOW_QUERY_MS, aggregated per fingerprint (see slowlog.py)"""
+    __tablename__ = "slow_queries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    digest = Column(String(64), unique=True, nullable=False)
+    fingerprint = Column(Text, nullable=False)
+    sample_sql = Column(Text)
+    sample_params = Column(JSON)
+    call_site = Column(String(500))
+    database = Column(String(50))
+    plan = Column(Text)
+    count = Column(Integer, default=0)
+    total_ms = Column(Float, default=0)
+    max_ms = Column(Float, default=0)
+    first_seen = Column(DateTime)
+    last_seen = Column(DateTime)
+
+def store_slow_query(entry):
+    """Add a slow statement to its fingerprint's slow_queries row"""
+    table = SlowQuery.__table__
+    seen_at = entry.seen_at.replace(tzinfo=None)  # naive UTC, like the other tables
+    fields = {
+        "sample_sql": entry.sql,
+        "sample_params": entry.params,
+        "call_site": entry.call_site[:500],
+        "database": entry.database,
+        "last_seen": seen_at,
+    }
+    if entry.plan is not None:
+        fields["plan"] = entry.plan
+    # Always on the primary, in transactions of its own
+    for _ in range(2):
+        with engine.begin() as conn:
+            updated = conn.execute(
+                update(table).where(table.c.digest == entry.digest).values(
+                    count=table.c.count + 1,
+                    total_ms=table.c.total_ms + entry.ms,
+                    max_ms=case((table.c.max_ms < entry.ms, entry.ms), else_=table.c.max_ms),
+                    **fields
+                )
+            ).rowcount
+        if updated:
+            return
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(table).values(
+                    digest=entry.digest, fingerprint=entry.fingerprint, count=1,
+                    total_ms=entry.ms, max_ms=entry.ms, first_seen=seen_at, **fields
+                ))
+            return
+        except IntegrityError:
+            # Another process created the row first; add to it instead
+            continue
+
+# Slow-query log with EXPLAIN capture (LEAVE_SLOW_QUERY_MS, 0 = off)
+SLOW_QUERY_MS, SLOW_QUERY_ANALYZE = slowlog.settings_from_env()
+slow_query_recorder = slowlog.Recorder(store_slow_query, threshold_ms=SLOW_QUERY_MS, analyze=SLOW_QUERY_ANALYZE)
+if SLOW_QUERY_MS:
+    slowlog.instrument_engine(engine, "primary", slow_query_recorder)
+    if replica_engine is not engine:
+        slowlog.instrument_engine(replica_engine, "replica", slow_query_recorder)
+
 # Database functions
 def get_db():
     db = SessionLocal()
@@ -151,8 +339,184 @@ def get_db():
         db.close()
 
 def init_database():
-    """Initialize database and create tables"""
-    Base.metadata.create_all(bind=engine)
+    """Initialize database: apply pending schema migrations (see schema_migrations.py)"""
+    from schema_migrations import migrate
+    return migrate(log=lambda message: None)
+
+def _adjust_usage(db, department, leave_type_id, start_date, status, days, count):
+    """Add days/count to a rollup bucket, creating it if needed"""
+    bucket = (
+        LeaveUsageRollup.department == department,
+        LeaveUsageRollup.leave_type_id == leave_type_id,
+        LeaveUsageRollup.year == start_date.year,
+        LeaveUsageRollup.month == start_date.month,
+        LeaveUsageRollup.status == status
+    )
+    increment = update(LeaveUsageRollup).where(*bucket).values(
+        total_days=LeaveUsageRollup.total_days + days,
+        request_count=LeaveUsageRollup.request_count + count
+    ).execution_options(synchronize_session=False)
+    if db.execute(increment).rowcount:
+        return
+    
+    try:
+        # Savepoint so a concurrent insert doesn't break the outer transaction
+        with db.begin_nested():
+            db.add(LeaveUsageRollup(
+                department=department,
+                leave_type_id=leave_type_id,
+                year=start_date.year,
+                month=start_date.month,
+                status=status,
+                total_days=days,
+                request_count=count
+            ))
+    except IntegrityError:
+        db.execute(increment)
+
+def record_usage_change(db, leave_request, old_status, new_status):
+    """Move a request between usage rollup buckets (old_status=None for new requests).
+
+    Does not commit; call it before committing the status change itself.
+    """
+    if old_status == new_status:
+        return
+    
+    department = leave_request.department
+    if department is None:
+        department = db.query(UserProfile.department).filter(
+            UserProfile.id == leave_request.employee_id
+        ).scalar()
+    days = Decimal(str(leave_request.total_days))
+    
+    if old_status:
+        _adjust_usage(db, department, leave_request.leave_type_id, leave_request.start_date, old_status, -days, -1)
+    if new_status:
+        _adjust_usage(db, department, leave_request.leave_type_id, leave_request.start_date, new_status, days, 1)
+
+def rebuild_usage_rollup(db):
+    """Recompute leave_usage_rollups from leave_requests with one grouped query"""
+    year = extract("year", LeaveRequest.start_date)
+    month = extract("month", LeaveRequest.start_date)
+    rows = db.query(
+        LeaveRequest.department,
+        LeaveRequest.leave_type_id,
+        year,
+        month,
+        LeaveRequest.status,
+        func.sum(LeaveRequest.total_days),
+        func.count(LeaveRequest.id)
+    ).group_by(
+        LeaveRequest.department, LeaveRequest.leave_type_id, year, month, LeaveRequest.status
+    ).all()
+    
+    db.query(LeaveUsageRollup).delete()
+    db.add_all([
+        LeaveUsageRollup(
+            department=department,
+            leave_type_id=leave_type_id,
+            year=int(row_year),
+            month=int(row_month),
+            status=status,
+            total_days=total_days,
+            request_count=request_count
+        )
+        for department, leave_type_id, row_year, row_month, status, total_days, request_count in rows
+    ])
+    db.commit()
+    return len(rows)
+
+def get_monthly_usage(db, year, month, departments=None, status="approved"):
+    """Total leave days for a month, read from the usage rollup"""
+    query = db.query(func.coalesce(func.sum(LeaveUsageRollup.total_days), 0)).filter(
+        LeaveUsageRollup.year == year,
+        LeaveUsageRollup.month == month,
+        LeaveUsageRollup.status == status
+    )
+    if departments is not None:
+        query = query.filter(LeaveUsageRollup.department.in_(list(departments)))
+    return query.scalar()
+
+def reconcile_balances(db, year=None, fix=False):
+    """Compare leave_balances.used_days with approved requests.
+
+    Expected usage per (employee, leave type, year) comes from one grouped
+    query over approved requests, by the year they were approved in (as
+    approval charges them; the start year for requests approved before
+    approved_date was recorded). Returns a list of drift
+    dicts; with fix=True the drifting balances are corrected (missing ones
+    created) in one bulk UPDATE and INSERT and committed.
+    """
+    request_year = func.coalesce(
+        extract("year", LeaveRequest.approved_date), extract("year", LeaveRequest.start_date)
+    )
+    expected_query = db.query(
+        LeaveRequest.employee_id,
+        LeaveRequest.leave_type_id,
+        request_year,
+        func.sum(LeaveRequest.total_days)
+    ).filter(LeaveRequest.status == "approved").group_by(
+        LeaveRequest.employee_id, LeaveRequest.leave_type_id, request_year
+    )
+    balance_query = db.query(
+        LeaveBalance.id, LeaveBalance.user_id, LeaveBalance.leave_type_id, LeaveBalance.year, LeaveBalance.used_days
+    )
+    if year:
+        expected_query = expected_query.filter(request_year == year)
+        balance_query = balance_query.filter(LeaveBalance.year == year)
+    
+    expected = {
+        (user_id, leave_type_id, int(row_year)): Decimal(str(days or 0))
+        for user_id, leave_type_id, row_year, days in expected_query
+    }
+    stored = {
+        (user_id, leave_type_id, balance_year): (balance_id, Decimal(str(used_days or 0)))
+        for balance_id, user_id, leave_type_id, balance_year, used_days in balance_query
+    }
+    
+    drifts = []
+    for key in expected.keys() | stored.keys():
+        balance_id, used_days = stored.get(key, (None, None))
+        expected_days = expected.get(key, Decimal("0"))
+        if used_days is None or used_days != expected_days:
+            user_id, leave_type_id, drift_year = key
+            drifts.append({
+                "balance_id": balance_id,
+                "user_id": user_id,
+                "leave_type_id": leave_type_id,
+                "year": drift_year,
+                "stored": used_days,
+                "expected": expected_days,
+            })
+    
+    if fix and drifts:
+        updates = [
+            {"id": drift["balance_id"], "used_days": drift["expected"]}
+            for drift in drifts if drift["balance_id"] is not None
+        ]
+        if updates:
+            db.bulk_update_mappings(LeaveBalance, updates)
+        
+        missing = [drift for drift in drifts if drift["balance_id"] is None]
+        if missing:
+            profiles = dict(db.query(UserProfile.id, UserProfile.is_senior).filter(
+                UserProfile.id.in_({drift["user_id"] for drift in missing})
+            ))
+            type_names = dict(db.query(LeaveType.id, LeaveType.name))
+            db.bulk_insert_mappings(LeaveBalance, [
+                {
+                    "user_id": drift["user_id"],
+                    "leave_type_id": drift["leave_type_id"],
+                    "year": drift["year"],
+                    "allocated_days": default_allocation(type_names.get(drift["leave_type_id"]), profiles.get(drift["user_id"], False)),
+                    "used_days": drift["expected"],
+                    "carry_over_days": 0,
+                }
+                for drift in missing
+            ])
+        db.commit()
+    
+    return drifts
 
 @st.cache_resource
 def get_database_connection():
@@ -234,25 +598,10 @@ def create_initial_data():
         # Create leave balances
         leave_types_db = db.query(LeaveType).all()
         for lt in leave_types_db:
-            if lt.name == "PTO":
-                allocated = 30 if profile_data.get("is_senior", False) else 21
-            elif lt.name == "PPTO":
-                allocated = 21
-            elif lt.name == "Paternal":
-                allocated = 21
-            elif lt.name == "Maternal":
-                allocated = 90
-            elif lt.name == "Bereavement":
-                allocated = 3
-            elif lt.name == "Sick":
-                allocated = 19
-            else:
-                allocated = 0
-            
             balance = LeaveBalance(
                 user_id=profile.id,
                 leave_type_id=lt.id,
-                allocated_days=allocated,
+                allocated_days=default_allocation(lt.name, profile_data.get("is_senior", False)),
                 used_days=0,
                 carry_over_days=0,
                 year=datetime.now().year
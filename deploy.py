@@ -65,6 +65,127 @@ def test_local_connection():
         print(f"❌ Local connection test FAILED: {e}")
         return False
 
+def migrate_database():
+    """Apply pending schema migrations (run once per deploy, not on app start)"""
+    print("🗄️ Migrating database schema...")
+    
+    try:
+        from schema_migrations import migrate, current_version, LATEST_VERSION
+        print(f"   Current version: {current_version() or 'unversioned'}, latest: {LATEST_VERSION}")
+        
+        applied = migrate(log=lambda message: print(f"✅ {message}"))
+        if not applied:
+            print("✅ Schema already up to date")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Schema migration FAILED: {e}")
+        return False
+
+def rebuild_usage_rollup():
+    """Rebuild the monthly leave usage rollup from leave requests"""
+    print("🔄 Rebuilding usage rollup...")
+    
+    try:
+        from database import init_database, SessionLocal, rebuild_usage_rollup as rebuild
+        init_database()
+        
+        db = SessionLocal()
+        try:
+            count = rebuild(db)
+        finally:
+            db.close()
+        
+        print(f"✅ Usage rollup rebuilt: {count} rows written")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Usage rollup rebuild FAILED: {e}")
+        return False
+
+def reconcile_balances(year, fix):
+    """Report (and optionally fix) leave balances that drift from approved requests"""
+    scope = f"year {year}" if year else "all years"
+    print(f"🔍 Reconciling leave balances for {scope}...")
+    
+    try:
+        from database import init_database, SessionLocal, reconcile_balances as reconcile
+        init_database()
+        
+        db = SessionLocal()
+        try:
+            drifts = reconcile(db, year=year, fix=fix)
+        finally:
+            db.close()
+        
+        if not drifts:
+            print("✅ All balances match approved requests")
+            return True
+        
+        for drift in sorted(drifts, key=lambda d: (d["user_id"], d["year"], d["leave_type_id"])):
+            stored = "missing" if drift["stored"] is None else drift["stored"]
+            print(f"   employee {drift['user_id']}, leave type {drift['leave_type_id']}, {drift['year']}: "
+                  f"stored {stored}, expected {drift['expected']}")
+        print(f"⚠️  {len(drifts)} balances drift from approved requests")
+        if fix:
+            print(f"✅ Fixed {len(drifts)} balances")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Balance reconciliation FAILED: {e}")
+        return False
+
+def export_snapshots(output_dir, fmt, full):
+    """Export columnar analytics snapshots of the leave tables"""
+    print(f"📦 Exporting {fmt} snapshots to {output_dir}...")
+    
+    try:
+        from snapshots import export_snapshots as export
+        written = export(output_dir, fmt=fmt, full=full)
+        
+        for table_name, rows in written.items():
+            print(f"✅ {table_name}: {rows} rows")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Snapshot export FAILED: {e}")
+        return False
+
+def sync_sqlite_replica():
+    """Copy the primary SQLite database to the replica file (local replica testing)"""
+    print("🔁 Syncing SQLite replica...")
+    
+    try:
+        import sqlite3
+        from database import engine, replica_engine
+        
+        if replica_engine is engine:
+            print("❌ No replica configured: set REPLICA_DATABASE_URL")
+            return False
+        if engine.dialect.name != "sqlite" or replica_engine.dialect.name != "sqlite":
+            print("❌ Both databases must be SQLite; real replicas are kept in sync by the database server")
+            return False
+        
+        if not os.path.exists(engine.url.database):
+            print(f"❌ Primary database {engine.url.database} does not exist")
+            return False
+        
+        replica_engine.dispose()
+        source = sqlite3.connect(engine.url.database)
+        target = sqlite3.connect(replica_engine.url.database)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        
+        print(f"✅ Replica {replica_engine.url.database} synced from {engine.url.database}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Replica sync FAILED: {e}")
+        return False
+
 def setup_github():
     """Guide user through GitHub setup"""
     print("📋 GitHub Setup Guide:")
@@ -119,8 +240,14 @@ def run_local():
 def main():
     parser = argparse.ArgumentParser(description="Leave Management System Deployment Helper")
     parser.add_argument("action", choices=[
-        "test-supabase", "test-local", "setup-github", "deploy-streamlit", "run-local"
+        "test-supabase", "test-local", "setup-github", "deploy-streamlit", "run-local",
+        "rebuild-usage-rollup", "export-snapshots", "reconcile-balances", "migrate", "sync-replica"
     ], help="Action to perform")
+    parser.add_argument("--output", default=None, help="Snapshot directory (export-snapshots)")
+    parser.add_argument("--format", default="arrow", choices=["arrow", "parquet"], help="Snapshot file format (export-snapshots)")
+    parser.add_argument("--full", action="store_true", help="Re-export everything instead of only changes (export-snapshots)")
+    parser.add_argument("--year", type=int, default=None, help="Only reconcile this year (reconcile-balances)")
+    parser.add_argument("--fix", action="store_true", help="Correct drifting balances (reconcile-balances)")
     
     args = parser.parse_args()
     
@@ -137,6 +264,19 @@ def main():
         deploy_streamlit()
     elif args.action == "run-local":
         run_local()
+    elif args.action == "rebuild-usage-rollup":
+        rebuild_usage_rollup()
+    elif args.action == "export-snapshots":
+        from snapshots import DEFAULT_SNAPSHOT_DIR
+        export_snapshots(args.output or DEFAULT_SNAPSHOT_DIR, args.format, args.full)
+    elif args.action == "reconcile-balances":
+        reconcile_balances(args.year, args.fix)
+    elif args.action == "migrate":
+        if not migrate_database():
+            sys.exit(1)
+    elif args.action == "sync-replica":
+        if not sync_sqlite_replica():
+            sys.exit(1)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,12 @@
+"""
+Framework-neutral leave service shared by the Django and Streamlit apps.
+
+Import the adapter for your ORM to get the process-wide service:
+
+    from leave_service.django_store import service        # Django
+    from leave_service.sqlalchemy_store import service    # Streamlit
+"""
+from .core import (
+    LeaveService, ServiceError, NotAllowed, RequestInfo,
+    default_allocation, calculate_total_days, request_errors, month_range,
+)
@@ -0,0 +1,279 @@
+"""
+Leave business rules and data access shared by both frontends.
+
+The Django app (leaves) and the Streamlit app (database.py) keep their own
+models and table names; everything else lives here once: default
+allocations, day counting, request validation, creation, approval,
+cancellation, team summaries and usage reporting. Data access goes through a store adapter
+(leave_service.django_store, leave_service.sqlalchemy_store) that answers a
+small set of set-based queries: a team summary is always three queries
+(members, grouped request counts, every member's balances) whatever the
+team size, and reference data is cached per process. Both adapters write
+the same rows for an operation (the request, its rollup bucket and a history
+entry) and return query results in the same order.
+
+Objects returned by the service (requests, balances, employees) are the
+adapter's own model instances, so each frontend renders them as before.
+"""
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+import threading
+import time
+
+import metrics
+
+HOURS_PER_DAY = 8
+REFERENCE_TTL = 300
+
+DEFAULT_ALLOCATIONS = {
+    'PTO': Decimal('21'),
+    'PPTO': Decimal('21'),
+    'Paternal': Decimal('21'),
+    'Maternal': Decimal('90'),
+    'Bereavement': Decimal('3'),
+    'Sick': Decimal('19'),  # 12 + 7
+}
+SENIOR_ALLOCATIONS = {
+    'PTO': Decimal('30'),
+}
+
+# Statuses set by the supervisor; they record the reviewer and their comments
+REVIEW_STATUSES = ('approved', 'rejected')
+
+# What a store's lock_request() returns: enough to authorize and apply a review
+RequestInfo = namedtuple('RequestInfo', [
+    'id', 'employee_id', 'supervisor_id', 'is_senior', 'leave_type_id', 'leave_type_name',
+    'status', 'total_days', 'obj',
+])
+
+class ServiceError(Exception):
+    """A request the leave rules refuse; messages are shown to the user"""
+
+    def __init__(self, messages):
+        if isinstance(messages, str):
+            messages = [messages]
+        self.messages = list(messages)
+        super().__init__(' '.join(self.messages))
+
+class NotAllowed(ServiceError):
+    """The acting employee may not perform this action"""
+
+def default_allocation(leave_type_name, is_senior=False):
+    """Default yearly allocation in days for a leave type"""
+    if is_senior and leave_type_name in SENIOR_ALLOCATIONS:
+        return SENIOR_ALLOCATIONS[leave_type_name]
+    return DEFAULT_ALLOCATIONS.get(leave_type_name, Decimal('0'))
+
+def calculate_total_days(duration_type, start_date, end_date, start_time=None, end_time=None):
+    """Days a request counts against its balance"""
+    if duration_type == 'full_day':
+        return Decimal((end_date - start_date).days + 1)
+    if duration_type == 'half_day':
+        return Decimal('0.5')
+    if start_time and end_time:
+        hours = (datetime.combine(start_date, end_time) - datetime.combine(start_date, start_time)).seconds / 3600
+        return Decimal(str(hours / HOURS_PER_DAY))
+    return Decimal('0')
+
+def month_range(year, month):
+    """First day of a month and of the month after it"""
+    if month == 12:
+        return date(year, 12, 1), date(year + 1, 1, 1)
+    return date(year, month, 1), date(year, month + 1, 1)
+
+def request_errors(leave_type, start_date, end_date, duration_type='full_day', reason='',
+                   start_time=None, end_time=None, today=None):
+    """Rule violations of a new request that need no data access (list of messages)"""
+    today = today or date.today()
+    errors = []
+    if start_date > end_date:
+        errors.append('End date cannot be before start date.')
+    elif start_date < today:
+        errors.append('Leave cannot be scheduled for past dates.')
+
+    if duration_type == 'hours' and start_time and end_time:
+        if start_time >= end_time:
+            errors.append('End time must be after start time.')
+        else:
+            hours = (datetime.combine(start_date, end_time) - datetime.combine(start_date, start_time)).seconds / 3600
+            if hours < 0.5:
+                errors.append('Minimum leave duration is 30 minutes.')
+            if hours > HOURS_PER_DAY:
+                errors.append(f'Maximum leave duration is {HOURS_PER_DAY} hours per day.')
+
+    if leave_type.requires_reason and not reason:
+        errors.append('Reason is required for this type of leave.')
+    return errors
+
+class _TTLCache:
+    """Tiny per-process cache for reference data"""
+
+    def __init__(self, ttl, name='leave_service_reference'):
+        self.ttl = ttl
+        self.name = name
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._values.get(key)
+            if hit and hit[0] > now:
+                metrics.record_cache(self.name, True)
+                return hit[1]
+        metrics.record_cache(self.name, False)
+        value = load()
+        with self._lock:
+            self._values[key] = (now + self.ttl, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+class LeaveService:
+    """Leave operations over one store adapter"""
+
+    def __init__(self, store, reference_ttl=REFERENCE_TTL):
+        self.store = store
+        self._reference = _TTLCache(reference_ttl)
+
+    # Reference data
+    def leave_types(self):
+        """Active leave types, cached"""
+        return self._reference.get('leave_types', self.store.leave_types)
+
+    def leave_type(self, leave_type_id):
+        for leave_type in self.leave_types():
+            if leave_type.id == leave_type_id:
+                return leave_type
+        raise ServiceError('This leave type is not available.')
+
+    def invalidate_reference(self):
+        self._reference.clear()
+
+    # Balances
+    def balances(self, employee_id, year=None):
+        """An employee's balances for a year (default: current), one query"""
+        return [balance for owner, balance in self.store.balances([employee_id], year or self.store.today().year)]
+
+    def available_days(self, employee_id, leave_type_id, year=None):
+        """Days left on one balance, or None when the employee has no such balance"""
+        matches = self.store.balances([employee_id], year or self.store.today().year, leave_type_id=leave_type_id)
+        return matches[0][1].available_days if matches else None
+
+    # Requests
+    def check_request(self, employee_id, leave_type, start_date, end_date, duration_type='full_day',
+                      reason='', start_time=None, end_time=None):
+        """
+        Validate a new request; returns its total days or raises ServiceError.
+        leave_type is an id or an already loaded leave type.
+        """
+        if not hasattr(leave_type, 'requires_reason'):
+            leave_type = self.leave_type(leave_type)
+        errors = request_errors(
+            leave_type, start_date, end_date, duration_type, reason, start_time, end_time, today=self.store.today()
+        )
+        if errors:
+            raise ServiceError(errors)
+
+        total_days = calculate_total_days(duration_type, start_date, end_date, start_time, end_time)
+        if employee_id is not None:
+            available = self.available_days(employee_id, leave_type.id)
+            # No balance yet: one is created with the default allocation on approval
+            if available is not None and available < total_days:
+                raise ServiceError(
+                    f'Insufficient leave balance. Available: {available} days, Requested: {total_days} days'
+                )
+        return total_days
+
+    def insert_request(self, employee_id, leave_type_id, total_days, **fields):
+        """Store an already validated request as pending (with rollup and history)"""
+        with self.store.atomic():
+            return self.store.insert_request(employee_id, leave_type_id, total_days, fields)
+
+    def create_request(self, employee_id, leave_type_id, start_date, end_date, duration_type='full_day',
+                       reason='', start_time=None, end_time=None, **fields):
+        """Validate and store a new request; raises ServiceError"""
+        total_days = self.check_request(
+            employee_id, leave_type_id, start_date, end_date, duration_type, reason, start_time, end_time
+        )
+        return self.insert_request(
+            employee_id, leave_type_id, total_days,
+            start_date=start_date, end_date=end_date, duration_type=duration_type,
+            reason=reason, start_time=start_time, end_time=end_time, **fields
+        )
+
+    def _review(self, request_id, reviewer_id, status, comments):
+        with self.store.atomic():
+            info = self.store.lock_request(request_id)
+            if info is None:
+                raise ServiceError('Leave request not found.')
+            verb = 'approve' if status == 'approved' else 'reject'
+            if info.supervisor_id != reviewer_id:
+                raise NotAllowed(f'You cannot {verb} this request.')
+            if info.status != 'pending':
+                raise ServiceError(f'Only pending requests can be {status}; this one is {info.status}.')
+
+            self.store.set_status(info, status, reviewer_id, comments)
+            if status == 'approved':
+                self.store.add_used_days(
+                    info.employee_id, info.leave_type_id, self.store.today().year, Decimal(info.total_days),
+                    allocated_days=default_allocation(info.leave_type_name, info.is_senior)
+                )
+        return info.obj
+
+    def approve(self, request_id, reviewer_id, comments=''):
+        """Approve a pending request and charge it to this year's balance"""
+        return self._review(request_id, reviewer_id, 'approved', comments)
+
+    def reject(self, request_id, reviewer_id, comments=''):
+        return self._review(request_id, reviewer_id, 'rejected', comments)
+
+    def cancel(self, request_id, employee_id, comments='Request cancelled by employee'):
+        """Cancel one of the employee's own pending requests"""
+        with self.store.atomic():
+            info = self.store.lock_request(request_id)
+            if info is None:
+                raise ServiceError('Leave request not found.')
+            if info.employee_id != employee_id:
+                raise NotAllowed('You can only cancel your own requests.')
+            if info.status != 'pending':
+                raise ServiceError('You can only cancel pending requests.')
+            self.store.set_status(info, 'cancelled', employee_id, comments)
+        return info.obj
+
+    # Teams and reporting
+    def team_summary(self, supervisor_id, year=None):
+        """
+        One entry per active team member with their balances and request
+        counts, in three queries regardless of team size.
+        """
+        members = list(self.store.team_members(supervisor_id))
+        member_ids = [member.id for member in members]
+        counts = self.store.request_counts(member_ids)
+        balances = {}
+        for owner, balance in self.store.balances(member_ids, year or self.store.today().year):
+            balances.setdefault(owner, []).append(balance)
+
+        return [
+            {
+                'employee': member,
+                'balances': balances.get(member.id, []),
+                'pending_requests': counts.get(member.id, {}).get('pending', 0),
+                'total_requests': counts.get(member.id, {}).get('total', 0),
+            }
+            for member in members
+        ]
+
+    def monthly_usage(self, year, month, departments=None, status='approved'):
+        """{'total_days', 'request_count'} for a month, from the usage rollup"""
+        return self.store.monthly_usage(year, month, departments, status)
+
+    def team_monthly_usage(self, supervisor_id, year, month, status='approved'):
+        """
+        {'total_days', 'request_count'} of requests starting in a month by a
+        supervisor's active team, in one aggregate (the rollup is per department)
+        """
+        return self.store.team_usage(supervisor_id, *month_range(year, month), status)
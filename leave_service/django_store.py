@@ -0,0 +1,139 @@
+"""
+LeaveService store adapter over the Django leaves models.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from decimal import Decimal
+
+from leaves.models import LeaveBalance, LeaveHistory, LeaveRequest, LeaveType, UserProfile
+from leaves import rollups
+
+from .core import REVIEW_STATUSES, LeaveService, RequestInfo
+
+class DjangoStore:
+    def atomic(self):
+        return transaction.atomic()
+
+    def today(self):
+        return timezone.now().date()
+
+    def leave_types(self):
+        return list(LeaveType.objects.filter(is_active=True).order_by('name'))
+
+    def balances(self, employee_ids, year, leave_type_id=None):
+        """[(employee id, balance)], most used first, with usage annotations"""
+        balances = LeaveBalance.objects.filter(user_id__in=employee_ids, year=year)
+        if leave_type_id is not None:
+            balances = balances.filter(leave_type_id=leave_type_id)
+        balances = balances.with_usage().select_related('leave_type').order_by('-used_percentage_db', 'leave_type__name')
+        return [(balance.user_id, balance) for balance in balances]
+
+    def lock_request(self, request_id):
+        leave_request = (
+            LeaveRequest.objects.select_related('user', 'leave_type')
+            .select_for_update(of=('self',))
+            .filter(pk=request_id)
+            .first()
+        )
+        if leave_request is None:
+            return None
+        return RequestInfo(
+            id=leave_request.pk,
+            employee_id=leave_request.user_id,
+            supervisor_id=leave_request.user.supervisor_id,
+            is_senior=leave_request.user.is_senior,
+            leave_type_id=leave_request.leave_type_id,
+            leave_type_name=leave_request.leave_type.name,
+            status=leave_request.status,
+            total_days=leave_request.total_days,
+            obj=leave_request,
+        )
+
+    def insert_request(self, employee_id, leave_type_id, total_days, fields):
+        leave_request = LeaveRequest.objects.create(
+            user_id=employee_id,
+            leave_type_id=leave_type_id,
+            total_days=total_days,
+            status='pending',
+            **fields
+        )
+        rollups.record_status_change(leave_request, None, 'pending')
+        LeaveHistory.objects.create(
+            leave_request=leave_request,
+            action='created',
+            performed_by_id=employee_id,
+            comments=f'Leave request created for {total_days} days'
+        )
+        return leave_request
+
+    def set_status(self, info, status, performed_by_id, comments=''):
+        leave_request = info.obj
+        leave_request.status = status
+        if status in REVIEW_STATUSES:
+            leave_request.approved_by_id = performed_by_id
+            leave_request.approved_date = timezone.now()
+            if comments:
+                leave_request.supervisor_comments = comments
+        leave_request.save()
+        rollups.record_status_change(leave_request, info.status, status)
+        LeaveHistory.objects.create(
+            leave_request=leave_request,
+            action=status,
+            performed_by_id=performed_by_id,
+            comments=comments
+        )
+
+    def add_used_days(self, employee_id, leave_type_id, year, days, allocated_days):
+        """Atomic increment, creating the balance with its default allocation if missing"""
+        balance = LeaveBalance.objects.filter(user_id=employee_id, leave_type_id=leave_type_id, year=year)
+        changes = {'used_days': F('used_days') + days, 'updated_at': timezone.now()}
+        if balance.update(**changes):
+            return
+        try:
+            # Savepoint so a concurrent insert doesn't break the outer transaction
+            with transaction.atomic():
+                LeaveBalance.objects.create(
+                    user_id=employee_id, leave_type_id=leave_type_id, year=year,
+                    allocated_days=allocated_days, used_days=days,
+                )
+        except IntegrityError:
+            balance.update(**changes)
+
+    def team_members(self, supervisor_id):
+        return (
+            UserProfile.objects.filter(supervisor_id=supervisor_id, is_active=True)
+            .select_related('user').order_by('employee_id')
+        )
+
+    def request_counts(self, employee_ids):
+        """{employee id: {'pending': n, 'total': n}} from one grouped query"""
+        rows = (
+            LeaveRequest.objects.filter(user_id__in=employee_ids)
+            .order_by()
+            .values('user_id')
+            .annotate(total=Count('id'), pending=Count('id', filter=Q(status='pending')))
+        )
+        return {row['user_id']: {'pending': row['pending'], 'total': row['total']} for row in rows}
+
+    def monthly_usage(self, year, month, departments=None, status='approved'):
+        return rollups.monthly_usage(year, month, departments=departments, status=status)
+
+    def team_usage(self, supervisor_id, start, end, status='approved'):
+        totals = LeaveRequest.objects.filter(
+            user__supervisor_id=supervisor_id,
+            user__is_active=True,
+            status=status,
+            start_date__gte=start,
+            start_date__lt=end,
+        ).aggregate(total_days=Sum('total_days'), request_count=Count('id'))
+        return {'total_days': totals['total_days'] or Decimal('0'), 'request_count': totals['request_count']}
+
+_service = None
+
+def service():
+    """The process-wide LeaveService for the Django app"""
+    global _service
+    if _service is None:
+        _service = LeaveService(DjangoStore())
+    return _service
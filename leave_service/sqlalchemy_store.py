@@ -0,0 +1,233 @@
+"""
+LeaveService store adapter over the SQLAlchemy models in database.py.
+
+Writes happen inside atomic(), which opens one session per unit of work
+(per thread, as Streamlit serves each browser session from its own thread)
+and commits it on success. Reads outside a unit of work use a short-lived
+session. Sessions keep loaded objects after commit so that the returned
+instances can be rendered after the session closes.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import Float, case, cast, func, update
+from sqlalchemy.orm import joinedload
+import threading
+
+from database import (
+    SessionLocal, LeaveBalance, LeaveHistory, LeaveRequest, LeaveType, LeaveUsageRollup, UserProfile,
+    record_usage_change
+)
+
+from .core import REVIEW_STATUSES, LeaveService, RequestInfo
+
+# Share of a balance used, as LeaveBalanceQuerySet.with_usage() computes it
+_BALANCE_TOTAL = LeaveBalance.allocated_days + LeaveBalance.carry_over_days
+USED_PERCENTAGE = case(
+    (_BALANCE_TOTAL > 0, cast(LeaveBalance.used_days, Float) * 100 / cast(_BALANCE_TOTAL, Float)),
+    else_=0.0
+)
+
+class SQLAlchemyStore:
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self._local = threading.local()
+
+    @contextmanager
+    def atomic(self):
+        if getattr(self._local, 'session', None) is not None:
+            # Nested unit of work: join the outer one
+            yield self._local.session
+            return
+        # Units of work read and write the primary, even under replica_reads()
+        db = self.session_factory(expire_on_commit=False, info={'primary': True})
+        self._local.session = db
+        try:
+            yield db
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            self._local.session = None
+            db.close()
+
+    @contextmanager
+    def _session(self):
+        db = getattr(self._local, 'session', None)
+        if db is not None:
+            yield db
+            return
+        db = self.session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def today(self):
+        return datetime.now().date()
+
+    def leave_types(self):
+        with self._session() as db:
+            return db.query(LeaveType).filter(LeaveType.is_active == True).order_by(LeaveType.name).all()
+
+    def balances(self, employee_ids, year, leave_type_id=None):
+        """[(employee id, balance)], most used first, with leave types loaded, from one query"""
+        if not employee_ids:
+            return []
+        with self._session() as db:
+            query = db.query(LeaveBalance).options(joinedload(LeaveBalance.leave_type)).join(
+                LeaveType, LeaveType.id == LeaveBalance.leave_type_id
+            ).filter(
+                LeaveBalance.user_id.in_(list(employee_ids)),
+                LeaveBalance.year == year
+            )
+            if leave_type_id is not None:
+                query = query.filter(LeaveBalance.leave_type_id == leave_type_id)
+            query = query.order_by(USED_PERCENTAGE.desc(), LeaveType.name)
+            return [(balance.user_id, balance) for balance in query.all()]
+
+    def lock_request(self, request_id):
+        with self._session() as db:
+            row = db.query(
+                LeaveRequest, UserProfile.supervisor_id, UserProfile.is_senior, LeaveType.name
+            ).join(
+                UserProfile, UserProfile.id == LeaveRequest.employee_id
+            ).join(
+                LeaveType, LeaveType.id == LeaveRequest.leave_type_id
+            ).filter(
+                LeaveRequest.id == request_id
+            ).with_for_update(of=LeaveRequest).first()
+        if row is None:
+            return None
+        leave_request, supervisor_id, is_senior, leave_type_name = row
+        return RequestInfo(
+            id=leave_request.id,
+            employee_id=leave_request.employee_id,
+            supervisor_id=supervisor_id,
+            is_senior=is_senior,
+            leave_type_id=leave_request.leave_type_id,
+            leave_type_name=leave_type_name,
+            status=leave_request.status,
+            total_days=leave_request.total_days,
+            obj=leave_request,
+        )
+
+    def insert_request(self, employee_id, leave_type_id, total_days, fields):
+        with self._session() as db:
+            leave_request = LeaveRequest(
+                employee_id=employee_id,
+                leave_type_id=leave_type_id,
+                total_days=total_days,
+                status='pending',
+                department=db.query(UserProfile.department).filter(UserProfile.id == employee_id).scalar(),
+                **fields
+            )
+            db.add(leave_request)
+            db.flush()
+            record_usage_change(db, leave_request, None, 'pending')
+            db.add(LeaveHistory(
+                leave_request_id=leave_request.id,
+                action='created',
+                performed_by_id=employee_id,
+                comments=f'Leave request created for {total_days} days'
+            ))
+            return leave_request
+
+    def set_status(self, info, status, performed_by_id, comments=''):
+        with self._session() as db:
+            leave_request = info.obj
+            record_usage_change(db, leave_request, info.status, status)
+            leave_request.status = status
+            if status in REVIEW_STATUSES:
+                leave_request.approved_by_id = performed_by_id
+                leave_request.approved_date = datetime.utcnow()
+                if comments:
+                    leave_request.supervisor_comments = comments
+            db.add(LeaveHistory(
+                leave_request_id=leave_request.id,
+                action=status,
+                performed_by_id=performed_by_id,
+                comments=comments
+            ))
+
+    def add_used_days(self, employee_id, leave_type_id, year, days, allocated_days):
+        """In-database increment, creating the balance with its default allocation if missing"""
+        with self._session() as db:
+            result = db.execute(
+                update(LeaveBalance).where(
+                    LeaveBalance.user_id == employee_id,
+                    LeaveBalance.leave_type_id == leave_type_id,
+                    LeaveBalance.year == year
+                ).values(used_days=LeaveBalance.used_days + days).execution_options(synchronize_session=False)
+            )
+            if result.rowcount:
+                return
+            db.add(LeaveBalance(
+                user_id=employee_id,
+                leave_type_id=leave_type_id,
+                allocated_days=allocated_days,
+                used_days=days,
+                carry_over_days=0,
+                year=year
+            ))
+
+    def team_members(self, supervisor_id):
+        with self._session() as db:
+            return db.query(UserProfile).options(joinedload(UserProfile.user)).filter(
+                UserProfile.supervisor_id == supervisor_id,
+                UserProfile.is_active == True
+            ).order_by(UserProfile.employee_id).all()
+
+    def request_counts(self, employee_ids):
+        """{employee id: {'pending': n, 'total': n}} from one grouped query"""
+        if not employee_ids:
+            return {}
+        with self._session() as db:
+            rows = db.query(
+                LeaveRequest.employee_id,
+                func.count(LeaveRequest.id),
+                func.sum(case((LeaveRequest.status == 'pending', 1), else_=0))
+            ).filter(
+                LeaveRequest.employee_id.in_(list(employee_ids))
+            ).group_by(LeaveRequest.employee_id).all()
+        return {employee_id: {'pending': int(pending or 0), 'total': total} for employee_id, total, pending in rows}
+
+    def monthly_usage(self, year, month, departments=None, status='approved'):
+        with self._session() as db:
+            query = db.query(
+                func.coalesce(func.sum(LeaveUsageRollup.total_days), 0),
+                func.coalesce(func.sum(LeaveUsageRollup.request_count), 0)
+            ).filter(
+                LeaveUsageRollup.year == year,
+                LeaveUsageRollup.month == month,
+                LeaveUsageRollup.status == status
+            )
+            if departments is not None:
+                query = query.filter(LeaveUsageRollup.department.in_(list(departments)))
+            total_days, request_count = query.one()
+        return {'total_days': total_days, 'request_count': request_count}
+
+    def team_usage(self, supervisor_id, start, end, status='approved'):
+        with self._session() as db:
+            total_days, request_count = db.query(
+                func.coalesce(func.sum(LeaveRequest.total_days), 0),
+                func.count(LeaveRequest.id)
+            ).join(
+                UserProfile, UserProfile.id == LeaveRequest.employee_id
+            ).filter(
+                UserProfile.supervisor_id == supervisor_id,
+                UserProfile.is_active == True,
+                LeaveRequest.status == status,
+                LeaveRequest.start_date >= start,
+                LeaveRequest.start_date < end
+            ).one()
+        return {'total_days': total_days, 'request_count': request_count}
+
+_service = None
+
+def service():
+    """The process-wide LeaveService for the Streamlit app"""
+    global _service
+    if _service is None:
+        _service = LeaveService(SQLAlchemyStore())
+    return _service
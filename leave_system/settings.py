@@ -56,11 +56,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'leaves.monitoring.MetricsMiddleware',
+    'leaves.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'leaves.request_profiling.ProfilingMiddleware',
+    'leaves.routing.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
@@ -103,6 +107,99 @@ DATABASES = {
     )
 }
 
+# Optional read replica. Dashboards, reports and exports read from it, and
+# a user's reads stick to the primary for REPLICA_PIN_SECONDS after they
+# change something (see leaves/routing.py). To try it locally, point it at a
+# second SQLite file and refresh it with `python manage.py sync_sqlite_replica`.
+REPLICA_DATABASE_URL = config('REPLICA_DATABASE_URL', default='', cast=str)
+
+if REPLICA_DATABASE_URL.startswith('postgres://'):
+    REPLICA_DATABASE_URL = REPLICA_DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+
+if REPLICA_DATABASE_URL:
+    DATABASES['replica'] = dj_database_url.parse(
+        REPLICA_DATABASE_URL,
+        conn_max_age=600,
+        conn_health_checks=True,
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['leaves.routing.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=10, cast=int)
+
+# Runtime metrics are served in Prometheus format at /metrics to staff
+# users, or to scrapers sending "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# N+1 detection and per-view query budgets (see leaves/query_budget.py):
+# 'log' in development and staging, 'raise' to make tests fail; off in
+# production. Budgets count every query of the request, including the
+# session and user lookups.
+QUERY_WATCH = config('QUERY_WATCH', default='log' if DEBUG else '')
+QUERY_REPEAT_THRESHOLD = config('QUERY_REPEAT_THRESHOLD', default=3, cast=int)
+QUERY_BUDGET_DEFAULT = config('QUERY_BUDGET_DEFAULT', default=30, cast=int)
+QUERY_BUDGETS = {
+    'leaves:employee_dashboard': 10,
+    'leaves:supervisor_dashboard': 12,
+    'leaves:leave_balance': 5,
+    'leaves:leave_request_detail': 8,
+    # Writes include the search index, rollup and calendar feed signals; the
+    # first request of a month in a rollup bucket inserts it under a savepoint
+    'leaves:create_leave_request': 24,
+    'leaves:approve_leave_request': 28,
+    'leaves:reject_leave_request': 28,
+    'leaves:cancel_leave_request': 28,
+    'leaves:api_balance_list': 7,
+    'leaves:api_request_list': 7,
+    'leaves:api_team_summary': 9,
+}
+
+# Slow-query log (see leaves/slow_queries.py): statements slower than
+# SLOW_QUERY_MS (0 = off) are explained and aggregated per fingerprint in
+# the admin. EXPLAIN ANALYZE runs the statement a second time.
+SLOW_QUERY_MS = config('SLOW_QUERY_MS', default=200, cast=int)
+SLOW_QUERY_EXPLAIN_ANALYZE = config('SLOW_QUERY_EXPLAIN_ANALYZE', default=False, cast=bool)
+
+# On-demand profiling (see leaves/request_profiling.py): staff send
+# "X-Profile: 1" (or "cprofile") or ?_profile=1 to profile one request.
+# The newest PROFILE_KEEP profiles are kept in PROFILE_DIR.
+PROFILE_DIR = config('PROFILE_DIR', default=str(BASE_DIR / 'profiles'))
+PROFILE_KEEP = config('PROFILE_KEEP', default=50, cast=int)
+PROFILE_SAMPLE_INTERVAL = config('PROFILE_SAMPLE_INTERVAL', default=0.005, cast=float)
+
+# Worker threads the async dashboards use to run independent queries at
+# once (see leaves/parallel.py); each keeps its own database connection.
+# 0 runs the queries one after another on the request's own connection:
+# the default on SQLite, which serialises writers anyway, and what the tests
+# use so the views see the data of the test's open transaction
+CONCURRENT_QUERY_THREADS = config(
+    'CONCURRENT_QUERY_THREADS',
+    default=0 if DATABASES['default']['ENGINE'].endswith('sqlite3') else 4,
+    cast=int
+)
+
+
+# Cache
+# Calendar feeds and other rendered data are cached here. Use Redis in
+# production so all workers share one cache (and one invalidation).
+
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'leave-management',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -191,5 +288,16 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Supporting documents are streamed to disk and hashed in chunks by the
+# leave request view (see leaves/uploads.py); other uploads use Django's
+# default handlers. Point FILE_UPLOAD_TEMP_DIR at an existing directory on the
+# same filesystem as MEDIA_ROOT so that storing a document is a rename
+FILE_UPLOAD_TEMP_DIR = config('FILE_UPLOAD_TEMP_DIR', default=None)
+DOCUMENT_MAX_UPLOAD_SIZE = config('DOCUMENT_MAX_UPLOAD_SIZE', default=10 * 1024 * 1024, cast=int)
+DOCUMENT_PREVIEW_SIZE = config('DOCUMENT_PREVIEW_SIZE', default=400, cast=int)
+
+# Closed years of leave history are archived here (see leaves/history.py)
+LEAVE_HISTORY_ARCHIVE_DIR = config('LEAVE_HISTORY_ARCHIVE_DIR', default=str(BASE_DIR / 'archive'))
+
 # Email configuration (for development)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
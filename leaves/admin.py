@@ -1,15 +1,26 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.template.response import TemplateResponse
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import Q
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import format_html
-from django.urls import reverse
+from django.urls import reverse, path
+from django.shortcuts import redirect
 from django.utils.safestring import mark_safe
 from import_export.admin import ImportExportModelAdmin
 from import_export import resources
 from .models import (
     UserProfile, LeaveType, LeaveBalance, 
-    LeaveRequest, LeaveHistory, CompanySettings
+    LeaveRequest, LeaveHistory, LeaveHistoryArchive, LeaveUsageRollup, LeavePayTier, CompanySettings,
+    StoredDocument, SlowQuery
 )
+from . import rollups, search, reference, bulk, reconciliation, documents
+from .uploads import document_storage
+from .forms import BalanceAdjustmentForm, CarryOverForm
+from .pagination import EstimatedCountPaginator
 
 # Inline admin for UserProfile
 class UserProfileInline(admin.StackedInline):
@@ -73,24 +84,138 @@ class UserProfileAdmin(ImportExportModelAdmin):
         }),
     )
     
+    actions = ['recompute_leave_balances']
+    
     def get_full_name(self, obj):
         return obj.user.get_full_name() or obj.user.username
     get_full_name.short_description = 'Full Name'
     
+    def recompute_leave_balances(self, request, queryset):
+        count = bulk.recompute_balances(queryset.values('pk'))
+        self.message_user(request, f'Recomputed {count} leave balances from approved requests.', messages.SUCCESS)
+    recompute_leave_balances.short_description = 'Recompute leave balances from approved requests'
+    
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user', 'supervisor__user')
 
+class LeavePayTierInline(admin.TabularInline):
+    model = LeavePayTier
+    extra = 0
+    fields = ('from_day', 'to_day', 'pay_percentage')
+
 @admin.register(LeaveType)
 class LeaveTypeAdmin(admin.ModelAdmin):
+    inlines = (LeavePayTierInline,)
     list_display = ('name', 'requires_approval', 'requires_documentation', 'requires_reason', 'pay_percentage', 'is_active')
     list_filter = ('requires_approval', 'requires_documentation', 'requires_reason', 'is_active')
     search_fields = ('name',)
     ordering = ('name',)
 
+# List filters whose choices come from cached reference data (leaves.reference)
+# instead of DISTINCT scans over the filtered table
+class DepartmentFilter(admin.SimpleListFilter):
+    title = 'department'
+    parameter_name = 'department'
+    field_path = 'user__department'
+    
+    def lookups(self, request, model_admin):
+        return [(department, department) for department in reference.departments()]
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.field_path: self.value()})
+        return queryset
+
+class HistoryDepartmentFilter(DepartmentFilter):
+    field_path = 'leave_request__user__department'
+
+class LeaveTypeFilter(admin.SimpleListFilter):
+    title = 'leave type'
+    parameter_name = 'leave_type'
+    field_path = 'leave_type_id'
+    
+    def lookups(self, request, model_admin):
+        return [(str(type_id), name) for type_id, name in reference.leave_types()]
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.field_path: self.value()})
+        return queryset
+
+class HistoryLeaveTypeFilter(LeaveTypeFilter):
+    field_path = 'leave_request__leave_type_id'
+
+class HistoryActionFilter(admin.SimpleListFilter):
+    title = 'action'
+    parameter_name = 'action'
+    
+    def lookups(self, request, model_admin):
+        return [('created', 'Created'), ('approved', 'Approved'), ('rejected', 'Rejected'), ('cancelled', 'Cancelled')]
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(action=self.value())
+        return queryset
+
+class YearFilter(admin.SimpleListFilter):
+    """Replaces date_hierarchy, which scans the table for DISTINCT years"""
+    title = 'year'
+    parameter_name = 'year'
+    field_name = None
+    
+    def lookups(self, request, model_admin):
+        return [(str(year), str(year)) for year in reference.years(model_admin.model, self.field_name)]
+    
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            return queryset.filter(**{f'{self.field_name}__year': int(self.value())})
+        return queryset
+
+class StartYearFilter(YearFilter):
+    title = 'start year'
+    field_name = 'start_date'
+
+class TimestampYearFilter(YearFilter):
+    field_name = 'timestamp'
+
+class YearColumnFilter(YearFilter):
+    """For tables that store the year as an integer column"""
+    field_name = 'year'
+    
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            return queryset.filter(year=int(self.value()))
+        return queryset
+
+class RollupDepartmentFilter(DepartmentFilter):
+    field_path = 'department'
+
+class UsagePercentageFilter(admin.SimpleListFilter):
+    """Filter balances by how much of the allowance is used, in the database"""
+    title = 'usage'
+    parameter_name = 'usage'
+    
+    # Same thresholds as the colours in used_percentage_display
+    BUCKETS = {
+        'exhausted': ('Exhausted (100%+)', Q(used_percentage_db__gte=100)),
+        'over90': ('Over 90%', Q(used_percentage_db__gt=90, used_percentage_db__lt=100)),
+        '75to90': ('75% - 90%', Q(used_percentage_db__gt=75, used_percentage_db__lte=90)),
+        'under75': ('75% or less', Q(used_percentage_db__lte=75)),
+    }
+    
+    def lookups(self, request, model_admin):
+        return [(key, label) for key, (label, condition) in self.BUCKETS.items()]
+    
+    def queryset(self, request, queryset):
+        if self.value() not in self.BUCKETS:
+            return queryset
+        label, condition = self.BUCKETS[self.value()]
+        return queryset.filter(condition)
+
 @admin.register(LeaveBalance)
 class LeaveBalanceAdmin(admin.ModelAdmin):
-    list_display = ('user', 'leave_type', 'year', 'allocated_days', 'used_days', 'available_days', 'used_percentage_display')
-    list_filter = ('leave_type', 'year', 'user__department', 'user__is_senior')
+    list_display = ('user', 'leave_type', 'year', 'allocated_days', 'used_days', 'available_days_display', 'used_percentage_display')
+    list_filter = (LeaveTypeFilter, YearColumnFilter, UsagePercentageFilter, DepartmentFilter, 'user__is_senior')
     search_fields = ('user__user__first_name', 'user__user__last_name', 'user__employee_id')
     ordering = ('user__employee_id', 'leave_type__name', 'year')
     
@@ -111,19 +236,101 @@ class LeaveBalanceAdmin(admin.ModelAdmin):
             color = 'orange'
         else:
             color = 'green'
-        return format_html('<span style="color: {};">{:.1f}%</span>', color, percentage)
+        return format_html('<span style="color: {};">{}%</span>', color, f'{percentage:.1f}')
     used_percentage_display.short_description = 'Used %'
+    used_percentage_display.admin_order_field = 'used_percentage_db'
+    
+    def available_days_display(self, obj):
+        return obj.available_days
+    available_days_display.short_description = 'Available days'
+    available_days_display.admin_order_field = 'available_days_db'
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user__user', 'leave_type')
+        return super().get_queryset(request).with_usage().select_related('user__user', 'leave_type')
+    
+    actions = ['recompute_selected', 'carry_over_to_next_year', 'adjust_selected']
+    change_list_template = 'admin/leaves/leavebalance/change_list.html'
+    reconcile_display_limit = 500
+    
+    def get_urls(self):
+        urls = [
+            path('reconcile/', self.admin_site.admin_view(self.reconcile_view), name='leaves_leavebalance_reconcile'),
+        ]
+        return urls + super().get_urls()
+    
+    def reconcile_view(self, request):
+        """Drift report between stored balances and approved requests, with a bulk fix"""
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        
+        year = request.GET.get('year') or request.POST.get('year')
+        year = int(year) if year and year.isdigit() else None
+        drifts = reconciliation.find_drift(year=year)
+        
+        if request.method == 'POST' and drifts:
+            count = reconciliation.fix_drift(drifts, year=year)
+            self.message_user(request, f'Recomputed {count} leave balances for {len(drifts)} drifting entries.', messages.SUCCESS)
+            url = reverse('admin:leaves_leavebalance_reconcile')
+            return redirect(f'{url}?year={year}' if year else url)
+        
+        return TemplateResponse(request, 'admin/leaves/leavebalance/reconcile.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Reconcile leave balances',
+            'year': year,
+            'drifts': drifts[:self.reconcile_display_limit],
+            'drift_count': len(drifts),
+            'missing_count': sum(1 for drift in drifts if drift.missing_balance),
+        })
+    
+    def _bulk_form(self, request, queryset, form_class, title):
+        """Bound form for an action's intermediate page, or None to show it"""
+        if 'apply' in request.POST:
+            form = form_class(request.POST)
+            if form.is_valid():
+                return form
+        else:
+            form = form_class()
+        return TemplateResponse(request, 'admin/leaves/leavebalance/bulk_action.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': title,
+            'form': form,
+            'count': queryset.count(),
+            'selected_ids': queryset.values_list('pk', flat=True),
+            'action': request.POST.get('action'),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+    
+    def recompute_selected(self, request, queryset):
+        count = bulk.recompute_balances(UserProfile.objects.filter(pk__in=queryset.values('user_id')))
+        self.message_user(request, f'Recomputed {count} leave balances for the selected employees.', messages.SUCCESS)
+    recompute_selected.short_description = "Recompute selected employees' balances from approved requests"
+    
+    def carry_over_to_next_year(self, request, queryset):
+        form = self._bulk_form(request, queryset, CarryOverForm, 'Carry over unused days')
+        if not isinstance(form, CarryOverForm):
+            return form
+        count = bulk.carry_over(queryset, form.cleaned_data['max_days'])
+        self.message_user(request, f'Carried unused days over into {count} next-year balances.', messages.SUCCESS)
+    carry_over_to_next_year.short_description = 'Carry unused days over to next year'
+    
+    def adjust_selected(self, request, queryset):
+        form = self._bulk_form(request, queryset, BalanceAdjustmentForm, 'Adjust balances')
+        if not isinstance(form, BalanceAdjustmentForm):
+            return form
+        count = bulk.adjust_balances(queryset, form.cleaned_data['field'], form.cleaned_data['days'])
+        self.message_user(request, f'Adjusted {count} leave balances.', messages.SUCCESS)
+    adjust_selected.short_description = 'Adjust selected balances'
 
 @admin.register(LeaveRequest)
 class LeaveRequestAdmin(admin.ModelAdmin):
     list_display = ('user', 'leave_type', 'start_date', 'end_date', 'total_days', 'status', 'created_at', 'approved_by')
-    list_filter = ('status', 'leave_type', 'duration_type', 'created_at', 'user__department')
-    search_fields = ('user__user__first_name', 'user__user__last_name', 'user__employee_id', 'reason')
+    list_filter = ('status', LeaveTypeFilter, 'duration_type', 'created_at', StartYearFilter, DepartmentFilter)
+    search_fields = ('user__user__first_name', 'user__user__last_name', 'user__employee_id', 'reason', 'supervisor_comments')
     ordering = ('-created_at',)
-    date_hierarchy = 'start_date'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     fieldsets = (
         ('Employee & Leave Details', {
@@ -145,20 +352,144 @@ class LeaveRequestAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user__user', 'leave_type', 'approved_by__user')
     
+    def get_search_results(self, request, queryset, search_term):
+        # search_fields only enables the search box; matching uses the full-text index
+        return search.search_requests(queryset, search_term), False
+    
+    actions = ['approve_selected', 'reject_selected']
+    
+    def _transition(self, request, queryset, status):
+        performed_by = UserProfile.objects.filter(user=request.user).first()
+        count = bulk.transition_requests(queryset, status, performed_by=performed_by)
+        skipped = queryset.count() - count
+        message = f'{count} pending leave requests {status}.'
+        if skipped:
+            message += f' {skipped} selected requests were not pending and were left unchanged.'
+        self.message_user(request, message, messages.SUCCESS)
+    
+    def approve_selected(self, request, queryset):
+        self._transition(request, queryset, 'approved')
+    approve_selected.short_description = 'Approve selected pending requests'
+    
+    def reject_selected(self, request, queryset):
+        self._transition(request, queryset, 'rejected')
+    reject_selected.short_description = 'Reject selected pending requests'
+    
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "approved_by":
             kwargs["queryset"] = UserProfile.objects.filter(is_supervisor=True)
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
+    
+    def save_model(self, request, obj, form, change):
+        # Keep the usage rollup in step with edits made through the admin
+        with transaction.atomic():
+            if change:
+                old = LeaveRequest.objects.select_related('user').get(pk=obj.pk)
+                rollups.record_status_change(old, old.status, None)
+            super().save_model(request, obj, form, change)
+            rollups.record_status_change(obj, None, obj.status)
+    
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            rollups.record_status_change(obj, obj.status, None)
+            super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            for obj in queryset.select_related('user'):
+                rollups.record_status_change(obj, obj.status, None)
+            super().delete_queryset(request, queryset)
 
 @admin.register(LeaveHistory)
 class LeaveHistoryAdmin(admin.ModelAdmin):
     list_display = ('leave_request', 'action', 'performed_by', 'timestamp')
-    list_filter = ('action', 'timestamp')
+    list_filter = (HistoryActionFilter, TimestampYearFilter, HistoryLeaveTypeFilter, HistoryDepartmentFilter)
     search_fields = ('leave_request__user__user__first_name', 'leave_request__user__user__last_name', 'performed_by__user__first_name')
     ordering = ('-timestamp',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ('leave_request', 'performed_by')
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('leave_request__user__user', 'performed_by__user')
+    
+    def get_search_results(self, request, queryset, search_term):
+        return search.search_history(queryset, search_term), False
+
+@admin.register(LeaveHistoryArchive)
+class LeaveHistoryArchiveAdmin(admin.ModelAdmin):
+    list_display = ('year', 'row_count', 'path', 'archived_at')
+    readonly_fields = ('year', 'row_count', 'path', 'sha256', 'archived_at')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(StoredDocument)
+class StoredDocumentAdmin(admin.ModelAdmin):
+    list_display = ('path', 'size', 'content_type', 'preview_status', 'preview_thumbnail', 'created_at')
+    list_filter = ('preview_status', 'content_type')
+    search_fields = ('=sha256',)
+    readonly_fields = ('sha256', 'path', 'size', 'content_type', 'preview', 'preview_status', 'preview_error', 'preview_started_at', 'created_at')
+    actions = ['requeue_previews']
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def preview_thumbnail(self, obj):
+        if obj.preview_status != 'ready':
+            return '-'
+        return format_html('<img src="{}" style="max-height: 60px;">', document_storage.url(obj.preview))
+    preview_thumbnail.short_description = 'Preview'
+    
+    def requeue_previews(self, request, queryset):
+        count = documents.requeue(queryset)
+        self.message_user(request, f'{count} documents queued for preview generation.', messages.SUCCESS)
+    requeue_previews.short_description = 'Regenerate previews'
+
+@admin.register(LeaveUsageRollup)
+class LeaveUsageRollupAdmin(admin.ModelAdmin):
+    list_display = ('department', 'leave_type', 'year', 'month', 'status', 'total_days', 'request_count')
+    list_filter = (YearColumnFilter, 'status', LeaveTypeFilter, RollupDepartmentFilter)
+    ordering = ('-year', '-month', 'department', 'leave_type__name')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('short_fingerprint', 'count', 'mean', 'max_ms', 'total_ms', 'database', 'call_site', 'last_seen')
+    list_filter = ('database',)
+    search_fields = ('fingerprint', 'call_site')
+    readonly_fields = (
+        'fingerprint', 'count', 'mean', 'max_ms', 'total_ms', 'database', 'call_site',
+        'sample_sql', 'sample_params', 'explain_plan', 'first_seen', 'last_seen'
+    )
+    exclude = ('digest', 'plan')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def short_fingerprint(self, obj):
+        return obj.fingerprint[:120]
+    short_fingerprint.short_description = 'Query'
+    
+    def mean(self, obj):
+        return round(obj.mean_ms, 1)
+    mean.short_description = 'Mean (ms)'
+    
+    def explain_plan(self, obj):
+        return format_html('<pre>{}</pre>', obj.plan or 'Not explained (only SELECTs are)')
+    explain_plan.short_description = 'EXPLAIN'
 
 @admin.register(CompanySettings)
 class CompanySettingsAdmin(admin.ModelAdmin):
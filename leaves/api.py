@@ -0,0 +1,353 @@
+"""
+Read-only JSON API (v1) over leave balances, requests and team summaries.
+
+Every endpoint answers conditional GETs, so a client polling an unchanged
+resource gets a 304 without the rows ever being serialized. The ETag covers
+one aggregate over ``updated_at`` (and the row count) of the listed rows
+plus the few related values a response shows that have no ``updated_at``
+(employee ids, names, departments, leave type names, team membership).
+Last-Modified is when the current ETag was first served, so removals and
+related changes move it too. Permissions are checked before either.
+"""
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max, Prefetch, Q
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.views.decorators.http import condition, require_GET
+from datetime import timedelta
+from functools import wraps
+from decimal import Decimal, InvalidOperation
+import hashlib
+
+from .models import UserProfile, LeaveBalance, LeaveRequest, LeaveType, BALANCE_SORTS
+from .pagination import paginate_keyset, clamp_page_size, InvalidCursor
+from . import search
+
+API_VERSION = 'v1'
+# How long the first-served time of an ETag is remembered (see _freshness)
+ETAG_SEEN_TIMEOUT = 60 * 60 * 24 * 7
+
+def api_response(data, status=200):
+    """Compact JSON response"""
+    return JsonResponse(
+        data,
+        status=status,
+        encoder=DjangoJSONEncoder,
+        json_dumps_params={'separators': (',', ':')},
+    )
+
+def api_error(message, status):
+    return api_response({'error': message}, status=status)
+
+def api_login_required(view_func):
+    """Like login_required, but answers 401/403 JSON instead of redirecting"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return api_error('Authentication required.', 401)
+        try:
+            request.user_profile = request.user.userprofile
+        except UserProfile.DoesNotExist:
+            return api_error('No employee profile for this account.', 403)
+        return view_func(request, *args, **kwargs)
+    return wrapper
+
+def api_supervisor_required(view_func):
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not request.user_profile.is_supervisor:
+            return api_error('Only supervisors can view team data.', 403)
+        return view_func(request, *args, **kwargs)
+    return wrapper
+
+def api_request_visible(view_func):
+    """Same permission check as the HTML detail view"""
+    @wraps(view_func)
+    def wrapper(request, request_id, *args, **kwargs):
+        leave_request = get_object_or_404(LeaveRequest.objects.select_related('user'), id=request_id)
+        user_profile = request.user_profile
+        if not (leave_request.user == user_profile or
+                (user_profile.is_supervisor and leave_request.can_be_approved_by(user_profile))):
+            return api_error('You do not have permission to view this request.', 403)
+        return view_func(request, request_id, *args, **kwargs)
+    return wrapper
+
+# Conditional GET helpers
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+def _freshness(request, querysets, related):
+    """
+    (etag, last_modified) for one or more querysets, one aggregate each,
+    and the rows of the related value querysets.
+
+    The result is memoized on the request because Django's ``condition``
+    decorator asks for the ETag and Last-Modified separately.
+    """
+    if not hasattr(request, '_api_freshness'):
+        scope = '|'.join([API_VERSION, request.path, request.GET.urlencode(), str(request.user.pk)])
+        key_parts = [scope]
+        last_modified = None
+        for queryset in _as_list(querysets):
+            stats = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('id'))
+            key_parts.append(str(stats['count']))
+            if stats['last_modified']:
+                key_parts.append(stats['last_modified'].isoformat())
+                if last_modified is None or stats['last_modified'] > last_modified:
+                    last_modified = stats['last_modified']
+        for values in _as_list(related):
+            key_parts.append(repr(list(values)))
+        etag = hashlib.sha1('|'.join(key_parts).encode('utf-8')).hexdigest()
+
+        # A removed row or a changed related value has no updated_at to show
+        # for it: date the response from when its ETag was first served, at
+        # least a second after the previous one (HTTP dates have seconds)
+        seen_key = 'api-etag-seen:' + hashlib.sha1(scope.encode('utf-8')).hexdigest()
+        seen = cache.get(seen_key)
+        if seen is None or seen[0] != etag:
+            first_served = timezone.now()
+            if seen is not None:
+                first_served = max(first_served, seen[1] + timedelta(seconds=1))
+            seen = (etag, first_served)
+            cache.set(seen_key, seen, ETAG_SEEN_TIMEOUT)
+        if last_modified is None or seen[1] > last_modified:
+            last_modified = seen[1]
+
+        request._api_freshness = (etag, last_modified)
+    return request._api_freshness
+
+def conditional(queryset_func, related_func=None):
+    """Wrap a view with ETag/Last-Modified handling based on queryset_func
+
+    queryset_func takes the view arguments and returns the queryset (or list
+    of querysets) whose rows the response is built from; related_func
+    returns ordered values_list querysets of the related values it shows.
+    """
+    def freshness(request, *args, **kwargs):
+        related = related_func(request, *args, **kwargs) if related_func else []
+        return _freshness(request, queryset_func(request, *args, **kwargs), related)
+
+    def etag_func(request, *args, **kwargs):
+        return freshness(request, *args, **kwargs)[0]
+
+    def last_modified_func(request, *args, **kwargs):
+        return freshness(request, *args, **kwargs)[1]
+
+    return condition(etag_func=etag_func, last_modified_func=last_modified_func)
+
+# Serializers
+def serialize_balance(balance):
+    return {
+        'id': balance.id,
+        'leave_type': balance.leave_type.name,
+        'year': balance.year,
+        'allocated': balance.allocated_days,
+        'carry_over': balance.carry_over_days,
+        'used': balance.used_days,
+        'available': balance.available_days,
+        'used_percentage': round(float(balance.used_percentage), 1),
+        'updated_at': balance.updated_at,
+    }
+
+def serialize_request(leave_request):
+    return {
+        'id': leave_request.id,
+        'employee_id': leave_request.user.employee_id,
+        'leave_type': leave_request.leave_type.name,
+        'start_date': leave_request.start_date,
+        'end_date': leave_request.end_date,
+        'duration_type': leave_request.duration_type,
+        'total_days': leave_request.total_days,
+        'status': leave_request.status,
+        'reason': leave_request.reason,
+        'supervisor_comments': leave_request.supervisor_comments,
+        'approved_date': leave_request.approved_date,
+        'created_at': leave_request.created_at,
+        'updated_at': leave_request.updated_at,
+    }
+
+def paginated(request, queryset, serializer):
+    """Serialize one keyset page of queryset with its next cursor"""
+    page_size = clamp_page_size(request.GET.get('page_size'), default=50)
+    page = paginate_keyset(queryset, request.GET.get('cursor'), page_size)
+    return {
+        'results': [serializer(item) for item in page],
+        'next_cursor': page.next_cursor,
+    }
+
+# Querysets shared by the freshness check and the view body
+def _current_year(request):
+    try:
+        return int(request.GET.get('year', timezone.now().year))
+    except ValueError:
+        return timezone.now().year
+
+def _decimal_param(request, name):
+    try:
+        return Decimal(request.GET[name])
+    except (KeyError, InvalidOperation):
+        return None
+
+def balances_queryset(request):
+    queryset = LeaveBalance.objects.filter(
+        user=request.user_profile,
+        year=_current_year(request)
+    ).with_usage()
+
+    # Range filters on the database-computed figures
+    min_used = _decimal_param(request, 'min_used_percentage')
+    if min_used is not None:
+        queryset = queryset.filter(used_percentage_db__gte=min_used)
+    max_available = _decimal_param(request, 'max_available')
+    if max_available is not None:
+        queryset = queryset.filter(available_days_db__lte=max_available)
+    return queryset
+
+def requests_queryset(request):
+    user_profile = request.user_profile
+    if request.GET.get('scope') == 'team' and user_profile.is_supervisor:
+        queryset = LeaveRequest.objects.filter(user__supervisor=user_profile)
+    else:
+        queryset = LeaveRequest.objects.filter(user=user_profile)
+
+    status = request.GET.get('status')
+    if status:
+        queryset = queryset.filter(status=status)
+    return search.search_requests(queryset, request.GET.get('q'))
+
+def request_detail_queryset(request, request_id):
+    return LeaveRequest.objects.filter(id=request_id)
+
+def search_queryset(request):
+    """Requests visible to the current user that match ?q="""
+    user_profile = request.user_profile
+    visible = Q(user=user_profile)
+    if user_profile.is_supervisor:
+        visible |= Q(user__supervisor=user_profile)
+    return search.search_requests(LeaveRequest.objects.filter(visible), request.GET.get('q'))
+
+# Related values shown in responses, for the ETag
+def _leave_type_names():
+    return LeaveType.objects.order_by('id').values_list('id', 'name')
+
+def _employee_ids(profiles):
+    return profiles.order_by('id').values_list('id', 'employee_id')
+
+def balances_related(request):
+    return [_leave_type_names()]
+
+def requests_related(request):
+    user_profile = request.user_profile
+    if request.GET.get('scope') == 'team' and user_profile.is_supervisor:
+        profiles = UserProfile.objects.filter(supervisor=user_profile)
+    else:
+        profiles = UserProfile.objects.filter(pk=user_profile.pk)
+    return [_employee_ids(profiles), _leave_type_names()]
+
+def search_related(request):
+    user_profile = request.user_profile
+    visible = Q(pk=user_profile.pk)
+    if user_profile.is_supervisor:
+        visible |= Q(supervisor=user_profile)
+    return [_employee_ids(UserProfile.objects.filter(visible)), _leave_type_names()]
+
+def request_detail_related(request, request_id):
+    return [LeaveRequest.objects.filter(id=request_id).values_list('user__employee_id', 'leave_type__name')]
+
+def team_related(request):
+    members = request.user_profile.get_subordinates().order_by('id').values_list(
+        'id', 'employee_id', 'department', 'user__first_name', 'user__last_name'
+    )
+    return [members, _leave_type_names()]
+
+def team_querysets(request):
+    balances = LeaveBalance.objects.filter(
+        user__supervisor=request.user_profile,
+        user__is_active=True,
+        year=_current_year(request)
+    )
+    pending = LeaveRequest.objects.filter(
+        user__supervisor=request.user_profile,
+        user__is_active=True,
+        status='pending'
+    )
+    return [balances, pending]
+
+# Views
+@require_GET
+@api_login_required
+@conditional(balances_queryset, balances_related)
+def balance_list(request):
+    """Current user's leave balances for a year"""
+    sort = request.GET.get('sort')
+    ordering = (BALANCE_SORTS[sort], 'leave_type__name') if sort in BALANCE_SORTS else ('leave_type__name',)
+    balances = balances_queryset(request).select_related('leave_type').order_by(*ordering)
+    return api_response({'results': [serialize_balance(b) for b in balances]})
+
+@require_GET
+@api_login_required
+@conditional(requests_queryset, requests_related)
+def request_list(request):
+    """Current user's (or, with scope=team, their team's) leave requests"""
+    queryset = requests_queryset(request).select_related('user', 'leave_type')
+    try:
+        return api_response(paginated(request, queryset, serialize_request))
+    except InvalidCursor as e:
+        return api_error(str(e), 400)
+
+@require_GET
+@api_login_required
+@conditional(search_queryset, search_related)
+def request_search(request):
+    """Full-text search over the requests (and their history) the user can see"""
+    if not search.tokenize(request.GET.get('q')):
+        return api_error('Provide a search query with ?q=', 400)
+    queryset = search_queryset(request).select_related('user', 'leave_type')
+    try:
+        return api_response(paginated(request, queryset, serialize_request))
+    except InvalidCursor as e:
+        return api_error(str(e), 400)
+
+@require_GET
+@api_login_required
+@api_request_visible
+@conditional(request_detail_queryset, request_detail_related)
+def request_detail(request, request_id):
+    """A single leave request visible to the current user"""
+    leave_request = get_object_or_404(
+        LeaveRequest.objects.select_related('user', 'leave_type'),
+        id=request_id
+    )
+    return api_response(serialize_request(leave_request))
+
+@require_GET
+@api_login_required
+@api_supervisor_required
+@conditional(team_querysets, team_related)
+def team_summary(request):
+    """Balances and pending request counts for the supervisor's team"""
+    user_profile = request.user_profile
+    year = _current_year(request)
+    subordinates = user_profile.get_subordinates().select_related('user').annotate(
+        pending_requests=Count('leaverequest', filter=Q(leaverequest__status='pending'))
+    ).prefetch_related(
+        Prefetch(
+            'leavebalance_set',
+            queryset=LeaveBalance.objects.filter(year=year).with_usage().select_related('leave_type').order_by('-used_percentage_db'),
+            to_attr='current_balances'
+        )
+    ).order_by('employee_id')
+
+    results = []
+    for subordinate in subordinates:
+        results.append({
+            'employee_id': subordinate.employee_id,
+            'name': subordinate.user.get_full_name(),
+            'department': subordinate.department,
+            'pending_requests': subordinate.pending_requests,
+            'balances': [serialize_balance(b) for b in subordinate.current_balances],
+        })
+
+    return api_response({'year': year, 'results': results})
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class LeavesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'leaves'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import monitoring  # noqa: F401
+        from . import query_budget  # noqa: F401
+        from . import slow_queries  # noqa: F401
@@ -0,0 +1,89 @@
+"""
+Django benchmarks (see benchmarks.py), run by the run_benchmarks command
+against a freshly created test database.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from benchmarks import BALANCE_COUNT, benchmark
+from leave_service.core import DEFAULT_ALLOCATIONS
+
+from .forms import LeaveRequestForm
+from .models import LeaveBalance, LeaveType, UserProfile
+from .views import get_default_allocation
+
+_fixture = {}
+
+def fixture():
+    """Leave types and an employee with this year's balances, created once"""
+    if not _fixture:
+        leave_types = [
+            LeaveType.objects.get_or_create(name=name, defaults={'requires_reason': name in ('PTO', 'Bereavement')})[0]
+            for name in DEFAULT_ALLOCATIONS
+        ]
+        user = User.objects.create_user('benchmark@tempo.fit', 'benchmark@tempo.fit', first_name='Bench', last_name='Mark')
+        profile = UserProfile.objects.create(
+            user=user, employee_id='BENCH001', position='Engineer', department='Engineering',
+            starting_date=date(2020, 1, 1), gender='Female'
+        )
+        for leave_type in leave_types:
+            LeaveBalance.objects.create(
+                user=profile, leave_type=leave_type, year=timezone.now().year,
+                allocated_days=DEFAULT_ALLOCATIONS[leave_type.name], used_days=Decimal('4.5')
+            )
+        _fixture.update(leave_types=leave_types, profile=profile)
+    return _fixture
+
+@benchmark('django.LeaveRequestForm.clean')
+def _form_clean():
+    """A full-day request through form validation, balance check included"""
+    data = fixture()
+    leave_type = next(leave_type for leave_type in data['leave_types'] if leave_type.name == 'PPTO')
+    start = timezone.now().date() + timedelta(days=30)
+    post = {
+        'leave_type': leave_type.pk,
+        'start_date': start.isoformat(),
+        'end_date': (start + timedelta(days=4)).isoformat(),
+        'duration_type': 'full_day',
+        'reason': 'Family trip',
+    }
+
+    def clean():
+        form = LeaveRequestForm(post, user=data['profile'])
+        assert form.is_valid(), form.errors
+    return clean
+
+def _balances(count):
+    data = fixture()
+    leave_types = data['leave_types']
+    return [
+        LeaveBalance(
+            user=data['profile'], leave_type=leave_types[index % len(leave_types)],
+            allocated_days=Decimal(21 + index % 10), carry_over_days=Decimal(index % 5),
+            used_days=Decimal(index % 25) / 2
+        )
+        for index in range(count)
+    ]
+
+@benchmark('django.LeaveBalance.available_days')
+def _available_days():
+    """available_days over a company-wide balance list"""
+    balances = _balances(BALANCE_COUNT)
+    return lambda: [balance.available_days for balance in balances]
+
+@benchmark('django.LeaveBalance.used_percentage')
+def _used_percentage():
+    """used_percentage over a company-wide balance list"""
+    balances = _balances(BALANCE_COUNT)
+    return lambda: [balance.used_percentage for balance in balances]
+
+@benchmark('django.get_default_allocation')
+def _default_allocation():
+    """Default allocations for a company's employees and leave types"""
+    leave_types = fixture()['leave_types']
+    profiles = [UserProfile(is_senior=index % 4 == 0) for index in range(BALANCE_COUNT // len(leave_types))]
+    pairs = [(profile, leave_type) for profile in profiles for leave_type in leave_types]
+    return lambda: [get_default_allocation(profile, leave_type) for profile, leave_type in pairs]
@@ -0,0 +1,230 @@
+"""
+Set-based bulk operations behind the admin actions.
+
+Every operation runs in one transaction and touches each table with a
+constant number of statements, whatever the selection size: a single
+UPDATE (with correlated subqueries where a per-row value is needed), a
+bulk INSERT for missing rows and bulk-created history. QuerySet.update()
+skips save() and its signals, so updated_at, the usage rollup, cached
+calendar feeds and the search index are maintained here explicitly.
+"""
+from django.core.mail import send_mass_mail
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, ExtractYear, Greatest, Least
+from django.utils import timezone
+from decimal import Decimal
+
+from leave_service import default_allocation
+from .models import LeaveBalance, LeaveRequest, LeaveHistory, LeaveType, UserProfile
+from . import rollups, ical, search
+
+ZERO = Value(Decimal('0'))
+HISTORY_BATCH_SIZE = 1000
+
+# The balance year an approved request counts against: the year it was
+# approved in, as approval charges it (requests approved before
+# approved_date was recorded fall back to their start year)
+CHARGED_YEAR = Coalesce(ExtractYear('approved_date'), ExtractYear('start_date'))
+
+def _create_missing_balances(keys):
+    """Insert default balances for (user_id, leave_type_id, year) keys that have none"""
+    keys = set(keys)
+    if not keys:
+        return 0
+    user_ids = {user_id for user_id, leave_type_id, year in keys}
+    existing = set(
+        LeaveBalance.objects.filter(
+            user_id__in=user_ids,
+            year__in={year for user_id, leave_type_id, year in keys}
+        ).values_list('user_id', 'leave_type_id', 'year')
+    )
+    missing = keys - existing
+    if not missing:
+        return 0
+
+    profiles = UserProfile.objects.in_bulk(user_ids)
+    leave_types = LeaveType.objects.in_bulk()
+    LeaveBalance.objects.bulk_create(
+        [
+            LeaveBalance(
+                user_id=user_id,
+                leave_type_id=leave_type_id,
+                year=year,
+                allocated_days=default_allocation(leave_types[leave_type_id].name, profiles[user_id].is_senior),
+            )
+            for user_id, leave_type_id, year in missing
+        ],
+        batch_size=HISTORY_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    return len(missing)
+
+def _notify(requests, status):
+    """Status emails for the changed requests, over one mail connection"""
+    messages = []
+    for leave_request in requests.select_related('user__user', 'leave_type'):
+        if not leave_request.user.user.email:
+            continue
+        messages.append((
+            f'Leave Request {status.title()}',
+            f"""
+    Your leave request has been {status}:
+
+    Leave Type: {leave_request.leave_type.name}
+    Duration: {leave_request.start_date} to {leave_request.end_date}
+    Total Days: {leave_request.total_days}
+
+    Supervisor Comments: {leave_request.supervisor_comments or 'None'}
+    """,
+            settings.DEFAULT_FROM_EMAIL,
+            [leave_request.user.user.email],
+        ))
+    send_mass_mail(messages, fail_silently=True)
+
+def transition_requests(queryset, new_status, performed_by=None, comments=''):
+    """
+    Approve or reject every pending request in queryset.
+
+    Approval adds each request's days to the current year's balance, as the
+    approve view does. Returns the number of requests changed.
+    """
+    if new_status not in ('approved', 'rejected'):
+        raise ValueError(f'Cannot bulk-transition requests to {new_status}.')
+
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            queryset.filter(status='pending').select_for_update().values_list('id', flat=True)
+        )
+        if not ids:
+            return 0
+        requests = LeaveRequest.objects.filter(id__in=ids)
+
+        rollups.record_bulk_status_change(requests, 'pending', new_status)
+
+        if new_status == 'approved':
+            year = now.year
+            groups = requests.values_list('user_id', 'leave_type_id').distinct()
+            _create_missing_balances((user_id, leave_type_id, year) for user_id, leave_type_id in groups)
+
+            approved_days = (
+                requests.filter(user_id=OuterRef('user_id'), leave_type_id=OuterRef('leave_type_id'))
+                .order_by()
+                .values('user_id')
+                .annotate(days=Sum('total_days'))
+                .values('days')
+            )
+            LeaveBalance.objects.filter(
+                Exists(requests.filter(user_id=OuterRef('user_id'), leave_type_id=OuterRef('leave_type_id'))),
+                year=year,
+            ).update(
+                used_days=F('used_days') + Coalesce(Subquery(approved_days), ZERO),
+                updated_at=now,
+            )
+
+        changes = {
+            'status': new_status,
+            'approved_by': performed_by,
+            'approved_date': now,
+            'updated_at': now,
+        }
+        if comments:
+            changes['supervisor_comments'] = comments
+        requests.update(**changes)
+
+        LeaveHistory.objects.bulk_create(
+            [
+                LeaveHistory(leave_request_id=request_id, action=new_status, performed_by=performed_by, comments=comments)
+                for request_id in ids
+            ],
+            batch_size=HISTORY_BATCH_SIZE,
+        )
+
+        if comments:
+            search.index_requests(requests)
+        ical.invalidate(*ical.request_scopes(requests))
+        transaction.on_commit(lambda: _notify(LeaveRequest.objects.filter(id__in=ids), new_status))
+
+    return len(ids)
+
+def recompute_balances(profiles, year=None):
+    """
+    Reset used_days on every balance of the given employees (optionally
+    only for one year) to the sum of their approved requests charged to
+    that balance's year (CHARGED_YEAR), creating balances that approved
+    requests need but that do not exist.
+
+    Returns the number of balances written.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        approved = LeaveRequest.objects.filter(user__in=profiles, status='approved').annotate(charged_year=CHARGED_YEAR)
+        balances = LeaveBalance.objects.filter(user__in=profiles)
+        if year:
+            approved = approved.filter(charged_year=year)
+            balances = balances.filter(year=year)
+        _create_missing_balances(
+            approved.values_list('user_id', 'leave_type_id', 'charged_year').distinct()
+        )
+
+        used_days = (
+            LeaveRequest.objects.annotate(charged_year=CHARGED_YEAR)
+            .filter(
+                status='approved',
+                user_id=OuterRef('user_id'),
+                leave_type_id=OuterRef('leave_type_id'),
+                charged_year=OuterRef('year'),
+            )
+            .order_by()
+            .values('user_id')
+            .annotate(days=Sum('total_days'))
+            .values('days')
+        )
+        return balances.update(
+            used_days=Coalesce(Subquery(used_days), ZERO),
+            updated_at=now,
+        )
+
+def carry_over(balances, max_days=None):
+    """
+    Carry each selected balance's unused days into the same employee and
+    leave type's balance for the following year (capped at max_days).
+
+    Returns the number of next-year balances written.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(balances.values_list('id', flat=True))
+        selected = LeaveBalance.objects.filter(id__in=ids)
+        _create_missing_balances(
+            (user_id, leave_type_id, year + 1)
+            for user_id, leave_type_id, year in selected.values_list('user_id', 'leave_type_id', 'year')
+        )
+
+        unused = Greatest(F('allocated_days') + F('carry_over_days') - F('used_days'), ZERO)
+        if max_days is not None:
+            unused = Least(unused, Value(Decimal(max_days)))
+        previous = selected.filter(
+            user_id=OuterRef('user_id'),
+            leave_type_id=OuterRef('leave_type_id'),
+            year=OuterRef('year') - 1,
+        ).annotate(unused=unused).values('unused')[:1]
+
+        return LeaveBalance.objects.filter(Exists(previous)).update(
+            carry_over_days=Subquery(previous),
+            updated_at=now,
+        )
+
+ADJUSTABLE_FIELDS = ('allocated_days', 'carry_over_days', 'used_days')
+
+def adjust_balances(balances, field, days):
+    """Add days (possibly negative) to one figure of every selected balance"""
+    if field not in ADJUSTABLE_FIELDS:
+        raise ValueError(f'Cannot adjust {field}.')
+    with transaction.atomic():
+        ids = list(balances.values_list('id', flat=True))
+        return LeaveBalance.objects.filter(id__in=ids).update(
+            **{field: F(field) + Decimal(days), 'updated_at': timezone.now()}
+        )
@@ -0,0 +1,156 @@
+"""
+Stored supporting documents and their previews.
+
+Every content-addressed file referenced by a leave request gets one
+StoredDocument row (see leaves.signals). New rows start with
+preview_status 'pending', which is the queue the process_document_previews
+worker drains: it claims a batch, renders a small JPEG preview and stores
+it under previews/<sha256>.jpg. Images need Pillow and PDFs need pdftoppm
+(poppler-utils); anything else, or a missing tool, ends as 'unsupported'.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+import io
+import mimetypes
+import os
+import shutil
+import subprocess
+import tempfile
+
+from .models import LeaveRequest, StoredDocument
+from .uploads import document_storage, sha256_from_name
+
+PREVIEW_DIR = 'previews'
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff', '.webp'}
+# A claimed document not finished in this long is assumed to belong to a dead worker
+STALE_CLAIM = timedelta(minutes=10)
+PDF_TIMEOUT = 60
+
+class PreviewUnsupported(Exception):
+    pass
+
+def preview_size():
+    return getattr(settings, 'DOCUMENT_PREVIEW_SIZE', 400)
+
+def register(name):
+    """StoredDocument for a content-addressed file name (None for legacy paths)"""
+    sha256 = sha256_from_name(name)
+    if sha256 is None:
+        return None
+    document, created = StoredDocument.objects.get_or_create(
+        sha256=sha256,
+        defaults={
+            'path': name,
+            'size': document_storage.size(name),
+            'content_type': mimetypes.guess_type(name)[0] or '',
+        }
+    )
+    return document
+
+def for_request(leave_request):
+    sha256 = sha256_from_name(leave_request.supporting_document.name)
+    if sha256 is None:
+        return None
+    return StoredDocument.objects.filter(sha256=sha256).first()
+
+# Worker
+def claim(limit):
+    """Mark up to limit pending (or stale) documents as processing; returns them"""
+    now = timezone.now()
+    with transaction.atomic():
+        queue = StoredDocument.objects.filter(preview_status='pending') | StoredDocument.objects.filter(
+            preview_status='processing', preview_started_at__lt=now - STALE_CLAIM
+        )
+        queue = queue.order_by('created_at')
+        if connection.features.has_select_for_update_skip_locked:
+            queue = queue.select_for_update(skip_locked=True)
+        ids = list(queue.values_list('id', flat=True)[:limit])
+        StoredDocument.objects.filter(id__in=ids).update(preview_status='processing', preview_started_at=now)
+    return list(StoredDocument.objects.filter(id__in=ids).order_by('created_at'))
+
+def _pillow():
+    try:
+        from PIL import Image
+    except ImportError:
+        raise PreviewUnsupported('Image previews need Pillow: pip install Pillow')
+    return Image
+
+def _image_preview(document):
+    Image = _pillow()
+    size = preview_size()
+    with document_storage.open(document.path, 'rb') as f:
+        image = Image.open(f)
+        # Let JPEG decoding downscale while reading instead of decoding full size
+        image.draft('RGB', (size, size))
+        image.thumbnail((size, size))
+        output = io.BytesIO()
+        image.convert('RGB').save(output, 'JPEG', quality=80)
+    return output.getvalue()
+
+def _pdf_preview(document):
+    pdftoppm = shutil.which('pdftoppm')
+    if pdftoppm is None:
+        raise PreviewUnsupported('PDF previews need pdftoppm (poppler-utils)')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        prefix = os.path.join(tmp_dir, 'page')
+        subprocess.run(
+            [pdftoppm, '-jpeg', '-singlefile', '-f', '1', '-l', '1',
+             '-scale-to', str(preview_size()), document_storage.path(document.path), prefix],
+            check=True, capture_output=True, timeout=PDF_TIMEOUT
+        )
+        with open(f'{prefix}.jpg', 'rb') as f:
+            return f.read()
+
+def render_preview(document):
+    """JPEG bytes previewing a document"""
+    ext = os.path.splitext(document.path)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        return _image_preview(document)
+    if ext == '.pdf':
+        return _pdf_preview(document)
+    raise PreviewUnsupported(f'No preview for {ext or "files without an extension"}')
+
+def process(document):
+    """Generate and store one document's preview, recording the outcome"""
+    try:
+        data = render_preview(document)
+    except PreviewUnsupported as e:
+        document.preview_status = 'unsupported'
+        document.preview_error = str(e)
+    except Exception as e:
+        document.preview_status = 'failed'
+        document.preview_error = f'{type(e).__name__}: {e}'
+    else:
+        name = f'{PREVIEW_DIR}/{document.sha256}.jpg'
+        if document_storage.exists(name):
+            document_storage.delete(name)
+        document.preview = document_storage.save_as(name, ContentFile(data))
+        document.preview_status = 'ready'
+        document.preview_error = ''
+    document.save(update_fields=['preview', 'preview_status', 'preview_error'])
+    return document.preview_status
+
+def requeue(queryset):
+    """Put documents back in the preview queue"""
+    return queryset.update(preview_status='pending', preview_error='', preview_started_at=None)
+
+def adopt_legacy_files():
+    """
+    Move documents uploaded before content addressing into the
+    content-addressed store (deduplicating them) and register them.
+    Returns the number of requests updated.
+    """
+    updated = 0
+    legacy = LeaveRequest.objects.exclude(supporting_document='').exclude(supporting_document__isnull=True)
+    for request_id, name in legacy.values_list('id', 'supporting_document').iterator(chunk_size=500):
+        if sha256_from_name(name) is not None or not document_storage.exists(name):
+            continue
+        with document_storage.open(name, 'rb') as f:
+            new_name = document_storage.save(name, f)
+        LeaveRequest.objects.filter(id=request_id).update(supporting_document=new_name)
+        register(new_name)
+        updated += 1
+    return updated
@@ -10,6 +10,9 @@ import csv
 import io
 
 from .models import LeaveRequest, LeaveType, LeaveBalance, UserProfile
+from .uploads import max_upload_size
+from leave_service import ServiceError
+from leave_service.django_store import service as leave_service
 
 class LeaveRequestForm(forms.ModelForm):
     """Form for creating and editing leave requests"""
@@ -67,75 +70,41 @@ class LeaveRequestForm(forms.ModelForm):
             )
         )
     
+    def add_upload_errors(self, errors):
+        """Report files the upload handler refused (they never reach request.FILES)"""
+        for field, message in errors.items():
+            if field in self.fields:
+                self.add_error(field, message)
+    
+    def clean_supporting_document(self):
+        document = self.cleaned_data.get('supporting_document')
+        # Uploads are already capped while streaming; this covers files from elsewhere
+        if document and getattr(document, 'size', 0) > max_upload_size():
+            raise ValidationError('File is too large.')
+        return document
+    
     def clean(self):
         cleaned_data = super().clean()
+        leave_type = cleaned_data.get('leave_type')
         start_date = cleaned_data.get('start_date')
         end_date = cleaned_data.get('end_date')
-        start_time = cleaned_data.get('start_time')
-        end_time = cleaned_data.get('end_time')
-        duration_type = cleaned_data.get('duration_type')
-        leave_type = cleaned_data.get('leave_type')
-        reason = cleaned_data.get('reason')
+        if not (leave_type and start_date and end_date):
+            return cleaned_data
         
-        # Validate dates
-        if start_date and end_date:
-            if start_date > end_date:
-                raise ValidationError('End date cannot be before start date.')
-            
-            # Check if leave is in the past
-            if start_date < timezone.now().date():
-                raise ValidationError('Leave cannot be scheduled for past dates.')
-        
-        # Validate times for hourly leave
-        if duration_type == 'hours' and start_time and end_time:
-            if start_time >= end_time:
-                raise ValidationError('End time must be after start time.')
-            
-            # Calculate duration in hours
-            duration_hours = (datetime.combine(start_date, end_time) - 
-                            datetime.combine(start_date, start_time)).seconds / 3600
-            
-            if duration_hours < 0.5:
-                raise ValidationError('Minimum leave duration is 30 minutes.')
-            
-            if duration_hours > 8:
-                raise ValidationError('Maximum leave duration is 8 hours per day.')
-        
-        # Check if reason is required for casual leave
-        if leave_type and leave_type.requires_reason and not reason:
-            raise ValidationError('Reason is required for this type of leave.')
-        
-        # Calculate total days
-        if start_date and end_date:
-            if duration_type == 'full_day':
-                total_days = (end_date - start_date).days + 1
-            elif duration_type == 'half_day':
-                total_days = Decimal('0.5')
-            else:  # hours
-                if start_time and end_time:
-                    duration_hours = (datetime.combine(start_date, end_time) - 
-                                    datetime.combine(start_date, start_time)).seconds / 3600
-                    total_days = Decimal(str(duration_hours / 8))
-                else:
-                    total_days = Decimal('0')
-            
-            cleaned_data['total_days'] = total_days
-            
-            # Check leave balance
-            if self.user and leave_type:
-                try:
-                    leave_balance = LeaveBalance.objects.get(
-                        user=self.user,
-                        leave_type=leave_type,
-                        year=timezone.now().year
-                    )
-                    if leave_balance.available_days < total_days:
-                        raise ValidationError(
-                            f'Insufficient leave balance. Available: {leave_balance.available_days} days, Requested: {total_days} days'
-                        )
-                except LeaveBalance.DoesNotExist:
-                    # Create default balance if it doesn't exist
-                    pass
+        # Date, duration, reason and balance rules are shared with the Streamlit app
+        try:
+            cleaned_data['total_days'] = leave_service().check_request(
+                self.user.id if self.user else None,
+                leave_type,
+                start_date,
+                end_date,
+                duration_type=cleaned_data.get('duration_type'),
+                reason=cleaned_data.get('reason'),
+                start_time=cleaned_data.get('start_time'),
+                end_time=cleaned_data.get('end_time'),
+            )
+        except ServiceError as e:
+            raise ValidationError(e.messages)
         
         return cleaned_data
     
@@ -278,4 +247,33 @@ class LeaveBalanceForm(forms.ModelForm):
                 Submit('submit', 'Update Balance', css_class='btn-primary'),
                 HTML('<a href="{{ request.META.HTTP_REFERER }}" class="btn btn-secondary">Cancel</a>')
             )
-        ) 
\ No newline at end of file
+        )
+
+class BalanceAdjustmentForm(forms.Form):
+    """Admin bulk action: add or remove days on the selected balances"""
+    
+    field = forms.ChoiceField(
+        choices=[
+            ('allocated_days', 'Allocated days'),
+            ('carry_over_days', 'Carry-over days'),
+            ('used_days', 'Used days'),
+        ],
+        initial='allocated_days'
+    )
+    
+    days = forms.DecimalField(
+        max_digits=6,
+        decimal_places=2,
+        help_text='Days to add to every selected balance (negative to remove)'
+    )
+
+class CarryOverForm(forms.Form):
+    """Admin bulk action: carry unused days into the following year"""
+    
+    max_days = forms.DecimalField(
+        max_digits=6,
+        decimal_places=2,
+        min_value=0,
+        required=False,
+        help_text='Maximum days carried over per balance (leave empty for no cap)'
+    )
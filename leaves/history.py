@@ -0,0 +1,176 @@
+"""
+Time-partitioned storage and archival for LeaveHistory.
+
+On PostgreSQL leaves_leavehistory is a table partitioned by RANGE on
+"timestamp", with one partition per calendar year plus a DEFAULT partition
+(see migration 0007). On other databases (SQLite locally) it stays a plain
+table.
+
+Closed years are moved out to gzip-compressed JSON-lines files in
+settings.LEAVE_HISTORY_ARCHIVE_DIR and recorded in LeaveHistoryArchive.
+On PostgreSQL the year's partition is then detached and dropped, which is
+instant regardless of size; elsewhere the rows are deleted in batches.
+"""
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+import gzip
+import hashlib
+import json
+import os
+
+from .models import LeaveHistory, LeaveHistoryArchive
+
+TABLE = LeaveHistory._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+DELETE_BATCH_SIZE = 5000
+
+def is_partitioned():
+    """Whether leave history is stored in native partitions"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass",
+            [TABLE]
+        )
+        return cursor.fetchone() is not None
+
+def partition_name(year):
+    return f'{TABLE}_y{year}'
+
+def _year_bounds(year):
+    return f'{year}-01-01 00:00:00+00', f'{year + 1}-01-01 00:00:00+00'
+
+def existing_partitions():
+    """{year: partition table} for the yearly partitions that exist"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            """,
+            [TABLE]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    prefix = f'{TABLE}_y'
+    return {int(name[len(prefix):]): name for name in names if name.startswith(prefix)}
+
+def ensure_partition(year):
+    """
+    Create the partition for a year if it is missing.
+
+    Rows for that year that already landed in the DEFAULT partition are
+    moved into the new partition in the same transaction.
+    """
+    if year in existing_partitions():
+        return False
+
+    name = partition_name(year)
+    lower, upper = _year_bounds(year)
+    qn = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {qn(name)} (LIKE {qn(TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {qn(DEFAULT_PARTITION)} '
+            f'WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+            f'INSERT INTO {qn(name)} SELECT * FROM moved',
+            [lower, upper]
+        )
+        cursor.execute(
+            f'ALTER TABLE {qn(TABLE)} ATTACH PARTITION {qn(name)} '
+            f'FOR VALUES FROM (%s) TO (%s)',
+            [lower, upper]
+        )
+    return True
+
+def ensure_future_partitions(years_ahead=1):
+    """Make sure partitions exist for this year and the next few"""
+    current_year = timezone.now().year
+    return [
+        year for year in range(current_year, current_year + years_ahead + 1)
+        if ensure_partition(year)
+    ]
+
+# Archival
+def archive_dir():
+    return str(getattr(settings, 'LEAVE_HISTORY_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'archive')))
+
+def archive_path(year):
+    return os.path.join(archive_dir(), f'leave_history_{year}.jsonl.gz')
+
+def year_queryset(year):
+    lower = datetime(year, 1, 1, tzinfo=dt_timezone.utc)
+    upper = datetime(year + 1, 1, 1, tzinfo=dt_timezone.utc)
+    return LeaveHistory.objects.filter(timestamp__gte=lower, timestamp__lt=upper)
+
+def _write_archive(year):
+    """Stream a year's rows to a gzip JSON-lines file; returns (path, rows, sha256)"""
+    path = archive_path(year)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+
+    rows = 0
+    digest = hashlib.sha256()
+    values = year_queryset(year).order_by('timestamp', 'id').values(
+        'id', 'leave_request_id', 'action', 'performed_by_id', 'timestamp', 'comments'
+    )
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        for row in values.iterator(chunk_size=DELETE_BATCH_SIZE):
+            line = json.dumps(row, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n'
+            f.write(line)
+            digest.update(line.encode('utf-8'))
+            rows += 1
+    os.replace(tmp_path, path)
+    return path, rows, digest.hexdigest()
+
+def _drop_year(year):
+    partitions = existing_partitions() if is_partitioned() else {}
+    if year in partitions:
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(partitions[year])}')
+            cursor.execute(f'DROP TABLE {qn(partitions[year])}')
+        return
+
+    queryset = year_queryset(year)
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:DELETE_BATCH_SIZE])
+        if not ids:
+            break
+        LeaveHistory.objects.filter(id__in=ids).delete()
+
+def archive_year(year):
+    """Move one closed year of history to cold storage"""
+    if year >= timezone.now().year:
+        raise ValueError(f'{year} is not a closed year.')
+    if LeaveHistoryArchive.objects.filter(year=year).exists():
+        raise ValueError(f'{year} is already archived.')
+
+    with transaction.atomic():
+        path, rows, sha256 = _write_archive(year)
+        LeaveHistoryArchive.objects.create(year=year, path=path, row_count=rows, sha256=sha256)
+        _drop_year(year)
+    return rows
+
+def archived_years():
+    return set(LeaveHistoryArchive.objects.values_list('year', flat=True))
+
+def load_archived_history(leave_request_id, years):
+    """Read a request's history entries back from archive files (cold path)"""
+    entries = []
+    for archive in LeaveHistoryArchive.objects.filter(year__in=years):
+        if not os.path.exists(archive.path):
+            continue
+        with gzip.open(archive.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                row = json.loads(line)
+                if row['leave_request_id'] == leave_request_id:
+                    entries.append(row)
+    entries.sort(key=lambda row: row['timestamp'], reverse=True)
+    return entries
@@ -0,0 +1,154 @@
+"""
+iCalendar (RFC 5545) feeds of approved and pending leave.
+
+Each feed scope ("user:<profile id>" or "team:<supervisor profile id>") is
+rendered once and kept in the cache together with its ETag. The signal
+handlers in leaves.signals drop the cached feed for exactly the scopes a
+changed request belongs to (or a renamed employee or leave type appears
+in), so polling calendar clients are answered from
+the cache (or with a 304) until something relevant changes.
+"""
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+import hashlib
+import secrets
+
+import metrics
+
+from .models import LeaveRequest, CalendarFeedToken
+
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+FEED_HISTORY_DAYS = 90
+FEED_STATUSES = ('approved', 'pending')
+PRODID = '-//Tempo.fit//Leave Management//EN'
+
+def user_scope(profile_id):
+    return f'user:{profile_id}'
+
+def team_scope(supervisor_id):
+    return f'team:{supervisor_id}'
+
+def _cache_key(scope):
+    return f'leaves:ical:{scope}'
+
+def invalidate(*scopes):
+    """
+    Drop cached feeds once the current transaction commits (at once outside
+    one): dropped earlier, a poll in between would cache the old rows again.
+    """
+    keys = [_cache_key(scope) for scope in scopes]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+def request_scopes(requests):
+    """Scopes of the feeds that list any of the given requests"""
+    scopes = set()
+    for user_id, supervisor_id in requests.values_list('user_id', 'user__supervisor_id').distinct():
+        scopes.add(user_scope(user_id))
+        if supervisor_id:
+            scopes.add(team_scope(supervisor_id))
+    return scopes
+
+def get_or_create_token(profile):
+    token, created = CalendarFeedToken.objects.get_or_create(
+        user=profile,
+        defaults={'token': secrets.token_urlsafe(32)}
+    )
+    return token
+
+def rotate_token(profile):
+    """Replace the feed token so previously shared URLs stop working"""
+    token = get_or_create_token(profile)
+    token.token = secrets.token_urlsafe(32)
+    token.save(update_fields=['token'])
+    return token
+
+# Rendering
+def _escape(text):
+    return (
+        text.replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+def _fold(line):
+    """Fold content lines longer than 75 octets"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        # Don't split a multi-byte character
+        while cut > 0 and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts)
+
+def _timestamp(value):
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+def _event_lines(leave_request):
+    name = leave_request.user.user.get_full_name()
+    status = leave_request.get_status_display()
+    summary = f'{name} - {leave_request.leave_type.name}'
+    if leave_request.status == 'pending':
+        summary += f' ({status})'
+
+    return [
+        'BEGIN:VEVENT',
+        f'UID:leave-request-{leave_request.id}@tempo.fit',
+        f'DTSTAMP:{_timestamp(leave_request.updated_at)}',
+        f'LAST-MODIFIED:{_timestamp(leave_request.updated_at)}',
+        f'DTSTART;VALUE=DATE:{leave_request.start_date:%Y%m%d}',
+        # DTEND is exclusive for all-day events
+        f'DTEND;VALUE=DATE:{leave_request.end_date + timedelta(days=1):%Y%m%d}',
+        f'SUMMARY:{_escape(summary)}',
+        f'DESCRIPTION:{_escape(leave_request.get_duration_display_text())}',
+        'STATUS:' + ('CONFIRMED' if leave_request.status == 'approved' else 'TENTATIVE'),
+        'TRANSP:OPAQUE',
+        'END:VEVENT',
+    ]
+
+def _feed_requests(scope):
+    kind, profile_id = scope.split(':', 1)
+    since = timezone.now().date() - timedelta(days=FEED_HISTORY_DAYS)
+    requests = LeaveRequest.objects.filter(
+        status__in=FEED_STATUSES,
+        end_date__gte=since
+    ).select_related('user__user', 'leave_type').order_by('start_date', 'id')
+    if kind == 'team':
+        return requests.filter(user__supervisor_id=profile_id, user__is_active=True)
+    return requests.filter(user_id=profile_id)
+
+def render_feed(scope, name):
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_escape(name)}',
+        'X-PUBLISHED-TTL:PT15M',
+    ]
+    for leave_request in _feed_requests(scope).iterator():
+        lines.extend(_event_lines(leave_request))
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(_fold(line) for line in lines) + '\r\n'
+
+def get_feed(scope, name):
+    """(etag, body) for a feed scope, rendered at most once per change"""
+    key = _cache_key(scope)
+    cached = cache.get(key)
+    metrics.record_cache('calendar_feed', cached is not None)
+    if cached is None:
+        body = render_feed(scope, name)
+        etag = '"%s"' % hashlib.sha1(body.encode('utf-8')).hexdigest()
+        cached = (etag, body)
+        cache.set(key, cached, FEED_CACHE_TIMEOUT)
+    return cached
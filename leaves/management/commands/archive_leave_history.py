@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from leaves import history
+from leaves.models import LeaveHistory
+
+class Command(BaseCommand):
+    help = 'Move closed years of leave history into compressed archive files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-years', type=int, default=2,
+                            help='Number of most recent years to keep in the database (default: 2)')
+        parser.add_argument('--year', type=int, help='Archive only this year')
+        parser.add_argument('--ensure-partitions', action='store_true',
+                            help='Also create upcoming yearly partitions (PostgreSQL only)')
+
+    def handle(self, *args, **options):
+        current_year = timezone.now().year
+        
+        if options['ensure_partitions']:
+            if history.is_partitioned():
+                created = history.ensure_future_partitions()
+                self.stdout.write(f'Partitions created: {created or "none needed"}')
+            else:
+                self.stdout.write('Leave history is not partitioned on this database; skipping partitions.')
+        
+        if options.get('year'):
+            years = [options['year']]
+        else:
+            if options['keep_years'] < 1:
+                raise CommandError('--keep-years must be at least 1.')
+            cutoff = current_year - options['keep_years'] + 1
+            first = LeaveHistory.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+            years = list(range(first.year, cutoff)) if first else []
+        
+        archived = history.archived_years()
+        for year in years:
+            if year in archived or not history.year_queryset(year).exists():
+                continue
+            try:
+                rows = history.archive_year(year)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f'Archived {rows} history rows for {year} to {history.archive_path(year)}')
+        
+        self.stdout.write(self.style.SUCCESS('Leave history archival complete.'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from datetime import datetime
+import sys
+
+from leaves.payroll import iter_payroll_csv
+from leaves.routing import replica_reads
+
+class Command(BaseCommand):
+    help = 'Export paid, partially paid and unpaid leave days per employee for a payroll period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('start', help='First day of the period (YYYY-MM-DD)')
+        parser.add_argument('end', help='Last day of the period (YYYY-MM-DD)')
+        parser.add_argument('--output', help='CSV file to write (defaults to stdout)')
+
+    @replica_reads
+    def handle(self, *args, **options):
+        try:
+            start = datetime.strptime(options['start'], '%Y-%m-%d').date()
+            end = datetime.strptime(options['end'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('Dates must be in YYYY-MM-DD format.')
+        
+        if start > end:
+            raise CommandError('End date cannot be before start date.')
+        
+        if options.get('output'):
+            with open(options['output'], 'w', newline='') as f:
+                for line in iter_payroll_csv(start, end):
+                    f.write(line)
+            self.stderr.write(self.style.SUCCESS(f'Payroll export written to {options["output"]}'))
+        else:
+            for line in iter_payroll_csv(start, end):
+                sys.stdout.write(line)
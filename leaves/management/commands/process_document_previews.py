@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from leaves import documents
+import time
+
+class Command(BaseCommand):
+    help = 'Background worker generating previews of uploaded supporting documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue once and exit instead of polling')
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help='Documents claimed per batch (default: 20)')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to sleep when the queue is empty (default: 5)')
+        parser.add_argument('--adopt-legacy', action='store_true',
+                            help='First move pre-existing uploads into the content-addressed store')
+
+    def handle(self, *args, **options):
+        if options['adopt_legacy']:
+            count = documents.adopt_legacy_files()
+            self.stdout.write(self.style.SUCCESS(f'Adopted {count} legacy documents.'))
+        
+        self.stdout.write('Processing document previews...')
+        while True:
+            batch = documents.claim(options['batch_size'])
+            for document in batch:
+                status = documents.process(document)
+                self.stdout.write(f'{document.path}: {status}')
+            
+            if batch:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        
+        self.stdout.write(self.style.SUCCESS('Preview queue drained.'))
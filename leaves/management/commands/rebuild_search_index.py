@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from leaves import search
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search documents for all leave requests'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding leave request search index...')
+        
+        count = search.rebuild()
+        
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt: {count} requests indexed.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from leaves import rollups
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly leave usage rollup from leave requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help='Only rebuild rollups for this year')
+
+    def handle(self, *args, **options):
+        year = options.get('year')
+        scope = f'year {year}' if year else 'all years'
+        self.stdout.write(f'Rebuilding usage rollup for {scope}...')
+        
+        count = rollups.rebuild(year=year)
+        
+        self.stdout.write(self.style.SUCCESS(f'Usage rollup rebuilt: {count} rows written.'))
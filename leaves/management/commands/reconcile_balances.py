@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from leaves import reconciliation
+
+class Command(BaseCommand):
+    help = 'Compare stored leave balances with approved requests and optionally fix the drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help='Only reconcile balances for this year')
+        parser.add_argument('--fix', action='store_true', help='Recompute the drifting balances')
+        parser.add_argument('--limit', type=int, default=50, help='Maximum drift rows to print (default: 50)')
+
+    def handle(self, *args, **options):
+        year = options.get('year')
+        scope = f'year {year}' if year else 'all years'
+        self.stdout.write(f'Reconciling leave balances for {scope}...')
+        
+        drifts = reconciliation.find_drift(year=year)
+        if not drifts:
+            self.stdout.write(self.style.SUCCESS('All balances match approved requests.'))
+            return
+        
+        self.stdout.write(f'{"Employee":<10} {"Name":<25} {"Leave Type":<12} {"Year":<6} {"Stored":>8} {"Expected":>9} {"Diff":>8}')
+        for drift in drifts[:options['limit']]:
+            stored = 'missing' if drift.missing_balance else drift.stored
+            self.stdout.write(
+                f'{drift.employee_id:<10} {drift.name[:25]:<25} {str(drift.leave_type)[:12]:<12} {drift.year:<6} '
+                f'{stored:>8} {drift.expected:>9} {drift.difference:>+8}'
+            )
+        if len(drifts) > options['limit']:
+            self.stdout.write(f'... and {len(drifts) - options["limit"]} more')
+        
+        self.stdout.write(self.style.WARNING(f'{len(drifts)} balances drift from approved requests.'))
+        
+        if options['fix']:
+            count = reconciliation.fix_drift(drifts, year=year)
+            self.stdout.write(self.style.SUCCESS(f'Recomputed {count} balances.'))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+
+import benchmarks
+
+class Command(BaseCommand):
+    help = 'Time the core leave computations and compare them with the stored baseline (see benchmarks.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filter', action='append', help='Only benchmarks whose name contains this (repeatable)')
+        parser.add_argument('--save', action='store_true', help='Record this run as the new baseline')
+        parser.add_argument('--baseline', default=benchmarks.BASELINE_FILE, help='Baseline file')
+        parser.add_argument('--threshold', type=float, default=benchmarks.DEFAULT_THRESHOLD,
+                            help='Slowdown reported as a regression (0.2 = 20%%)')
+        parser.add_argument('--repeat', type=int, default=benchmarks.REPEAT, help='Timed runs per benchmark')
+        parser.add_argument('--list', action='store_true', help='List the benchmarks and exit')
+
+    def handle(self, *args, **options):
+        # Registers the Django benchmarks
+        from leaves import benchmarks as leave_benchmarks  # noqa: F401
+
+        selected = benchmarks.registered(options['filter'])
+        if options['list']:
+            for bench in selected:
+                self.stdout.write(f'{bench.name:<45} {bench.description}')
+            return
+        if not selected:
+            raise CommandError('No benchmark matches the filter.')
+
+        # A throwaway database, so the benchmarks neither see nor touch real data
+        old_config = setup_databases(verbosity=0, interactive=False, serialized_aliases=set())
+        try:
+            results = benchmarks.run(selected, options['repeat'], log=self.stdout.write)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        baseline = benchmarks.load_baseline(options['baseline'])
+        comparisons = benchmarks.compare(results, baseline, options['threshold'])
+        self.stdout.write('')
+        self.stdout.write(benchmarks.format_comparison(comparisons))
+        if benchmarks.other_machine(results, baseline):
+            self.stdout.write(self.style.WARNING(
+                'Some baselines were recorded on another machine; their changes say little.'
+            ))
+
+        if options['save']:
+            benchmarks.save_run(results, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f'Saved as the baseline in {options["baseline"]}.'))
+            return
+
+        regressions = [row.name for row in comparisons if row.status == 'regression']
+        if regressions:
+            raise CommandError(
+                f'{len(regressions)} benchmark(s) slower than the baseline by more than '
+                f'{options["threshold"]:.0%}: {", ".join(regressions)}'
+            )
+        self.stdout.write(self.style.SUCCESS('No regressions.'))
@@ -0,0 +1,82 @@
+from allauth.account.models import EmailAddress
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+import loadtest
+from leaves.models import UserProfile, LeaveType, LeaveBalance
+
+class Command(BaseCommand):
+    help = 'Create synthetic supervisors and employees for load testing (see loadtest.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--supervisors', type=int, default=5, help='Number of supervisors')
+        parser.add_argument('--employees', type=int, default=8, help='Employees per supervisor')
+        parser.add_argument('--password', help='Password of every load-test account (default: a random one)')
+        parser.add_argument('--users-file', default=loadtest.DEFAULT_USERS_FILE, help='Where to write the accounts for loadtest.py')
+        parser.add_argument('--reset', action='store_true', help='Delete earlier load-test accounts first')
+        parser.add_argument('--allow-non-local', action='store_true',
+                            help='Run although DEBUG is off and the database is not SQLite')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        # Verified accounts with a known password: never in production by accident
+        if not (settings.DEBUG or connection.vendor == 'sqlite' or options['allow_non_local']):
+            raise CommandError(
+                f'Refusing to create load-test accounts in a {connection.vendor} database with DEBUG off; '
+                'use a local database or pass --allow-non-local.'
+            )
+        password = options['password'] or loadtest.generate_password()
+
+        leave_types = list(LeaveType.objects.filter(is_active=True))
+        if not leave_types:
+            raise CommandError('No leave types: run setup_initial_data first.')
+
+        if options['reset']:
+            deleted = User.objects.filter(email__startswith=loadtest.EMAIL_PREFIX).delete()[0]
+            self.stdout.write(f'Deleted {deleted} rows of earlier load-test data.')
+
+        year = timezone.now().year
+        profiles = {}
+        for person in loadtest.synthetic_people(options['supervisors'], options['employees']):
+            user, created = User.objects.get_or_create(
+                username=person['email'],
+                defaults={
+                    'email': person['email'],
+                    'first_name': person['first_name'],
+                    'last_name': person['last_name'],
+                }
+            )
+            user.set_password(password)
+            user.save()
+            # Mandatory e-mail verification would stop the login
+            EmailAddress.objects.update_or_create(
+                user=user, email=user.email, defaults={'verified': True, 'primary': True}
+            )
+
+            profile, created = UserProfile.objects.update_or_create(
+                user=user,
+                defaults={
+                    'employee_id': person['employee_id'],
+                    'position': person['position'],
+                    'department': person['department'],
+                    'starting_date': person['starting_date'],
+                    'gender': person['gender'],
+                    'is_supervisor': person['is_supervisor'],
+                    'supervisor': profiles.get(person['supervisor_email']),
+                }
+            )
+            profiles[person['email']] = profile
+
+            for leave_type in leave_types:
+                LeaveBalance.objects.update_or_create(
+                    user=profile, leave_type=leave_type, year=year,
+                    defaults={'allocated_days': loadtest.ALLOCATED_DAYS, 'used_days': 0, 'carry_over_days': 0}
+                )
+
+        loadtest.write_users_file(options['users_file'], profiles.values(), password)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(profiles)} load-test accounts ready; written with their password to {options["users_file"]}.'
+        ))
@@ -3,7 +3,7 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 from decimal import Decimal
 from datetime import datetime
-from leaves.models import UserProfile, LeaveType, LeaveBalance
+from leaves.models import UserProfile, LeaveType, LeaveBalance, LeavePayTier
 
 class Command(BaseCommand):
     help = 'Set up initial data for leave management system'
@@ -77,6 +77,15 @@ class Command(BaseCommand):
                 self.stdout.write(f'  Created leave type: {leave_type.name}')
             else:
                 self.stdout.write(f'  Leave type already exists: {leave_type.name}')
+        
+        # Sick leave: 12 days at 100%, then 7 days at 50%
+        sick_leave = LeaveType.objects.get(name='Sick')
+        for from_day, to_day, pay_percentage in [(1, 12, Decimal('100.00')), (13, 19, Decimal('50.00'))]:
+            LeavePayTier.objects.get_or_create(
+                leave_type=sick_leave,
+                from_day=from_day,
+                defaults={'to_day': to_day, 'pay_percentage': pay_percentage}
+            )
 
     def create_employees(self):
         """Create employees and their profiles based on provided data"""
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+import os
+import sqlite3
+
+from leaves.routing import REPLICA_DB_ALIAS, replica_configured
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database to the replica SQLite file (local replica testing)'
+
+    def handle(self, *args, **options):
+        if not replica_configured():
+            raise CommandError('No replica configured: set REPLICA_DATABASE_URL.')
+
+        primary = connections['default'].settings_dict
+        replica = connections[REPLICA_DB_ALIAS].settings_dict
+        if 'sqlite' not in primary['ENGINE'] or 'sqlite' not in replica['ENGINE']:
+            raise CommandError('Both databases must be SQLite; real replicas are kept in sync by the database server.')
+
+        if not os.path.exists(primary['NAME']):
+            raise CommandError(f'Primary database {primary["NAME"]} does not exist.')
+
+        connections[REPLICA_DB_ALIAS].close()
+        source = sqlite3.connect(str(primary['NAME']))
+        target = sqlite3.connect(str(replica['NAME']))
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+        self.stdout.write(self.style.SUCCESS(f'Replica {replica["NAME"]} synced from {primary["NAME"]}.'))
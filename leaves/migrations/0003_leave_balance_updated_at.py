@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaves', '0002_leave_request_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leavebalance',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
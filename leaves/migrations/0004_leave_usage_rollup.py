@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_departments(apps, schema_editor):
+    # Best known value for existing requests: the requester's current department
+    LeaveRequest = apps.get_model('leaves', 'LeaveRequest')
+    UserProfile = apps.get_model('leaves', 'UserProfile')
+    LeaveRequest.objects.update(
+        department=models.Subquery(
+            UserProfile.objects.filter(pk=models.OuterRef('user_id')).values('department')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaves', '0003_leave_balance_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leaverequest',
+            name='department',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.RunPython(backfill_departments, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='LeaveUsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('department', models.CharField(max_length=100)),
+                ('year', models.IntegerField()),
+                ('month', models.IntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected'), ('cancelled', 'Cancelled')], max_length=10)),
+                ('total_days', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('request_count', models.IntegerField(default=0)),
+                ('leave_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='leaves.leavetype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['year', 'month', 'status'], name='usage_rollup_period_idx')],
+                'unique_together': {('department', 'leave_type', 'year', 'month', 'status')},
+            },
+        ),
+    ]
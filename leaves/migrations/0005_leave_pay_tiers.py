@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:37
+
+from decimal import Decimal
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+SICK_PAY_TIERS = [
+    (1, 12, Decimal('100.00')),
+    (13, 19, Decimal('50.00')),
+]
+
+
+def create_sick_pay_tiers(apps, schema_editor):
+    LeaveType = apps.get_model('leaves', 'LeaveType')
+    LeavePayTier = apps.get_model('leaves', 'LeavePayTier')
+    for leave_type in LeaveType.objects.filter(name='Sick'):
+        for from_day, to_day, pay_percentage in SICK_PAY_TIERS:
+            LeavePayTier.objects.get_or_create(
+                leave_type=leave_type,
+                from_day=from_day,
+                defaults={'to_day': to_day, 'pay_percentage': pay_percentage},
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaves', '0004_leave_usage_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeavePayTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_day', models.PositiveIntegerField()),
+                ('to_day', models.PositiveIntegerField()),
+                ('pay_percentage', models.DecimalField(decimal_places=2, max_digits=5, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+                ('leave_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pay_tiers', to='leaves.leavetype')),
+            ],
+            options={
+                'ordering': ['leave_type', 'from_day'],
+                'unique_together': {('leave_type', 'from_day')},
+            },
+        ),
+        migrations.RunPython(create_sick_pay_tiers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:41
+
+from django.db import migrations, models
+
+
+TABLE = 'leaves_leavehistory'
+
+
+def _table_objects(cursor, table):
+    """Index and foreign key definitions of a table, to recreate them later"""
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN "
+        "(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p')",
+        [table, table]
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table]
+    )
+    foreign_keys = cursor.fetchall()
+    return indexes, foreign_keys
+
+
+def _rebuild(schema_editor, partitioned):
+    """
+    Recreate leaves_leavehistory as a yearly RANGE-partitioned table on
+    "timestamp" (or back as a plain table), keeping data, indexes and FKs.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    old = f'{TABLE}_old'
+    sequence = f'{TABLE}_part_id_seq' if partitioned else f'{TABLE}_plain_id_seq'
+    with schema_editor.connection.cursor() as cursor:
+        indexes, foreign_keys = _table_objects(cursor, TABLE)
+
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {old}')
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {old} DROP CONSTRAINT "{name}"')
+        # Free the primary key name for the new table
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'",
+            [old]
+        )
+        for (pkey,) in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {old} RENAME CONSTRAINT "{pkey}" TO "{old}_pkey"')
+
+        partition_clause = ' PARTITION BY RANGE ("timestamp")' if partitioned else ''
+        cursor.execute(
+            f'CREATE TABLE {TABLE} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+            f'{partition_clause}'
+        )
+        cursor.execute(f'CREATE SEQUENCE {sequence} OWNED BY {TABLE}.id')
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        if partitioned:
+            # The partition key has to be part of the primary key
+            cursor.execute(f'ALTER TABLE {TABLE} ADD PRIMARY KEY (id, "timestamp")')
+
+            cursor.execute(
+                f'SELECT COALESCE(EXTRACT(YEAR FROM MIN("timestamp")), EXTRACT(YEAR FROM now())), '
+                f'EXTRACT(YEAR FROM now()) FROM {old}'
+            )
+            first_year, current_year = (int(value) for value in cursor.fetchone())
+            for year in range(first_year, current_year + 2):
+                cursor.execute(
+                    f'CREATE TABLE {TABLE}_y{year} PARTITION OF {TABLE} '
+                    f"FOR VALUES FROM ('{year}-01-01 00:00:00+00') TO ('{year + 1}-01-01 00:00:00+00')"
+                )
+            cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+        else:
+            cursor.execute(f'ALTER TABLE {TABLE} ADD PRIMARY KEY (id)')
+
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {old}')
+        cursor.execute(f"SELECT setval('{sequence}', COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)")
+        cursor.execute(f'DROP TABLE {old}')
+
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT "{name}" {definition}')
+
+
+def partition_history(apps, schema_editor):
+    _rebuild(schema_editor, partitioned=True)
+
+
+def unpartition_history(apps, schema_editor):
+    _rebuild(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaves', '0006_calendar_feed_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaveHistoryArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(unique=True)),
+                ('path', models.CharField(max_length=500)),
+                ('row_count', models.IntegerField()),
+                ('sha256', models.CharField(max_length=64)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-year'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='leavehistory',
+            index=models.Index(fields=['leave_request', '-timestamp'], name='leave_hist_request_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leavehistory',
+            index=models.Index(fields=['-timestamp'], name='leave_hist_ts_idx'),
+        ),
+        migrations.RunPython(partition_history, unpartition_history),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+TABLE = 'leaves_leaverequestsearch'
+FTS_TABLE = f'{TABLE}_fts'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f"ALTER TABLE {TABLE} ADD COLUMN search_vector tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('simple', document)) STORED"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX {TABLE}_vector_idx ON {TABLE} USING GIN (search_vector)"
+        )
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                # Falls back to icontains over the document column
+                return
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"document, content='{TABLE}', content_rowid='leave_request_id', "
+            f"tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, document) VALUES (new.leave_request_id, new.document); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, document) "
+            f"VALUES ('delete', old.leave_request_id, old.document); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, document) "
+            f"VALUES ('delete', old.leave_request_id, old.document); "
+            f"INSERT INTO {FTS_TABLE}(rowid, document) VALUES (new.leave_request_id, new.document); END"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f"DROP INDEX IF EXISTS {TABLE}_vector_idx")
+        schema_editor.execute(f"ALTER TABLE {TABLE} DROP COLUMN IF EXISTS search_vector")
+    elif vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def backfill_documents(apps, schema_editor):
+    LeaveRequest = apps.get_model('leaves', 'LeaveRequest')
+    LeaveHistory = apps.get_model('leaves', 'LeaveHistory')
+    LeaveRequestSearch = apps.get_model('leaves', 'LeaveRequestSearch')
+
+    comments = {}
+    for request_id, comment in LeaveHistory.objects.exclude(comments='').order_by('timestamp').values_list('leave_request_id', 'comments'):
+        comments.setdefault(request_id, []).append(comment)
+
+    documents = []
+    for leave_request in LeaveRequest.objects.select_related('user__user').iterator(chunk_size=2000):
+        profile = leave_request.user
+        parts = [
+            profile.user.first_name, profile.user.last_name, profile.employee_id,
+            leave_request.reason, leave_request.supervisor_comments,
+        ] + comments.get(leave_request.pk, [])
+        documents.append(LeaveRequestSearch(
+            leave_request_id=leave_request.pk,
+            document=' '.join(part for part in parts if part),
+        ))
+        if len(documents) >= 2000:
+            LeaveRequestSearch.objects.bulk_create(documents)
+            documents = []
+    LeaveRequestSearch.objects.bulk_create(documents)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaves', '0007_leave_history_partitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaveRequestSearch',
+            fields=[
+                ('leave_request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='leaves.leaverequest')),
+                ('document', models.TextField()),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+    ]
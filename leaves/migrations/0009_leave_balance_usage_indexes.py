@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:46
+
+from django.db import migrations, models
+import django.db.models.expressions
+import django.db.models.functions.comparison
+import django.db.models.lookups
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaves', '0008_leave_request_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='leavebalance',
+            index=models.Index(models.F('year'), django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('allocated_days'), '+', models.F('carry_over_days')), '-', models.F('used_days')), name='leave_bal_available_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leavebalance',
+            index=models.Index(models.F('year'), models.Case(models.When(django.db.models.lookups.GreaterThan(django.db.models.expressions.CombinedExpression(models.F('allocated_days'), '+', models.F('carry_over_days')), 0), then=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('used_days', models.FloatField()), '*', models.Value(100)), '/', django.db.models.functions.comparison.Cast(django.db.models.expressions.CombinedExpression(models.F('allocated_days'), '+', models.F('carry_over_days')), models.FloatField()))), default=models.Value(0.0), output_field=models.FloatField()), name='leave_bal_used_pct_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaves', '0009_leave_balance_usage_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['start_date'], name='leave_req_start_date_idx'),
+        ),
+    ]
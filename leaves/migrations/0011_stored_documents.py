@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:58
+
+from django.db import migrations, models
+import leaves.uploads
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaves', '0010_leave_request_start_date_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='leaverequest',
+            name='supporting_document',
+            field=models.FileField(blank=True, null=True, storage=leaves.uploads.get_document_storage, upload_to='documents/'),
+        ),
+        migrations.CreateModel(
+            name='StoredDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('path', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('preview', models.CharField(blank=True, max_length=255)),
+                ('preview_status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('unsupported', 'Unsupported'), ('failed', 'Failed')], default='pending', max_length=12)),
+                ('preview_error', models.TextField(blank=True)),
+                ('preview_started_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['preview_status', 'created_at'], name='stored_doc_preview_queue_idx')],
+            },
+        ),
+    ]
@@ -1,9 +1,14 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast
+from django.db.models.lookups import GreaterThan
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from decimal import Decimal
 
+from .uploads import get_document_storage
+
 class UserProfile(models.Model):
     """Extended user profile for employee information"""
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -50,6 +55,63 @@ class LeaveType(models.Model):
     def __str__(self):
         return self.name
 
+class LeavePayTier(models.Model):
+    """Tiered pay schedule for a leave type within a calendar year.
+
+    Days from_day..to_day (1-based, inclusive) of the leave taken in a year
+    are paid at pay_percentage. Days beyond the last tier are unpaid. Leave
+    types without tiers are paid at their flat pay_percentage.
+    """
+    leave_type = models.ForeignKey(LeaveType, on_delete=models.CASCADE, related_name='pay_tiers')
+    from_day = models.PositiveIntegerField()
+    to_day = models.PositiveIntegerField()
+    pay_percentage = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        validators=[MinValueValidator(0), MaxValueValidator(100)]
+    )
+    
+    class Meta:
+        ordering = ['leave_type', 'from_day']
+        unique_together = ['leave_type', 'from_day']
+    
+    def __str__(self):
+        return f"{self.leave_type.name}: days {self.from_day}-{self.to_day} at {self.pay_percentage}%"
+
+# Balance figures as SQL expressions, so they can be sorted, filtered and
+# indexed. They must stay in step with the LeaveBalance properties below.
+BALANCE_TOTAL_DAYS = F('allocated_days') + F('carry_over_days')
+BALANCE_AVAILABLE_DAYS = BALANCE_TOTAL_DAYS - F('used_days')
+BALANCE_USED_PERCENTAGE = Case(
+    When(
+        GreaterThan(BALANCE_TOTAL_DAYS, 0),
+        then=Cast('used_days', FloatField()) * 100 / Cast(BALANCE_TOTAL_DAYS, FloatField())
+    ),
+    default=Value(0.0),
+    output_field=FloatField(),
+)
+
+# Orderings accepted from ?sort= on balance pages and the API, and the
+# with_usage() annotations they sort on
+BALANCE_SORTS = {
+    'available_days': 'available_days_db',
+    '-available_days': '-available_days_db',
+    'used_percentage': 'used_percentage_db',
+    '-used_percentage': '-used_percentage_db',
+}
+
+class LeaveBalanceQuerySet(models.QuerySet):
+    def with_usage(self):
+        """
+        Annotate available_days_db and used_percentage_db, computed in the
+        database, for sorting and filtering (the model properties of the
+        same names without _db compute them in Python)
+        """
+        return self.annotate(
+            available_days_db=BALANCE_AVAILABLE_DAYS,
+            used_percentage_db=BALANCE_USED_PERCENTAGE,
+        )
+
 class LeaveBalance(models.Model):
     """Employee's leave balance for each leave type"""
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
@@ -58,9 +120,17 @@ class LeaveBalance(models.Model):
     used_days = models.DecimalField(max_digits=6, decimal_places=2, default=0)
     carry_over_days = models.DecimalField(max_digits=6, decimal_places=2, default=0)
     year = models.IntegerField(default=timezone.now().year)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = LeaveBalanceQuerySet.as_manager()
     
     class Meta:
         unique_together = ['user', 'leave_type', 'year']
+        indexes = [
+            # Serve with_usage() sorts and range filters within a year
+            models.Index('year', BALANCE_AVAILABLE_DAYS, name='leave_bal_available_idx'),
+            models.Index('year', BALANCE_USED_PERCENTAGE, name='leave_bal_used_pct_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.user.get_full_name()} - {self.leave_type.name} ({self.year})"
@@ -103,6 +173,9 @@ class LeaveRequest(models.Model):
     total_days = models.DecimalField(max_digits=6, decimal_places=2)
     reason = models.TextField(blank=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    # Requester's department when the request was made; keys the usage rollup,
+    # so a later department change doesn't move the request between buckets
+    department = models.CharField(max_length=100, blank=True)
     
     # Approval fields
     approved_by = models.ForeignKey(UserProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='approved_requests')
@@ -113,15 +186,27 @@ class LeaveRequest(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
-    # Document upload
-    supporting_document = models.FileField(upload_to='leave_documents/', null=True, blank=True)
+    # Document upload (content-addressed, see leaves.uploads)
+    supporting_document = models.FileField(upload_to='documents/', storage=get_document_storage, null=True, blank=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of request history and approval inboxes
+            models.Index(fields=['user', '-created_at', '-id'], name='leave_req_user_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='leave_req_status_created_idx'),
+            # Admin year filter and date range lookups
+            models.Index(fields=['start_date'], name='leave_req_start_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.user.get_full_name()} - {self.leave_type.name} ({self.start_date} to {self.end_date})"
     
+    def save(self, *args, **kwargs):
+        if not self.department and self.user_id:
+            self.department = self.user.department
+        super().save(*args, **kwargs)
+    
     def can_be_approved_by(self, supervisor):
         """Check if a supervisor can approve this request"""
         return self.user.supervisor == supervisor
@@ -151,10 +236,110 @@ class LeaveHistory(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['leave_request', '-timestamp'], name='leave_hist_request_ts_idx'),
+            models.Index(fields=['-timestamp'], name='leave_hist_ts_idx'),
+        ]
     
     def __str__(self):
         return f"{self.leave_request} - {self.action} by {self.performed_by}"
 
+class StoredDocument(models.Model):
+    """A distinct supporting document file and its preview.
+
+    Files are stored once per content hash (see leaves.uploads), so several
+    requests can point at the same StoredDocument. Previews are generated
+    off the request path by the process_document_previews worker.
+    """
+    PREVIEW_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('unsupported', 'Unsupported'),
+        ('failed', 'Failed'),
+    ]
+    
+    sha256 = models.CharField(max_length=64, unique=True)
+    path = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    content_type = models.CharField(max_length=100, blank=True)
+    preview = models.CharField(max_length=255, blank=True)
+    preview_status = models.CharField(max_length=12, choices=PREVIEW_STATUS_CHOICES, default='pending')
+    preview_error = models.TextField(blank=True)
+    preview_started_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Worker queue scan
+            models.Index(fields=['preview_status', 'created_at'], name='stored_doc_preview_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.path} ({self.size} bytes)"
+
+class LeaveRequestSearch(models.Model):
+    """Full-text search document for a leave request.
+
+    Holds the employee's name and id, the reason, supervisor comments and
+    history comments as one text column, kept current by leaves.search.
+    The actual index lives next to it: a generated tsvector column with a
+    GIN index on PostgreSQL, an FTS5 table on SQLite (migration 0008).
+    """
+    leave_request = models.OneToOneField(LeaveRequest, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    document = models.TextField()
+    
+    def __str__(self):
+        return f"Search document for request {self.leave_request_id}"
+
+class LeaveHistoryArchive(models.Model):
+    """A closed year of LeaveHistory moved out to a compressed archive file"""
+    year = models.IntegerField(unique=True)
+    path = models.CharField(max_length=500)
+    row_count = models.IntegerField()
+    sha256 = models.CharField(max_length=64)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-year']
+    
+    def __str__(self):
+        return f"LeaveHistory {self.year} ({self.row_count} rows)"
+
+class LeaveUsageRollup(models.Model):
+    """Monthly leave usage per department, leave type and status.
+
+    Maintained incrementally whenever a request changes status (see
+    leaves.rollups) and rebuilt with the rebuild_usage_rollup command.
+    Requests are counted in the month they start.
+    """
+    department = models.CharField(max_length=100)
+    leave_type = models.ForeignKey(LeaveType, on_delete=models.CASCADE)
+    year = models.IntegerField()
+    month = models.IntegerField()
+    status = models.CharField(max_length=10, choices=LeaveRequest.STATUS_CHOICES)
+    total_days = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    request_count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['department', 'leave_type', 'year', 'month', 'status']
+        indexes = [
+            models.Index(fields=['year', 'month', 'status'], name='usage_rollup_period_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.department} - {self.leave_type.name} {self.year}-{self.month:02d} ({self.status})"
+
+class CalendarFeedToken(models.Model):
+    """Secret token authenticating an employee's iCalendar feed URLs"""
+    user = models.OneToOneField(UserProfile, on_delete=models.CASCADE, related_name='calendar_feed_token')
+    token = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Calendar feed for {self.user}"
+
 class CompanySettings(models.Model):
     """Company-wide settings for leave management"""
     key = models.CharField(max_length=100, unique=True)
@@ -167,3 +352,29 @@ class CompanySettings(models.Model):
     class Meta:
         verbose_name = "Company Setting"
         verbose_name_plural = "Company Settings"
+
+class SlowQuery(models.Model):
+    """Statements over settings.SLOW_QUERY_MS, aggregated per fingerprint (see leaves.slow_queries)"""
+    digest = models.CharField(max_length=64, unique=True)
+    fingerprint = models.TextField()
+    sample_sql = models.TextField()
+    sample_params = models.JSONField(default=list, blank=True)
+    call_site = models.CharField(max_length=500, blank=True)
+    database = models.CharField(max_length=50)
+    plan = models.TextField(blank=True)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['-total_ms']
+        verbose_name_plural = 'Slow queries'
+    
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.count if self.count else 0
+    
+    def __str__(self):
+        return f"{self.fingerprint[:80]} ({self.count}x)"
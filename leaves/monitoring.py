@@ -0,0 +1,91 @@
+"""
+Django side of the runtime metrics (see metrics.py).
+
+MetricsMiddleware records each request's latency, query count and query
+time under its view name; every database connection gets a query hook as
+it is opened (also in leaves.parallel worker threads), and the document
+preview queue is read at scrape time. The registry is served in
+Prometheus format at /metrics, to staff users or to scrapers presenting
+settings.METRICS_TOKEN as a bearer token.
+"""
+import hmac
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+import metrics
+
+from .models import StoredDocument
+
+def _query_hook(alias):
+    def hook(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics.record_query(alias, time.perf_counter() - started, sql)
+    return hook
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # The wrapper outlives reconnects; only hook it once
+    if not getattr(connection, '_metrics_instrumented', False):
+        connection.execute_wrappers.append(_query_hook(connection.alias))
+        connection._metrics_instrumented = True
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+class MetricsMiddleware:
+    """Latency, query count and query time per view"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with metrics.track_queries() as queries:
+            response = self.get_response(request)
+
+        view = _view_name(request)
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            view=view, method=request.method, status=f'{response.status_code // 100}xx'
+        )
+        metrics.HTTP_REQUEST_QUERIES.observe(queries.count, view=view)
+        metrics.HTTP_REQUEST_DB_SECONDS.observe(queries.seconds, view=view)
+        return response
+
+def _preview_queue():
+    rows = (
+        StoredDocument.objects.filter(preview_status__in=('pending', 'processing'))
+        .order_by().values('preview_status').annotate(count=Count('id'))
+    )
+    counts = {row['preview_status']: row['count'] for row in rows}
+    return [({'status': status}, counts.get(status, 0)) for status in ('pending', 'processing')]
+
+DOCUMENT_PREVIEW_QUEUE = metrics.Gauge(
+    'leave_document_preview_queue', 'Stored documents waiting for or being processed by the preview worker',
+    ('status',), collect=_preview_queue
+)
+
+def _authorized(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+            return True
+    return request.user.is_authenticated and request.user.is_staff
+
+def metrics_view(request):
+    """Prometheus scrape endpoint for this process (or all workers, see metrics.MULTIPROC_DIR)"""
+    if not _authorized(request):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
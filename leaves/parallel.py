@@ -0,0 +1,77 @@
+"""
+Helpers for async views that run independent queries concurrently.
+
+Django 4.2's async ORM methods (aget, acount, ...) all run on one shared
+thread, so awaiting them still runs the queries one after another.
+run_concurrently() offloads each function to its own worker thread (each
+with its own database connection) and waits for all of them, so a page
+costs its slowest query instead of the sum. Only use it for independent
+reads: the threads do not share a transaction.
+
+With settings.CONCURRENT_QUERY_THREADS = 0 the functions run inline, one
+after another on the request's own connection. That is the default on
+SQLite and what the tests use: TestCase keeps its data in a transaction the
+worker threads' connections cannot see.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.db import close_old_connections
+
+from .models import UserProfile
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.CONCURRENT_QUERY_THREADS,
+                thread_name_prefix='leave-query'
+            )
+    return _executor
+
+def _call(func):
+    # Worker threads keep their connections between requests; drop broken
+    # ones and those past CONN_MAX_AGE, as Django does at request boundaries
+    close_old_connections()
+    return func()
+
+async def run_concurrently(*funcs):
+    """Run zero-argument functions in worker threads; returns their results in order"""
+    if not settings.CONCURRENT_QUERY_THREADS:
+        return await sync_to_async(lambda: [func() for func in funcs])()
+
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    # Each call sees the caller's context (e.g. replica routing)
+    return await asyncio.gather(*(
+        loop.run_in_executor(executor, contextvars.copy_context().run, _call, func)
+        for func in funcs
+    ))
+
+async def get_user_profile(request):
+    """The requesting user's profile, or None"""
+    def load():
+        try:
+            return request.user.userprofile
+        except UserProfile.DoesNotExist:
+            return None
+    return await sync_to_async(load)()
+
+def async_login_required(view_func):
+    """login_required for async views (Django 4.2's decorator only wraps sync views)"""
+    @functools.wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+    return wrapper
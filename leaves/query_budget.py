@@ -0,0 +1,55 @@
+"""
+N+1 detection and per-view query budgets for the Django app (see querywatch.py).
+
+Enabled with QUERY_WATCH = 'log' or 'raise' (off by default, and meant for
+development, staging and tests). Each request's queries are fingerprinted;
+statement shapes repeated QUERY_REPEAT_THRESHOLD times, or more queries
+than the view's entry in QUERY_BUDGETS, are logged to the 'querywatch'
+logger or raised as querywatch.QueryBudgetExceeded with the call sites.
+"""
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+import querywatch
+
+def _watch_hook(execute, sql, params, many, context):
+    querywatch.record(sql)
+    return execute(sql, params, many, context)
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Cheap when no watch() block is active: one context variable lookup
+    if not getattr(connection, '_querywatch_instrumented', False):
+        connection.execute_wrappers.append(_watch_hook)
+        connection._querywatch_instrumented = True
+
+def enabled():
+    return getattr(settings, 'QUERY_WATCH', None) in ('log', 'raise')
+
+def budget_for(view_name):
+    return settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+
+class QueryBudgetMiddleware:
+    """Fingerprints each request's queries and reports N+1s and budget overruns"""
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with querywatch.watch(
+            request.path,
+            repeat_threshold=settings.QUERY_REPEAT_THRESHOLD,
+            action=settings.QUERY_WATCH
+        ) as query_log:
+            response = self.get_response(request)
+
+            # The view is only known once the URL has been resolved
+            match = getattr(request, 'resolver_match', None)
+            if match is not None:
+                query_log.name = f'{match.view_name} ({request.method} {request.path})'
+                query_log.budget = budget_for(match.view_name)
+        return response
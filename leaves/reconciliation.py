@@ -0,0 +1,106 @@
+"""
+Reconciliation of stored leave balances against approved requests.
+
+used_days is maintained incrementally on approval, which can drift (a
+missed update, a manual edit, a request approved when no balance row
+existed). The expected value for each (employee, leave type, year) is the
+sum of approved requests charged to that year - the year they were
+approved in, as approval charges them (bulk.CHARGED_YEAR); it is computed
+with one grouped aggregate and diffed in memory against one pass over the
+balances.
+"""
+from django.db.models import Sum
+from decimal import Decimal
+
+from .models import LeaveBalance, LeaveRequest, LeaveType, UserProfile
+from . import bulk
+
+ZERO = Decimal('0')
+
+class BalanceDrift:
+    """One (employee, leave type, year) whose stored used_days is wrong"""
+
+    __slots__ = ('user_id', 'employee_id', 'name', 'leave_type', 'year', 'stored', 'expected', 'balance_id')
+
+    def __init__(self, user_id, employee_id, name, leave_type, year, stored, expected, balance_id=None):
+        self.user_id = user_id
+        self.employee_id = employee_id
+        self.name = name
+        self.leave_type = leave_type
+        self.year = year
+        self.stored = stored
+        self.expected = expected
+        self.balance_id = balance_id
+
+    @property
+    def difference(self):
+        return self.expected - (self.stored or ZERO)
+
+    @property
+    def missing_balance(self):
+        return self.balance_id is None
+
+def expected_used_days(year=None):
+    """{(user_id, leave_type_id, year): days} from one grouped aggregate"""
+    approved = LeaveRequest.objects.filter(status='approved').annotate(charged_year=bulk.CHARGED_YEAR)
+    if year:
+        approved = approved.filter(charged_year=year)
+    rows = (
+        approved.order_by()
+        .values_list('user_id', 'leave_type_id', 'charged_year')
+        .annotate(days=Sum('total_days'))
+    )
+    return {(user_id, leave_type_id, row_year): days for user_id, leave_type_id, row_year, days in rows}
+
+def find_drift(year=None):
+    """Every balance (or missing balance) that disagrees with approved requests"""
+    expected = expected_used_days(year)
+
+    balances = LeaveBalance.objects.all()
+    if year:
+        balances = balances.filter(year=year)
+    stored = {}
+    for balance_id, user_id, leave_type_id, balance_year, used_days in balances.values_list(
+        'id', 'user_id', 'leave_type_id', 'year', 'used_days'
+    ).iterator(chunk_size=5000):
+        stored[(user_id, leave_type_id, balance_year)] = (balance_id, used_days)
+
+    drifted = []
+    for key in expected.keys() | stored.keys():
+        balance_id, used_days = stored.get(key, (None, None))
+        expected_days = expected.get(key, ZERO)
+        if used_days is None or used_days != expected_days:
+            drifted.append((key, balance_id, used_days, expected_days))
+    if not drifted:
+        return []
+
+    # Labels for the report, fetched only for the rows that drifted
+    user_ids = {key[0] for key, balance_id, used_days, expected_days in drifted}
+    profiles = {
+        profile.id: profile
+        for profile in UserProfile.objects.filter(id__in=user_ids).select_related('user')
+    }
+    leave_types = dict(LeaveType.objects.values_list('id', 'name'))
+
+    report = []
+    for (user_id, leave_type_id, drift_year), balance_id, used_days, expected_days in drifted:
+        profile = profiles[user_id]
+        report.append(BalanceDrift(
+            user_id=user_id,
+            employee_id=profile.employee_id,
+            name=profile.user.get_full_name(),
+            leave_type=leave_types.get(leave_type_id, leave_type_id),
+            year=drift_year,
+            stored=used_days,
+            expected=expected_days,
+            balance_id=balance_id,
+        ))
+    report.sort(key=lambda drift: (-abs(drift.difference), drift.employee_id, drift.year))
+    return report
+
+def fix_drift(drifts, year=None):
+    """Recompute the affected employees' balances in bulk; returns rows written"""
+    user_ids = {drift.user_id for drift in drifts}
+    if not user_ids:
+        return 0
+    return bulk.recompute_balances(UserProfile.objects.filter(id__in=user_ids), year=year)
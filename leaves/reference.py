@@ -0,0 +1,67 @@
+"""
+Cached reference data for admin filters.
+
+Departments, leave types and year ranges change rarely but are otherwise
+computed with DISTINCT or MIN/MAX scans over the big fact tables on every
+changelist load. They are read from the small tables instead and cached;
+the signal handlers in leaves.signals drop the cache when those tables
+change.
+"""
+from django.core.cache import cache
+from django.db.models import Max, Min
+
+import metrics
+
+from .models import UserProfile, LeaveType
+
+CACHE_TIMEOUT = 60 * 60
+DEPARTMENTS_KEY = 'leaves:reference:departments'
+LEAVE_TYPES_KEY = 'leaves:reference:leave_types'
+
+def _get_or_set(key, compute):
+    missed = []
+
+    def load():
+        missed.append(True)
+        return compute()
+
+    value = cache.get_or_set(key, load, CACHE_TIMEOUT)
+    metrics.record_cache('admin_reference', not missed)
+    return value
+
+def departments():
+    """Sorted department names, from the employee table"""
+    return _get_or_set(
+        DEPARTMENTS_KEY,
+        lambda: list(
+            UserProfile.objects.order_by('department')
+            .values_list('department', flat=True)
+            .distinct()
+        )
+    )
+
+def leave_types():
+    """[(id, name)] for all leave types"""
+    return _get_or_set(
+        LEAVE_TYPES_KEY,
+        lambda: list(LeaveType.objects.order_by('name').values_list('id', 'name'))
+    )
+
+def years(model, field_name):
+    """Years spanned by a date field (or an integer year column), newest first, from one MIN/MAX"""
+    key = f'leaves:reference:years:{model._meta.label_lower}:{field_name}'
+
+    def compute():
+        bounds = model.objects.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        first, last = (getattr(bounds[bound], 'year', bounds[bound]) for bound in ('first', 'last'))
+        return list(range(last, first - 1, -1))
+
+    return _get_or_set(key, compute)
+
+def invalidate_departments():
+    cache.delete(DEPARTMENTS_KEY)
+
+def invalidate_leave_types():
+    cache.delete(LEAVE_TYPES_KEY)
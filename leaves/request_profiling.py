@@ -0,0 +1,78 @@
+"""
+Django side of on-demand profiling (see profiling.py).
+
+Staff users profile a single request by sending an "X-Profile" header or
+a "_profile" query parameter ("1" or "sample" for a sampling profile,
+"cprofile" for cProfile). The profile is stored in settings.PROFILE_DIR
+and the response carries its id and download URL; other requests pass
+straight through. Profiles are listed at /profiles/ and downloaded from
+/profiles/<id>.<json|folded|prof>, both staff only.
+"""
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.urls import reverse
+
+import profiling
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = '_profile'
+
+def _requested_mode(request):
+    value = request.META.get(PROFILE_HEADER) or request.GET.get(PROFILE_PARAM)
+    if not value:
+        return None
+    return 'cprofile' if value.lower() == 'cprofile' else 'sample'
+
+def _is_staff(request):
+    return request.user.is_authenticated and request.user.is_staff
+
+class ProfilingMiddleware:
+    """Profiles the request when a staff user asks for it"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = _requested_mode(request)
+        if mode is None or not _is_staff(request):
+            return self.get_response(request)
+
+        with profiling.capture(
+            f'{request.method} {request.path}',
+            directory=settings.PROFILE_DIR,
+            mode=mode,
+            interval=settings.PROFILE_SAMPLE_INTERVAL,
+            keep=settings.PROFILE_KEEP
+        ) as profile:
+            response = self.get_response(request)
+
+        kind = 'prof' if mode == 'cprofile' else 'folded'
+        response['X-Profile-Id'] = profile.id
+        response['X-Profile-Url'] = request.build_absolute_uri(
+            reverse('leaves:profile_download', args=[profile.id, kind])
+        )
+        return response
+
+def profile_list(request):
+    """Stored profiles, newest first"""
+    if not _is_staff(request):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    profiles = profiling.list_profiles(settings.PROFILE_DIR)
+    for summary in profiles:
+        summary['downloads'] = {
+            kind: request.build_absolute_uri(reverse('leaves:profile_download', args=[summary['id'], kind]))
+            for kind in summary['files']
+        }
+    return JsonResponse({'profiles': profiles})
+
+def profile_download(request, profile_id, kind):
+    """One stored profile file, as an attachment"""
+    if not _is_staff(request):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    path = profiling.profile_file(profile_id, kind, settings.PROFILE_DIR)
+    if path is None:
+        return HttpResponse('Not found', status=404, content_type='text/plain')
+    return FileResponse(
+        open(path, 'rb'), as_attachment=True,
+        filename=f'{profile_id}.{kind}', content_type=profiling.FILE_KINDS[kind]
+    )
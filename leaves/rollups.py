@@ -0,0 +1,128 @@
+"""
+Incremental maintenance of the monthly LeaveUsageRollup table.
+
+Callers record a status change inside the same transaction that saves the
+request, so the rollup never disagrees with the committed request rows.
+Requests are bucketed by the department stored on them when they were
+made, so a later department change leaves the buckets consistent.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+from decimal import Decimal
+
+from .models import LeaveRequest, LeaveUsageRollup
+
+def _bucket(leave_request, status):
+    return {
+        'department': leave_request.department,
+        'leave_type_id': leave_request.leave_type_id,
+        'year': leave_request.start_date.year,
+        'month': leave_request.start_date.month,
+        'status': status,
+    }
+
+def _adjust(bucket, days, count):
+    """Add days/count to a rollup row, creating it if needed"""
+    updated = LeaveUsageRollup.objects.filter(**bucket).update(
+        total_days=F('total_days') + days,
+        request_count=F('request_count') + count,
+    )
+    if updated:
+        return
+
+    try:
+        # Savepoint so a concurrent insert doesn't break the outer transaction
+        with transaction.atomic():
+            LeaveUsageRollup.objects.create(total_days=days, request_count=count, **bucket)
+    except IntegrityError:
+        LeaveUsageRollup.objects.filter(**bucket).update(
+            total_days=F('total_days') + days,
+            request_count=F('request_count') + count,
+        )
+
+def record_status_change(leave_request, old_status, new_status):
+    """
+    Move a request between rollup buckets.
+
+    Pass old_status=None for a newly created request.
+    """
+    if old_status == new_status:
+        return
+
+    days = Decimal(leave_request.total_days)
+    if old_status:
+        _adjust(_bucket(leave_request, old_status), -days, -1)
+    if new_status:
+        _adjust(_bucket(leave_request, new_status), days, 1)
+
+def record_bulk_status_change(queryset, old_status, new_status):
+    """
+    Move every request in queryset (all currently in old_status) to
+    new_status, with one grouped aggregate and one adjustment per bucket.
+
+    Call before the requests themselves are updated.
+    """
+    rows = (
+        queryset.order_by()
+        .annotate(year=ExtractYear('start_date'), month=ExtractMonth('start_date'))
+        .values('department', 'leave_type_id', 'year', 'month')
+        .annotate(total=Sum('total_days'), count=Count('id'))
+    )
+    for row in rows:
+        bucket = {
+            'department': row['department'],
+            'leave_type_id': row['leave_type_id'],
+            'year': row['year'],
+            'month': row['month'],
+        }
+        _adjust(dict(bucket, status=old_status), -row['total'], -row['count'])
+        _adjust(dict(bucket, status=new_status), row['total'], row['count'])
+
+def rebuild(year=None):
+    """
+    Recompute the rollup from LeaveRequest with one grouped aggregate.
+
+    Returns the number of rollup rows written.
+    """
+    requests = LeaveRequest.objects.all()
+    rollups = LeaveUsageRollup.objects.all()
+    if year:
+        requests = requests.filter(start_date__year=year)
+        rollups = rollups.filter(year=year)
+
+    rows = (
+        requests.order_by()
+        .annotate(year=ExtractYear('start_date'), month=ExtractMonth('start_date'))
+        .values('department', 'leave_type_id', 'year', 'month', 'status')
+        .annotate(total=Sum('total_days'), count=Count('id'))
+    )
+
+    with transaction.atomic():
+        rollups.delete()
+        objs = [
+            LeaveUsageRollup(
+                department=row['department'],
+                leave_type_id=row['leave_type_id'],
+                year=row['year'],
+                month=row['month'],
+                status=row['status'],
+                total_days=row['total'],
+                request_count=row['count'],
+            )
+            for row in rows.iterator()
+        ]
+        LeaveUsageRollup.objects.bulk_create(objs, batch_size=1000)
+
+    return len(objs)
+
+def monthly_usage(year, month, departments=None, status='approved'):
+    """Total days and request count for a month, read from the rollup"""
+    rollups = LeaveUsageRollup.objects.filter(year=year, month=month, status=status)
+    if departments is not None:
+        rollups = rollups.filter(department__in=departments)
+    totals = rollups.aggregate(total_days=Sum('total_days'), request_count=Sum('request_count'))
+    return {
+        'total_days': totals['total_days'] or Decimal('0'),
+        'request_count': totals['request_count'] or 0,
+    }
@@ -0,0 +1,148 @@
+"""
+Read/write database routing.
+
+Writes always go to the primary ('default'). Reads go to the primary too,
+except inside views and commands marked with replica_reads (dashboards,
+reports, exports), which read from the 'replica' alias when
+REPLICA_DATABASE_URL is configured. Reads that could observe a write made
+in the same request, or that run inside a transaction, stay on the primary.
+
+Read-your-writes: after a request that changed data, the user's reads
+stick to the primary for REPLICA_PIN_SECONDS (a cookie set by
+ReplicaRoutingMiddleware), long enough for the replica to catch up.
+"""
+from contextlib import contextmanager
+import asyncio
+import contextvars
+import functools
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+PIN_COOKIE = 'db_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+class _RoutingState:
+    def __init__(self, pinned=False):
+        self.replica = False
+        self.pinned = pinned
+        self.wrote = False
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+@contextmanager
+def reading_from_replica():
+    """Send reads in the block to the replica (unless pinned to the primary)"""
+    state = _state.get()
+    token = None
+    if state is None:
+        state = _RoutingState()
+        token = _state.set(state)
+    previous = state.replica
+    state.replica = True
+    try:
+        yield
+    finally:
+        state.replica = previous
+        if token is not None:
+            _state.reset(token)
+
+def replica_reads(view_func):
+    """Decorator for read-only views and commands that tolerate replication lag"""
+    if asyncio.iscoroutinefunction(view_func):
+        @functools.wraps(view_func)
+        async def async_wrapper(*args, **kwargs):
+            with reading_from_replica():
+                return await view_func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(view_func)
+    def wrapper(*args, **kwargs):
+        with reading_from_replica():
+            return view_func(*args, **kwargs)
+    return wrapper
+
+def iter_from_replica(iterable):
+    """
+    Consume a lazily evaluated response body (e.g. a streamed export) on the
+    replica. The body is read after the view returns, so the request's
+    stickiness is captured now.
+    """
+    current = _state.get()
+    pinned = current is not None and (current.pinned or current.wrote)
+
+    def stream():
+        token = _state.set(_RoutingState(pinned=pinned))
+        try:
+            with reading_from_replica():
+                yield from iterable
+        finally:
+            _state.reset(token)
+    return stream()
+
+def pin_to_primary(response, seconds=None):
+    """Keep this client's reads on the primary for a while"""
+    seconds = settings.REPLICA_PIN_SECONDS if seconds is None else seconds
+    response.set_cookie(
+        PIN_COOKIE, str(int(time.time() + seconds)),
+        max_age=seconds, httponly=True, samesite='Lax'
+    )
+
+def _is_pinned(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+class PrimaryReplicaRouter:
+    """Database router: writes to the primary, marked reads to the replica"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (
+            state is not None and state.replica and not state.pinned and not state.wrote
+            and replica_configured()
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Later reads in this request must see the write
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+class ReplicaRoutingMiddleware:
+    """Per-request routing state and read-your-writes stickiness"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_configured():
+            return self.get_response(request)
+
+        state = _RoutingState(pinned=_is_pinned(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote or request.method not in SAFE_METHODS:
+            pin_to_primary(response)
+        return response
@@ -0,0 +1,141 @@
+"""
+Full-text search over leave requests and their history.
+
+Each request has one LeaveRequestSearch row whose document concatenates the
+employee's name and employee id, the reason, supervisor comments and the
+comments of its history entries. The row is rewritten whenever any of those
+change (see leaves.signals), and the database indexes it natively:
+
+- PostgreSQL: a generated ``search_vector`` tsvector column with a GIN index
+- SQLite: an external-content FTS5 table kept in sync by triggers
+- anything else: a plain icontains over the single document column
+
+Searches are expressed as a subquery of matching request ids, so they can be
+combined with any other filter or ordering without materializing ids.
+"""
+from django.db import connection
+from django.db.models.expressions import RawSQL
+import re
+
+from .models import LeaveRequest, LeaveHistory, LeaveRequestSearch
+
+SEARCH_TABLE = LeaveRequestSearch._meta.db_table
+FTS_TABLE = f'{SEARCH_TABLE}_fts'
+TS_CONFIG = 'simple'
+INDEX_BATCH_SIZE = 2000
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+def build_document(leave_request, history_comments=()):
+    """Text indexed for one request (expects user__user to be loaded)"""
+    profile = leave_request.user
+    parts = [
+        profile.user.first_name,
+        profile.user.last_name,
+        profile.employee_id,
+        leave_request.reason,
+        leave_request.supervisor_comments,
+    ]
+    parts.extend(history_comments)
+    return ' '.join(part for part in parts if part)
+
+def _history_comments(request_ids):
+    comments = {}
+    rows = (
+        LeaveHistory.objects.filter(leave_request_id__in=request_ids)
+        .exclude(comments='')
+        .order_by('timestamp')
+        .values_list('leave_request_id', 'comments')
+    )
+    for request_id, comment in rows:
+        comments.setdefault(request_id, []).append(comment)
+    return comments
+
+def index_requests(queryset):
+    """(Re)build search documents for the requests in queryset, in batches"""
+    queryset = queryset.select_related('user__user').order_by('pk')
+    indexed = 0
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:INDEX_BATCH_SIZE])
+        if not batch:
+            break
+        comments = _history_comments([leave_request.pk for leave_request in batch])
+        LeaveRequestSearch.objects.bulk_create(
+            [
+                LeaveRequestSearch(
+                    leave_request_id=leave_request.pk,
+                    document=build_document(leave_request, comments.get(leave_request.pk, ())),
+                )
+                for leave_request in batch
+            ],
+            update_conflicts=True,
+            unique_fields=['leave_request'],
+            update_fields=['document'],
+        )
+        indexed += len(batch)
+        last_pk = batch[-1].pk
+        if len(batch) < INDEX_BATCH_SIZE:
+            # A short batch is the last one; skip the empty query
+            break
+    return indexed
+
+def index_request(request_id):
+    return index_requests(LeaveRequest.objects.filter(pk=request_id))
+
+def rebuild():
+    """Reindex every request; returns the number of documents written"""
+    LeaveRequestSearch.objects.exclude(leave_request__in=LeaveRequest.objects.all()).delete()
+    return index_requests(LeaveRequest.objects.all())
+
+# Querying
+def tokenize(text):
+    return TOKEN_RE.findall(text or '')
+
+def matching_request_ids(text):
+    """
+    Subquery expression selecting ids of requests matching every word of
+    text (as prefixes), or None if text has no searchable words.
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        return None
+
+    if connection.vendor == 'postgresql':
+        query = ' & '.join(f'{token}:*' for token in tokens)
+        return RawSQL(
+            f'SELECT leave_request_id FROM {SEARCH_TABLE} '
+            f'WHERE search_vector @@ to_tsquery(%s, %s)',
+            [TS_CONFIG, query]
+        )
+    if connection.vendor == 'sqlite' and fts_available():
+        query = ' '.join(f'"{token}"*' for token in tokens)
+        return RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [query])
+
+    matches = LeaveRequestSearch.objects.all()
+    for token in tokens:
+        matches = matches.filter(document__icontains=token)
+    return matches.values('leave_request_id')
+
+def search_requests(queryset, text):
+    """Narrow a LeaveRequest queryset to requests matching text"""
+    ids = matching_request_ids(text)
+    if ids is None:
+        return queryset
+    return queryset.filter(pk__in=ids)
+
+def search_history(queryset, text):
+    """Narrow a LeaveHistory queryset to entries of matching requests"""
+    ids = matching_request_ids(text)
+    if ids is None:
+        return queryset
+    return queryset.filter(leave_request_id__in=ids)
+
+_fts_available = None
+
+def fts_available():
+    """Whether the SQLite FTS5 table exists (created by migration 0008)"""
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = FTS_TABLE in connection.introspection.table_names()
+    return _fts_available
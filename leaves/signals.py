@@ -0,0 +1,105 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import UserProfile, LeaveType, LeaveRequest, LeaveHistory
+from . import ical, search, reference, documents
+from leave_service.django_store import service as leave_service
+
+@receiver(post_save, sender=LeaveRequest)
+@receiver(post_delete, sender=LeaveRequest)
+def invalidate_request_feeds(sender, instance, **kwargs):
+    """Drop cached calendar feeds that include this request"""
+    scopes = [ical.user_scope(instance.user_id)]
+    supervisor_id = UserProfile.objects.filter(pk=instance.user_id).values_list('supervisor_id', flat=True).first()
+    if supervisor_id:
+        scopes.append(ical.team_scope(supervisor_id))
+    ical.invalidate(*scopes)
+
+@receiver(pre_save, sender=UserProfile)
+def remember_supervisor(sender, instance, update_fields=None, **kwargs):
+    # A team move changes the old supervisor's feed too
+    instance._previous_supervisor_id = None
+    if instance.pk and (update_fields is None or 'supervisor' in update_fields):
+        instance._previous_supervisor_id = (
+            UserProfile.objects.filter(pk=instance.pk).values_list('supervisor_id', flat=True).first()
+        )
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_profile_feeds(sender, instance, **kwargs):
+    """Names, activity and reporting lines all show up in feeds"""
+    scopes = [ical.user_scope(instance.pk)]
+    for supervisor_id in {instance.supervisor_id, getattr(instance, '_previous_supervisor_id', None)}:
+        if supervisor_id:
+            scopes.append(ical.team_scope(supervisor_id))
+    ical.invalidate(*scopes)
+
+# Feeds show employee names and leave type names
+FEED_USER_FIELDS = {'first_name', 'last_name'}
+
+@receiver(post_save, sender=User)
+def invalidate_user_feeds(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not FEED_USER_FIELDS & set(update_fields)):
+        return
+    profile = UserProfile.objects.filter(user=instance).values_list('pk', 'supervisor_id').first()
+    if profile is None:
+        return
+    profile_id, supervisor_id = profile
+    scopes = [ical.user_scope(profile_id)]
+    if supervisor_id:
+        scopes.append(ical.team_scope(supervisor_id))
+    ical.invalidate(*scopes)
+
+@receiver(post_save, sender=LeaveType)
+def invalidate_leave_type_feeds(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'name' not in update_fields):
+        return
+    ical.invalidate(*ical.request_scopes(
+        LeaveRequest.objects.filter(leave_type=instance, status__in=ical.FEED_STATUSES)
+    ))
+
+# Search index maintenance
+SEARCHED_USER_FIELDS = {'first_name', 'last_name'}
+
+@receiver(post_save, sender=LeaveRequest)
+def index_request(sender, instance, **kwargs):
+    search.index_request(instance.pk)
+
+@receiver(post_save, sender=LeaveHistory)
+def index_history(sender, instance, **kwargs):
+    if instance.comments:
+        search.index_request(instance.leave_request_id)
+
+@receiver(post_save, sender=UserProfile)
+def index_profile_requests(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'employee_id' not in update_fields):
+        return
+    search.index_requests(LeaveRequest.objects.filter(user=instance))
+
+@receiver(post_save, sender=User)
+def index_user_requests(sender, instance, created, update_fields=None, **kwargs):
+    # Logins save last_login only; skip those
+    if created or (update_fields is not None and not SEARCHED_USER_FIELDS & set(update_fields)):
+        return
+    search.index_requests(LeaveRequest.objects.filter(user__user=instance))
+
+# Cached reference data for admin filters
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_departments(sender, **kwargs):
+    reference.invalidate_departments()
+
+@receiver(post_save, sender=LeaveType)
+@receiver(post_delete, sender=LeaveType)
+def invalidate_leave_types(sender, **kwargs):
+    reference.invalidate_leave_types()
+    leave_service().invalidate_reference()
+
+# Supporting documents: one StoredDocument per distinct file, queued for a preview
+@receiver(post_save, sender=LeaveRequest)
+def register_document(sender, instance, update_fields=None, **kwargs):
+    if not instance.supporting_document:
+        return
+    if update_fields is not None and 'supporting_document' not in update_fields:
+        return
+    documents.register(instance.supporting_document.name)
@@ -0,0 +1,83 @@
+"""
+Django side of the slow-query log (see slowlog.py).
+
+Every database connection gets a timing hook as it is opened; statements
+slower than settings.SLOW_QUERY_MS are explained on the same connection
+and aggregated per fingerprint into SlowQuery rows, listed in the admin.
+SLOW_QUERY_MS = 0 turns it off (no hook is installed).
+"""
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.dispatch import receiver
+
+import slowlog
+
+from .models import SlowQuery
+
+def store(entry):
+    """Add a slow statement to its fingerprint's SlowQuery row"""
+    # Runs on the recorder's writer thread, which keeps its connection
+    close_old_connections()
+    fields = {
+        'sample_sql': entry.sql,
+        'sample_params': entry.params,
+        'call_site': entry.call_site[:500],
+        'database': entry.database,
+        'last_seen': entry.seen_at,
+    }
+    if entry.plan is not None:
+        fields['plan'] = entry.plan
+    for _ in range(2):
+        updated = SlowQuery.objects.filter(digest=entry.digest).update(
+            count=F('count') + 1,
+            total_ms=F('total_ms') + entry.ms,
+            max_ms=Greatest('max_ms', Value(entry.ms)),
+            **fields
+        )
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                SlowQuery.objects.create(
+                    digest=entry.digest, fingerprint=entry.fingerprint, count=1,
+                    total_ms=entry.ms, max_ms=entry.ms, first_seen=entry.seen_at, **fields
+                )
+            return
+        except IntegrityError:
+            # Another process created the row first; add to it instead
+            continue
+
+recorder = slowlog.Recorder(
+    store, threshold_ms=settings.SLOW_QUERY_MS, analyze=settings.SLOW_QUERY_EXPLAIN_ANALYZE
+)
+
+def _explain(connection, statement, params):
+    # In a savepoint, so that a failing EXPLAIN leaves the caller's transaction usable
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            # The backend cursor skips the execute wrappers (metrics, N+1 watch)
+            cursor.cursor.execute(statement, params)
+            return cursor.fetchall()
+
+def _slow_query_hook(connection):
+    def hook(execute, sql, params, many, context):
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        if not many:
+            recorder.observe(
+                connection.vendor, sql, params, time.perf_counter() - started, connection.alias,
+                lambda statement: _explain(connection, statement, params)
+            )
+        return result
+    return hook
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if settings.SLOW_QUERY_MS and not getattr(connection, '_slowlog_instrumented', False):
+        connection.execute_wrappers.append(_slow_query_hook(connection))
+        connection._slowlog_instrumented = True
@@ -1,3 +1,1429 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections, router as db_router
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from sqlalchemy import Column, MetaData, Table, create_engine, inspect, text
+
+from leave_service import LeaveService, NotAllowed, ServiceError
+from leave_service.django_store import DjangoStore, service as leave_service
+from leave_service.sqlalchemy_store import SQLAlchemyStore
+import database
+import schema_migrations
+import slowlog
+import snapshots
+
+from .models import LeaveBalance, LeaveHistory, LeaveHistoryArchive, LeavePayTier, LeaveRequest, LeaveType, LeaveUsageRollup, SlowQuery, UserProfile
+from .payroll import PaySchedule, compute_payroll
+from .pagination import InvalidCursor, decode_cursor, paginate_keyset
+from . import bulk, ical, parallel, reconciliation, rollups, routing, search, slow_queries
+from . import history as leave_history
+import metrics
+import profiling
+import querywatch
+
+def make_profile(email, supervisor=None, department='Engineering', **fields):
+    user = User.objects.create_user(email, email, password='password', first_name=email.split('@')[0], last_name='Test')
+    return UserProfile.objects.create(
+        user=user,
+        employee_id=fields.pop('employee_id', f'E{User.objects.count():04d}'),
+        position=fields.pop('position', 'Engineer'),
+        department=department,
+        starting_date=fields.pop('starting_date', date(2020, 1, 1)),
+        gender=fields.pop('gender', 'Female'),
+        supervisor=supervisor,
+        **fields
+    )
+
+def make_request(profile, leave_type, start_date, days=1, status='pending', **fields):
+    return LeaveRequest.objects.create(
+        user=profile,
+        leave_type=leave_type,
+        start_date=start_date,
+        end_date=start_date + timedelta(days=days - 1),
+        total_days=Decimal(days),
+        status=status,
+        **fields
+    )
+
+# Pages whose templates are not part of the repository, rendered the way the
+# real ones use their context
+PAGE_TEMPLATES = {
+    'leaves/supervisor_dashboard.html': (
+        '{% for r in pending_requests %}{{ r.user.user.get_full_name }} {{ r.leave_type.name }}{% endfor %}'
+        '{% for r in all_requests %}{{ r.user.user.get_full_name }} {{ r.leave_type.name }}{% endfor %}'
+        '{% for entry in team_summary %}{{ entry.employee.user.get_full_name }}'
+        '{% for b in entry.balances %}{{ b.leave_type.name }} {{ b.available_days }}{% endfor %}{% endfor %}'
+        '{{ team_usage.total_days }}'
+    ),
+    'leaves/leave_balance.html': (
+        '{% for b in leave_balances %}{{ b.leave_type.name }} {{ b.available_days }} {{ b.used_percentage }}{% endfor %}'
+    ),
+    'leaves/request_detail.html': (
+        '{{ leave_request.user.user.get_full_name }} {{ leave_request.leave_type.name }}'
+        '{% for entry in history %}{{ entry.performed_by.user.get_full_name }} {{ entry.comments }}{% endfor %}'
+        '{% for entry in archived_history %}{{ entry.action }} {{ entry.comments }}{% endfor %}'
+    ),
+    'leaves/approve_request.html': '{{ leave_request.user.user.get_full_name }} {{ leave_request.leave_type.name }}',
+    'leaves/reject_request.html': '{{ leave_request.user.user.get_full_name }} {{ leave_request.leave_type.name }}',
+    'leaves/cancel_request.html': '{{ leave_request.leave_type.name }}',
+}
+
+def page_templates():
+    options = dict(settings.TEMPLATES[0]['OPTIONS'])
+    options['loaders'] = [
+        ('django.template.loaders.locmem.Loader', PAGE_TEMPLATES),
+        'django.template.loaders.app_directories.Loader',
+    ]
+    return [{**settings.TEMPLATES[0], 'APP_DIRS': False, 'OPTIONS': options}]
+
+# TestCase data lives in an uncommitted transaction: the async views' queries
+# have to run on the test's own connection to see it
+@override_settings(CONCURRENT_QUERY_THREADS=0)
+class LeaveTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.year = timezone.now().year
+        cls.pto = LeaveType.objects.create(name='PTO')
+        cls.sick = LeaveType.objects.create(name='Sick')
+        cls.supervisor = make_profile('boss@tempo.fit', is_supervisor=True)
+        cls.employee = make_profile('worker@tempo.fit', supervisor=cls.supervisor)
+
+    def setUp(self):
+        # Leave types are cached per process; ids repeat across test classes
+        leave_service().invalidate_reference()
+
+    def balance(self, profile, leave_type, year):
+        return LeaveBalance.objects.filter(user=profile, leave_type=leave_type, year=year).first()
+
+class KeysetPaginationTests(LeaveTestCase):
+    def setUp(self):
+        super().setUp()
+        # Pairs share a created_at, so pages must break ties on the id
+        created_at = timezone.now()
+        self.requests = []
+        for index in range(7):
+            leave_request = make_request(self.employee, self.pto, date(self.year, 3, 2) + timedelta(days=index))
+            LeaveRequest.objects.filter(pk=leave_request.pk).update(created_at=created_at - timedelta(hours=index // 2))
+            self.requests.append(leave_request)
+
+    def pages(self, page_size):
+        queryset = LeaveRequest.objects.all()
+        page = paginate_keyset(queryset, page_size=page_size)
+        pages = [[leave_request.pk for leave_request in page]]
+        while page.has_next:
+            page = paginate_keyset(queryset, page.next_cursor, page_size)
+            pages.append([leave_request.pk for leave_request in page])
+        return pages
+
+    def test_walks_every_row_once_newest_first(self):
+        pages = self.pages(page_size=3)
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        stored = LeaveRequest.objects.all()
+        newest_first = sorted(stored, key=lambda leave_request: (leave_request.created_at, leave_request.pk), reverse=True)
+        self.assertEqual([pk for page in pages for pk in page], [leave_request.pk for leave_request in newest_first])
+
+    def test_exact_fit_has_no_next_page(self):
+        page = paginate_keyset(LeaveRequest.objects.all(), page_size=7)
+        self.assertEqual(len(page), 7)
+        self.assertFalse(page.has_next)
+
+    def test_invalid_cursors(self):
+        for cursor in ('not a cursor', 'bm90LWEtZGF0ZXwx'):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+
+        self.client.force_login(self.employee.user)
+        self.assertEqual(self.client.get(reverse('leaves:api_request_list'), {'cursor': 'bad'}).status_code, 400)
+        dashboard = self.client.get(reverse('leaves:employee_dashboard'), {'cursor': 'bad'})
+        self.assertEqual(len(dashboard.context['recent_requests']), 7)
+
+class ApiConditionalGetTests(LeaveTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.request = make_request(self.employee, self.pto, date(self.year, 9, 7))
+
+    def get(self, profile, url, **headers):
+        self.client.force_login(profile.user)
+        return self.client.get(url, **headers)
+
+    def test_permission_is_checked_before_conditional_headers(self):
+        url = reverse('leaves:api_request_detail', args=[self.request.pk])
+        etag = self.get(self.employee, url)['ETag']
+        stranger = make_profile('stranger@tempo.fit')
+
+        response = self.get(stranger, url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('ETag', response)
+        self.assertEqual(self.get(stranger, reverse('leaves:api_team_summary')).status_code, 403)
+
+    def test_unchanged_resource_answers_304(self):
+        url = reverse('leaves:api_request_list')
+        first = self.get(self.employee, url)
+
+        self.assertEqual(self.get(self.employee, url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(self.get(self.employee, url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+
+    def test_related_changes_invalidate_etag(self):
+        url = reverse('leaves:api_request_list')
+        etag = self.get(self.employee, url)['ETag']
+
+        self.pto.name = 'Paid time off'
+        self.pto.save()
+
+        response = self.get(self.employee, url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['leave_type'], 'Paid time off')
+
+    def test_team_member_leaving_is_seen_by_if_modified_since(self):
+        url = reverse('leaves:api_team_summary')
+        first = self.get(self.supervisor, url)
+        self.assertEqual(len(first.json()['results']), 1)
+
+        self.employee.supervisor = None
+        self.employee.save()
+
+        response = self.get(self.supervisor, url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+class UsageRollupTests(LeaveTestCase):
+    def rollup(self):
+        return sorted(
+            LeaveUsageRollup.objects.exclude(request_count=0)
+            .values_list('department', 'status', 'total_days', 'request_count')
+        )
+
+    def test_department_change_keeps_buckets_consistent(self):
+        start = timezone.now().date() + timedelta(days=7)
+        leave_request = leave_service().create_request(self.employee.pk, self.pto.pk, start, start + timedelta(days=2))
+
+        self.employee.department = 'Sales'
+        self.employee.save()
+        leave_service().approve(leave_request.pk, self.supervisor.pk)
+
+        self.assertEqual(self.rollup(), [('Engineering', 'approved', Decimal('3'), 1)])
+        self.assertFalse(LeaveUsageRollup.objects.filter(department='Sales').exists())
+        rollups.rebuild()
+        self.assertEqual(self.rollup(), [('Engineering', 'approved', Decimal('3'), 1)])
+
+    def test_bulk_transition_moves_buckets(self):
+        start = timezone.now().date() + timedelta(days=7)
+        for offset in range(3):
+            leave_service().create_request(self.employee.pk, self.sick.pk, start + timedelta(days=offset), start + timedelta(days=offset))
+
+        bulk.transition_requests(LeaveRequest.objects.all(), 'rejected', self.supervisor)
+
+        self.assertEqual(self.rollup(), [('Engineering', 'rejected', Decimal('3'), 3)])
+
+    def test_team_usage_is_team_scoped(self):
+        other_team = make_profile('other@tempo.fit', supervisor=make_profile('lead@tempo.fit', is_supervisor=True))
+        month_start = date(self.year, 4, 1)
+        for profile in (self.employee, other_team):
+            make_request(profile, self.pto, month_start, days=2, status='approved')
+        make_request(self.employee, self.pto, date(self.year, 5, 1), status='approved')
+
+        usage = leave_service().team_monthly_usage(self.supervisor.pk, self.year, 4)
+
+        self.assertEqual(usage, {'total_days': Decimal('2'), 'request_count': 1})
+
+class SQLAlchemyTestCase(SimpleTestCase):
+    """Runs the Streamlit-side modules against a fresh SQLite file per test"""
+    create_schema = True
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.engine = create_engine(f'sqlite:///{directory.name}/leave.db')
+        self.addCleanup(self.engine.dispose)
+        # Modules that imported the engine by name
+        for module in (database, schema_migrations, snapshots):
+            self.enterContext(mock.patch.object(module, 'engine', self.engine))
+        self.enterContext(mock.patch.object(database, 'replica_engine', self.engine))
+        if self.create_schema:
+            database.Base.metadata.create_all(self.engine)
+
+    def session(self):
+        return database.SessionLocal(expire_on_commit=False)
+
+    def add_profile(self, db, email, supervisor_id=None, department='Engineering', **fields):
+        user = database.User(email=email, first_name=email.split('@')[0], last_name='Test')
+        db.add(user)
+        db.flush()
+        profile = database.UserProfile(
+            user_id=user.id, employee_id=fields.pop('employee_id', f'E{user.id:04d}'), position='Engineer',
+            department=department, starting_date=date(2020, 1, 1), gender='Female',
+            supervisor_id=supervisor_id, **fields
+        )
+        db.add(profile)
+        db.flush()
+        return profile
+
+class SnapshotTests(SQLAlchemyTestCase):
+    fmt = 'arrow'
+
+    def setUp(self):
+        super().setUp()
+        self.root = os.path.join(self.directory, 'snapshots')
+        with self.session() as db:
+            employee = self.add_profile(db, 'worker@tempo.fit')
+            pto = database.LeaveType(name='PTO')
+            db.add(pto)
+            db.flush()
+            for year in (2024, 2025):
+                db.add(database.LeaveBalance(user_id=employee.id, leave_type_id=pto.id, year=year, allocated_days=21))
+            self.requests = [
+                database.LeaveRequest(
+                    employee_id=employee.id, leave_type_id=pto.id, start_date=start, end_date=start,
+                    total_days=1, status='approved', updated_at=datetime(start.year, start.month, start.day)
+                )
+                for start in (date(2024, 12, 30), date(2025, 3, 3))
+            ]
+            db.add_all(self.requests)
+            db.commit()
+
+    def export(self, **options):
+        return snapshots.export_snapshots(self.root, self.fmt, **options)
+
+    def ids_by_year(self, table_name):
+        return {
+            year: sorted(snapshots.read_snapshot(table_name, self.root, years=[year])['id'].to_pylist())
+            for year in snapshots._partition_files(self.root, table_name)
+        }
+
+    def test_export_is_incremental(self):
+        self.assertEqual(self.export()['leave_requests'], 2)
+        # Only the row at the watermark is read again (ties are not missed)
+        self.assertEqual(self.export()['leave_requests'], 1)
+
+        with self.session() as db:
+            db.get(database.LeaveRequest, self.requests[1].id).reason = 'Moved'
+            db.commit()
+
+        self.assertEqual(self.export()['leave_requests'], 1)
+        self.assertEqual(snapshots.read_snapshot('leave_requests', self.root).num_rows, 2)
+
+    def test_edited_request_moves_to_its_new_year(self):
+        first, second = self.requests
+        self.export()
+
+        with self.session() as db:
+            moved = db.get(database.LeaveRequest, first.id)
+            moved.start_date = moved.end_date = date(2025, 1, 6)
+            db.commit()
+        self.export()
+
+        # The 2024 partition lost its only row and is gone
+        self.assertEqual(self.ids_by_year('leave_requests'), {2025: sorted([first.id, second.id])})
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'leave_requests', 'year=2024')))
+
+    def test_balance_year_without_rows_is_removed(self):
+        self.export()
+        with self.session() as db:
+            db.query(database.LeaveBalance).filter_by(year=2024).delete()
+            db.commit()
+
+        self.export()
+
+        self.assertEqual(list(self.ids_by_year('leave_balances')), [2025])
+        self.assertEqual(snapshots.read_snapshot('leave_balances', self.root)['year'].to_pylist(), [2025])
+
+    def test_switching_format_needs_a_full_export(self):
+        other = 'parquet' if self.fmt == 'arrow' else 'arrow'
+        self.export()
+
+        with self.assertRaises(ValueError):
+            snapshots.export_snapshots(self.root, other)
+        snapshots.export_snapshots(self.root, other, full=True)
+
+        for table_name in ('leave_requests', 'leave_balances'):
+            paths = snapshots._partition_files(self.root, table_name).values()
+            self.assertTrue(paths)
+            self.assertTrue(all(path.endswith(f'.{other}') for path in paths))
+        self.assertEqual(snapshots.read_snapshot('leave_requests', self.root).num_rows, 2)
+
+class ParquetSnapshotTests(SnapshotTests):
+    fmt = 'parquet'
+
+class PayrollTests(LeaveTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        LeavePayTier.objects.create(leave_type=cls.sick, from_day=1, to_day=12, pay_percentage=100)
+        LeavePayTier.objects.create(leave_type=cls.sick, from_day=13, to_day=19, pay_percentage=50)
+
+    def approved(self, leave_type, start_date, end_date, total_days=None):
+        return LeaveRequest.objects.create(
+            user=self.employee, leave_type=leave_type, start_date=start_date, end_date=end_date,
+            total_days=Decimal(total_days or (end_date - start_date).days + 1), status='approved'
+        )
+
+    def payroll(self, period_start, period_end):
+        return {row['leave_type']: row for row in compute_payroll(period_start, period_end)}
+
+    def assertDays(self, row, paid, partial, unpaid):
+        self.assertEqual(
+            (row['paid_days'], row['partially_paid_days'], row['unpaid_days']),
+            (Decimal(paid), Decimal(partial), Decimal(unpaid))
+        )
+
+    def test_sick_days_are_paid_in_full_then_half_then_not(self):
+        self.approved(self.sick, date(2025, 2, 1), date(2025, 2, 21))
+
+        row = self.payroll(date(2025, 2, 1), date(2025, 2, 28))['Sick']
+
+        self.assertDays(row, 12, 7, 2)
+        self.assertEqual(row['pay_weighted_days'], Decimal('15.50'))
+
+    def test_request_crossing_a_tier_boundary_is_split(self):
+        self.approved(self.sick, date(2025, 3, 3), date(2025, 3, 12))
+        self.approved(self.sick, date(2025, 3, 17), date(2025, 3, 20))
+
+        self.assertDays(self.payroll(date(2025, 3, 1), date(2025, 3, 31))['Sick'], 12, 2, 0)
+
+    def test_earlier_days_of_the_year_count_toward_the_tier(self):
+        self.approved(self.sick, date(2025, 1, 6), date(2025, 1, 15))
+        self.approved(self.sick, date(2025, 2, 3), date(2025, 2, 6))
+
+        row = self.payroll(date(2025, 2, 1), date(2025, 2, 28))['Sick']
+
+        # Days 11-14 of the year: two at 100%, two at 50%
+        self.assertDays(row, 2, 2, 0)
+        self.assertEqual(row['pay_weighted_days'], Decimal('3.00'))
+
+    def test_requests_crossing_the_period_are_prorated_by_calendar_day(self):
+        # 32 calendar days counted as 16 working days: half a day per calendar day
+        self.approved(self.pto, date(2025, 1, 30), date(2025, 3, 2), total_days=16)
+        self.approved(self.pto, date(2025, 2, 27), date(2025, 3, 4), total_days=6)
+
+        # 28 February days of the first request and 2 of the second
+        self.assertDays(self.payroll(date(2025, 2, 1), date(2025, 2, 28))['PTO'], 16, 0, 0)
+
+    def test_period_spanning_new_year_restarts_the_tiers(self):
+        self.approved(self.sick, date(2025, 11, 3), date(2025, 11, 14))
+        self.approved(self.sick, date(2025, 12, 30), date(2026, 1, 2))
+
+        row = self.payroll(date(2025, 12, 15), date(2026, 1, 15))['Sick']
+
+        # Days 13-14 of 2025 at 50%, then days 1-2 of 2026 at 100%
+        self.assertDays(row, 2, 2, 0)
+
+    def test_split(self):
+        schedule = PaySchedule(Decimal('100'), list(LeavePayTier.objects.filter(leave_type=self.sick)))
+
+        self.assertEqual(schedule.split(Decimal('11'), Decimal('3')), [(1, 100), (2, 50)])
+        self.assertEqual(schedule.split(Decimal('18'), Decimal('2')), [(1, 50), (1, 0)])
+        self.assertEqual(PaySchedule(Decimal('75')).split(Decimal('0'), Decimal('2')), [(2, 75)])
+
+class CalendarFeedCacheTests(LeaveTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def cached(self, scope):
+        return cache.get(ical._cache_key(scope)) is not None
+
+    def test_feeds_are_dropped_only_on_commit(self):
+        team = ical.team_scope(self.supervisor.pk)
+        ical.get_feed(team, 'Team')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            make_request(self.employee, self.pto, date(self.year, 8, 3), status='approved')
+            self.assertTrue(self.cached(team))
+        for callback in callbacks:
+            callback()
+
+        self.assertFalse(self.cached(team))
+
+    def test_team_move_drops_both_team_feeds(self):
+        new_supervisor = make_profile('newboss@tempo.fit', is_supervisor=True)
+        old_team, new_team = ical.team_scope(self.supervisor.pk), ical.team_scope(new_supervisor.pk)
+        ical.get_feed(old_team, 'Old team')
+        ical.get_feed(new_team, 'New team')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.employee.supervisor = new_supervisor
+            self.employee.save()
+
+        self.assertFalse(self.cached(old_team))
+        self.assertFalse(self.cached(new_team))
+
+    def test_bulk_transition_drops_feeds_on_commit(self):
+        team = ical.team_scope(self.supervisor.pk)
+        make_request(self.employee, self.pto, date(self.year, 8, 3))
+        ical.get_feed(team, 'Team')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            bulk.transition_requests(LeaveRequest.objects.all(), 'approved', self.supervisor)
+            self.assertTrue(self.cached(team))
+        for callback in callbacks:
+            callback()
+
+        self.assertFalse(self.cached(team))
+
+    def test_employee_rename_drops_their_feeds(self):
+        feeds = [ical.user_scope(self.employee.pk), ical.team_scope(self.supervisor.pk), ical.user_scope(self.supervisor.pk)]
+        for scope in feeds:
+            ical.get_feed(scope, 'Feed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.employee.user.save(update_fields=['last_login'])
+        self.assertTrue(all(self.cached(scope) for scope in feeds))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.employee.user.last_name = 'Renamed'
+            self.employee.user.save()
+
+        self.assertEqual([self.cached(scope) for scope in feeds], [False, False, True])
+
+    def test_leave_type_rename_drops_feeds_listing_it(self):
+        make_request(self.employee, self.pto, date(self.year, 8, 3), status='approved')
+        other = make_profile('other@tempo.fit')
+        make_request(other, self.sick, date(self.year, 8, 3), status='approved')
+        feeds = [ical.user_scope(self.employee.pk), ical.team_scope(self.supervisor.pk), ical.user_scope(other.pk)]
+        for scope in feeds:
+            ical.get_feed(scope, 'Feed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pto.name = 'Vacation'
+            self.pto.save()
+
+        self.assertEqual([self.cached(scope) for scope in feeds], [False, False, True])
+        self.assertIn('Vacation', ical.get_feed(feeds[0], 'Feed')[1])
+
+class HistoryArchiveTests(LeaveTestCase):
+    def setUp(self):
+        super().setUp()
+        archive = tempfile.TemporaryDirectory()
+        self.addCleanup(archive.cleanup)
+        self.enterContext(override_settings(LEAVE_HISTORY_ARCHIVE_DIR=archive.name))
+
+        self.old_request = make_request(self.employee, self.pto, date(2024, 3, 4), status='approved')
+        LeaveRequest.objects.filter(pk=self.old_request.pk).update(created_at=datetime(2024, 2, 1, tzinfo=dt_timezone.utc))
+        self.other_request = make_request(self.employee, self.sick, date(2024, 5, 6))
+        for leave_request, action, month in (
+            (self.old_request, 'created', 2), (self.old_request, 'approved', 3), (self.other_request, 'created', 4)
+        ):
+            entry = LeaveHistory.objects.create(
+                leave_request=leave_request, action=action, performed_by=self.supervisor, comments=f'{action} in 2024'
+            )
+            LeaveHistory.objects.filter(pk=entry.pk).update(timestamp=datetime(2024, month, 1, tzinfo=dt_timezone.utc))
+        self.current = LeaveHistory.objects.create(leave_request=self.old_request, action='note', comments='Still here')
+
+    def test_archive_moves_a_closed_year_to_a_gzip_file(self):
+        self.assertEqual(leave_history.archive_year(2024), 3)
+
+        archive = LeaveHistoryArchive.objects.get(year=2024)
+        self.assertEqual(archive.row_count, 3)
+        with gzip.open(archive.path, 'rb') as f:
+            content = f.read()
+        self.assertEqual(hashlib.sha256(content).hexdigest(), archive.sha256)
+        self.assertEqual(len(content.splitlines()), 3)
+        self.assertEqual(list(LeaveHistory.objects.values_list('pk', flat=True)), [self.current.pk])
+
+    def test_refuses_open_and_archived_years(self):
+        with self.assertRaises(ValueError):
+            leave_history.archive_year(timezone.now().year)
+        leave_history.archive_year(2024)
+        with self.assertRaises(ValueError):
+            leave_history.archive_year(2024)
+
+    def test_archived_rows_load_back_newest_first(self):
+        leave_history.archive_year(2024)
+
+        entries = leave_history.load_archived_history(self.old_request.pk, {2024})
+
+        self.assertEqual([entry['action'] for entry in entries], ['approved', 'created'])
+        self.assertEqual(entries[0]['comments'], 'approved in 2024')
+        self.assertEqual(leave_history.load_archived_history(self.old_request.pk, {2023}), [])
+
+    @override_settings(TEMPLATES=page_templates())
+    def test_request_detail_shows_archived_history(self):
+        leave_history.archive_year(2024)
+        self.client.force_login(self.employee.user)
+
+        response = self.client.get(reverse('leaves:leave_request_detail', args=[self.old_request.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry.action for entry in response.context['history']], ['note'])
+        self.assertEqual([entry['action'] for entry in response.context['archived_history']], ['approved', 'created'])
+
+class SearchTests(LeaveTestCase):
+    def setUp(self):
+        super().setUp()
+        self.trip = make_request(self.employee, self.pto, date(self.year, 3, 2), reason='Family trip to Lisbon')
+        self.flu = make_request(self.employee, self.sick, date(self.year, 4, 6), reason='Flu')
+        LeaveHistory.objects.create(
+            leave_request=self.flu, action='approved', performed_by=self.supervisor, comments='Get well soon'
+        )
+
+    def found(self, text):
+        return set(search.search_requests(LeaveRequest.objects.all(), text))
+
+    def test_matches_every_word_as_a_prefix(self):
+        self.assertEqual(self.found('fam lis'), {self.trip})
+        self.assertEqual(self.found('family flu'), set())
+        self.assertEqual(self.found(self.employee.employee_id), {self.trip, self.flu})
+
+    def test_history_comments_are_indexed(self):
+        self.assertEqual(self.found('well'), {self.flu})
+
+    def test_edits_reindex_the_request(self):
+        self.trip.reason = 'Wedding'
+        self.trip.save()
+
+        self.assertEqual(self.found('lisbon'), set())
+        self.assertEqual(self.found('wedding'), {self.trip})
+
+    def test_empty_query_does_not_filter(self):
+        self.assertEqual(self.found('  '), {self.trip, self.flu})
+
+    def test_api_only_searches_visible_requests(self):
+        outsider = make_profile('outsider@tempo.fit')
+        make_request(outsider, self.pto, date(self.year, 3, 2), reason='Family reunion')
+        self.client.force_login(self.employee.user)
+
+        response = self.client.get(reverse('leaves:api_request_search'), {'q': 'family'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.trip.pk])
+        self.assertEqual(self.client.get(reverse('leaves:api_request_search'), {'q': '!'}).status_code, 400)
+
+class BalanceUsageTests(LeaveTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        LeaveBalance.objects.create(user=cls.employee, leave_type=cls.pto, year=cls.year, allocated_days=20, used_days=19)
+        LeaveBalance.objects.create(user=cls.employee, leave_type=cls.sick, year=cls.year, allocated_days=10, used_days=1)
+
+    def test_database_annotations_match_properties(self):
+        for balance in LeaveBalance.objects.with_usage():
+            self.assertEqual(balance.available_days_db, balance.available_days)
+            self.assertAlmostEqual(balance.used_percentage_db, float(balance.used_percentage))
+
+    def test_properties_cannot_be_assigned(self):
+        balance = LeaveBalance.objects.first()
+        with self.assertRaises(AttributeError):
+            balance.available_days = 5
+
+    def test_api_sorts_and_filters_in_the_database(self):
+        self.client.force_login(self.employee.user)
+        url = reverse('leaves:api_balance_list')
+
+        sorted_names = [row['leave_type'] for row in self.client.get(url, {'sort': '-used_percentage'}).json()['results']]
+        self.assertEqual(sorted_names, ['PTO', 'Sick'])
+        filtered = self.client.get(url, {'min_used_percentage': '50'}).json()['results']
+        self.assertEqual([row['leave_type'] for row in filtered], ['PTO'])
+
+    def test_admin_sorts_and_filters_on_annotations(self):
+        admin_user = User.objects.create_superuser('admin@tempo.fit', 'admin@tempo.fit', 'password')
+        self.client.force_login(admin_user)
+        url = reverse('admin:leaves_leavebalance_changelist')
+
+        self.assertEqual(self.client.get(url, {'o': '-7'}).status_code, 200)
+        response = self.client.get(url, {'usage': 'over90', 'o': '6'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([balance.leave_type.name for balance in response.context['cl'].result_list], ['PTO'])
+
+class AdminReferenceFilterTests(LeaveTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin@tempo.fit', 'admin@tempo.fit', 'password'))
+
+    def changelist(self, name, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:leaves_{name}_changelist'), params or {})
+        self.assertEqual(response.status_code, 200)
+        # Only the small reference tables may be scanned for distinct values
+        self.assertFalse([query['sql'] for query in queries if 'DISTINCT' in query['sql'] and f'leaves_{name}' in query['sql']])
+        return response
+
+    def filter_choices(self, response, title):
+        spec = next(spec for spec in response.context['cl'].filter_specs if spec.title == title)
+        return [choice['display'] for choice in spec.choices(response.context['cl'])]
+
+    def test_balance_years_come_from_the_cache(self):
+        for year in (self.year - 2, self.year):
+            LeaveBalance.objects.create(user=self.employee, leave_type=self.pto, year=year, allocated_days=21)
+
+        response = self.changelist('leavebalance')
+        self.assertEqual(self.filter_choices(response, 'year'), ['All', str(self.year), str(self.year - 1), str(self.year - 2)])
+
+        LeaveBalance.objects.create(user=self.employee, leave_type=self.sick, year=self.year + 1, allocated_days=19)
+        response = self.changelist('leavebalance', {'year': str(self.year - 2)})
+        self.assertNotIn(str(self.year + 1), self.filter_choices(response, 'year'))
+        self.assertEqual([balance.year for balance in response.context['cl'].result_list], [self.year - 2])
+
+    def test_rollup_years_and_departments_come_from_the_cache(self):
+        make_profile('seller@tempo.fit', department='Sales')
+        for department, year in (('Engineering', self.year - 1), ('Sales', self.year)):
+            LeaveUsageRollup.objects.create(department=department, leave_type=self.pto, year=year, month=1, status='approved', total_days=2, request_count=1)
+
+        response = self.changelist('leaveusagerollup')
+        self.assertEqual(self.filter_choices(response, 'year'), ['All', str(self.year), str(self.year - 1)])
+        self.assertEqual(self.filter_choices(response, 'department'), ['All', 'Engineering', 'Sales'])
+
+        response = self.changelist('leaveusagerollup', {'year': str(self.year), 'department': 'Sales'})
+        self.assertEqual([(rollup.department, rollup.year) for rollup in response.context['cl'].result_list], [('Sales', self.year)])
+
+class BulkTransitionTests(LeaveTestCase):
+    def test_approval_and_recompute_charge_the_approval_year(self):
+        LeaveBalance.objects.create(user=self.employee, leave_type=self.pto, year=self.year, allocated_days=21)
+        next_january = make_request(self.employee, self.pto, date(self.year + 1, 1, 10), days=3)
+
+        changed = bulk.transition_requests(LeaveRequest.objects.filter(pk=next_january.pk), 'approved', self.supervisor)
+        self.assertEqual(changed, 1)
+        self.assertEqual(self.balance(self.employee, self.pto, self.year).used_days, Decimal('3'))
+
+        bulk.recompute_balances(UserProfile.objects.filter(pk=self.employee.pk))
+        self.assertEqual(self.balance(self.employee, self.pto, self.year).used_days, Decimal('3'))
+        self.assertIsNone(self.balance(self.employee, self.pto, self.year + 1))
+
+    def test_only_pending_requests_change(self):
+        pending = make_request(self.employee, self.sick, date(self.year, 6, 1))
+        rejected = make_request(self.employee, self.sick, date(self.year, 7, 1), status='rejected')
+
+        changed = bulk.transition_requests(LeaveRequest.objects.all(), 'approved', self.supervisor)
+
+        self.assertEqual(changed, 1)
+        pending.refresh_from_db()
+        rejected.refresh_from_db()
+        self.assertEqual(pending.status, 'approved')
+        self.assertEqual(rejected.status, 'rejected')
+        self.assertTrue(LeaveHistory.objects.filter(leave_request=pending, action='approved').exists())
+        # No balance yet: created with the default allocation, then charged
+        balance = self.balance(self.employee, self.sick, self.year)
+        self.assertEqual(balance.allocated_days, Decimal('19'))
+        self.assertEqual(balance.used_days, Decimal('1'))
+
+    def test_recompute_restores_drifted_usage(self):
+        make_request(self.employee, self.pto, date(self.year, 3, 2), days=2, status='approved', approved_date=timezone.now())
+        LeaveBalance.objects.create(user=self.employee, leave_type=self.pto, year=self.year, allocated_days=21, used_days=9)
+
+        written = bulk.recompute_balances(UserProfile.objects.filter(pk=self.employee.pk))
+
+        self.assertEqual(written, 1)
+        self.assertEqual(self.balance(self.employee, self.pto, self.year).used_days, Decimal('2'))
+
+class ReconciliationTests(LeaveTestCase):
+    def test_request_for_next_year_approved_today_does_not_drift(self):
+        LeaveBalance.objects.create(user=self.employee, leave_type=self.pto, year=self.year, allocated_days=21)
+        next_january = make_request(self.employee, self.pto, date(self.year + 1, 1, 10), days=3)
+        bulk.transition_requests(LeaveRequest.objects.filter(pk=next_january.pk), 'approved', self.supervisor)
+
+        self.assertEqual(reconciliation.find_drift(), [])
+        self.assertEqual(reconciliation.find_drift(year=self.year + 1), [])
+
+    def test_reports_and_fixes_drift(self):
+        make_request(self.employee, self.pto, date(self.year, 5, 4), days=2, status='approved', approved_date=timezone.now())
+        make_request(self.employee, self.sick, date(self.year, 5, 11), status='approved', approved_date=timezone.now())
+        LeaveBalance.objects.create(user=self.employee, leave_type=self.pto, year=self.year, allocated_days=21, used_days=5)
+
+        drifts = reconciliation.find_drift(year=self.year)
+
+        self.assertEqual(
+            sorted((drift.leave_type, drift.stored, drift.expected, drift.missing_balance) for drift in drifts),
+            [('PTO', Decimal('5'), Decimal('2'), False), ('Sick', None, Decimal('1'), True)]
+        )
+        reconciliation.fix_drift(drifts, year=self.year)
+        self.assertEqual(reconciliation.find_drift(year=self.year), [])
+        self.assertEqual(self.balance(self.employee, self.sick, self.year).used_days, Decimal('1'))
+
+@override_settings(DOCUMENT_MAX_UPLOAD_SIZE=1024)
+class DocumentUploadTests(LeaveTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.client = self.client_class(enforce_csrf_checks=True)
+
+    def post_with_csrf(self, url, data):
+        self.client.get(url)
+        return self.client.post(url, {**data, 'csrfmiddlewaretoken': self.client.cookies['csrftoken'].value})
+
+    def test_oversized_document_is_reported_on_the_form(self):
+        self.client.force_login(self.employee.user)
+        start = timezone.now().date() + timedelta(days=30)
+        response = self.post_with_csrf(reverse('leaves:create_leave_request'), {
+            'leave_type': self.sick.pk,
+            'start_date': start.isoformat(),
+            'end_date': start.isoformat(),
+            'duration_type': 'full_day',
+            'supporting_document': SimpleUploadedFile('note.pdf', b'x' * 4096),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('File is too large', str(response.context['form'].errors['supporting_document']))
+        self.assertFalse(LeaveRequest.objects.exists())
+
+    def test_create_view_still_checks_csrf(self):
+        self.client.force_login(self.employee.user)
+        response = self.client.post(reverse('leaves:create_leave_request'), {})
+        self.assertEqual(response.status_code, 403)
+
+    # django-import-export looks rows up one by one; query counts are not the point here
+    @override_settings(QUERY_WATCH='')
+    def test_admin_import_is_not_limited_to_the_document_size(self):
+        admin_user = User.objects.create_superuser('admin@tempo.fit', 'admin@tempo.fit', 'password')
+        self.client.force_login(admin_user)
+        rows = ''.join(f'E9{index:03d},Engineer,Engineering\n' for index in range(200))
+        csv_file = SimpleUploadedFile('employees.csv', f'employee_id,position,department\n{rows}'.encode())
+
+        response = self.post_with_csrf(reverse('admin:leaves_userprofile_import'), {
+            'import_file': csv_file, 'input_format': '0',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('too large', response.content.decode())
+        self.assertFalse(response.context['form'].errors)
+
+class SchemaMigrationTests(SQLAlchemyTestCase):
+    create_schema = False
+
+    def create_legacy_schema(self):
+        """The first release's tables: no indexes beyond the keys, no leave_requests.department"""
+        legacy = MetaData()
+        for table_name in ('users', 'user_profiles', 'leave_types', 'leave_balances', 'leave_requests'):
+            model_table = database.Base.metadata.tables[table_name]
+            Table(table_name, legacy, *[
+                Column(column.name, column.type, primary_key=column.primary_key)
+                for column in model_table.columns
+                if (table_name, column.name) != ('leave_requests', 'department')
+            ])
+        legacy.create_all(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(text("INSERT INTO user_profiles (id, employee_id, department) VALUES (1, 'E1', 'Finance')"))
+            conn.execute(text("INSERT INTO leave_requests (id, employee_id, status) VALUES (1, 1, 'approved')"))
+
+    def index_names(self, table_name):
+        return {index['name'] for index in inspect(self.engine).get_indexes(table_name)}
+
+    def test_fresh_database_is_created_and_stamped(self):
+        applied = schema_migrations.migrate(log=lambda message: None)
+
+        self.assertEqual(len(applied), len(schema_migrations.MIGRATIONS))
+        self.assertEqual(schema_migrations.current_version(), schema_migrations.LATEST_VERSION)
+        self.assertTrue(schema_migrations.schema_is_current())
+        self.assertTrue(set(database.Base.metadata.tables) <= set(inspect(self.engine).get_table_names()))
+
+    def test_legacy_database_is_upgraded_in_place(self):
+        self.create_legacy_schema()
+        self.assertIsNone(schema_migrations.current_version())
+
+        schema_migrations.migrate(log=lambda message: None)
+
+        self.assertEqual(schema_migrations.current_version(), schema_migrations.LATEST_VERSION)
+        self.assertTrue({'ix_leave_requests_employee_created', 'ix_leave_requests_status_created'} <= self.index_names('leave_requests'))
+        self.assertIn('ix_leave_balances_user_year', self.index_names('leave_balances'))
+        self.assertTrue({'leave_usage_rollups', 'leave_history', 'slow_queries'} <= set(inspect(self.engine).get_table_names()))
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text('SELECT department FROM leave_requests')).scalar(), 'Finance')
+
+        # Running again changes nothing
+        self.assertEqual(schema_migrations.migrate(log=lambda message: None), [])
+        with self.engine.connect() as conn:
+            versions = conn.execute(text('SELECT COUNT(*) FROM schema_version')).scalar()
+        self.assertEqual(versions, len(schema_migrations.MIGRATIONS))
+
+class LeaveServiceContract:
+    """
+    The same operations through each store adapter, which must behave
+    identically. Subclasses set up a supervisor, an employee and the PTO
+    and Sick leave types in their own database and provide the hooks below.
+    """
+
+    def add_balance(self, employee_id, leave_type_id, allocated_days, used_days=0):
+        raise NotImplementedError
+
+    def stored(self, request_id):
+        """(status, approved_by_id, supervisor_comments)"""
+        raise NotImplementedError
+
+    def set_supervisor_comments(self, request_id, comments):
+        raise NotImplementedError
+
+    def history(self, request_id):
+        """[(action, performed_by_id, comments)], oldest first"""
+        raise NotImplementedError
+
+    def submit(self, days=2):
+        start = self.service.store.today() + timedelta(days=14)
+        return self.service.create_request(self.employee_id, self.pto_id, start, start + timedelta(days=days - 1))
+
+    def usage(self, status):
+        start = self.service.store.today() + timedelta(days=14)
+        return self.service.monthly_usage(start.year, start.month, status=status)['request_count']
+
+    def test_create_writes_request_rollup_and_history(self):
+        leave_request = self.submit()
+
+        self.assertEqual(self.stored(leave_request.id), ('pending', None, None))
+        self.assertEqual(self.usage('pending'), 1)
+        self.assertEqual(self.history(leave_request.id), [('created', self.employee_id, 'Leave request created for 2 days')])
+
+    def test_approve(self):
+        self.add_balance(self.employee_id, self.pto_id, 21, used_days=1)
+        leave_request = self.submit()
+
+        self.service.approve(leave_request.id, self.supervisor_id, 'Enjoy')
+
+        self.assertEqual(self.stored(leave_request.id), ('approved', self.supervisor_id, 'Enjoy'))
+        self.assertEqual((self.usage('pending'), self.usage('approved')), (0, 1))
+        self.assertEqual(self.history(leave_request.id)[1:], [('approved', self.supervisor_id, 'Enjoy')])
+        self.assertEqual(self.service.available_days(self.employee_id, self.pto_id), Decimal('18'))
+
+    def test_review_without_comments_keeps_earlier_ones(self):
+        leave_request = self.submit()
+        self.set_supervisor_comments(leave_request.id, 'Discussed on Monday')
+
+        self.service.reject(leave_request.id, self.supervisor_id)
+
+        self.assertEqual(self.stored(leave_request.id), ('rejected', self.supervisor_id, 'Discussed on Monday'))
+        self.assertEqual(self.history(leave_request.id)[1:], [('rejected', self.supervisor_id, '')])
+
+    def test_only_the_supervisor_reviews(self):
+        leave_request = self.submit()
+        with self.assertRaises(NotAllowed):
+            self.service.approve(leave_request.id, self.employee_id)
+        self.assertEqual(self.stored(leave_request.id)[0], 'pending')
+
+    def test_cancel(self):
+        leave_request = self.submit()
+        with self.assertRaises(NotAllowed):
+            self.service.cancel(leave_request.id, self.supervisor_id)
+
+        self.service.cancel(leave_request.id, self.employee_id)
+
+        self.assertEqual(self.stored(leave_request.id), ('cancelled', None, None))
+        self.assertEqual((self.usage('pending'), self.usage('cancelled')), (0, 1))
+        self.assertEqual(self.history(leave_request.id)[1:], [('cancelled', self.employee_id, 'Request cancelled by employee')])
+        with self.assertRaises(ServiceError):
+            self.service.cancel(leave_request.id, self.employee_id)
+
+    def test_balances_most_used_first(self):
+        self.add_balance(self.employee_id, self.pto_id, 21, used_days=2)
+        self.add_balance(self.employee_id, self.sick_id, 10, used_days=9)
+
+        names = [balance.leave_type.name for balance in self.service.balances(self.employee_id)]
+
+        self.assertEqual(names, ['Sick', 'PTO'])
+
+    def test_team_summary(self):
+        self.submit()
+
+        (entry,) = self.service.team_summary(self.supervisor_id)
+
+        self.assertEqual(entry['employee'].id, self.employee_id)
+        self.assertEqual((entry['pending_requests'], entry['total_requests']), (1, 1))
+
+class DjangoStoreContractTests(LeaveServiceContract, LeaveTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = LeaveService(DjangoStore())
+        self.supervisor_id, self.employee_id = self.supervisor.id, self.employee.id
+        self.pto_id, self.sick_id = self.pto.id, self.sick.id
+
+    def add_balance(self, employee_id, leave_type_id, allocated_days, used_days=0):
+        LeaveBalance.objects.create(
+            user_id=employee_id, leave_type_id=leave_type_id, year=self.year,
+            allocated_days=allocated_days, used_days=used_days
+        )
+
+    def stored(self, request_id):
+        leave_request = LeaveRequest.objects.get(pk=request_id)
+        return leave_request.status, leave_request.approved_by_id, leave_request.supervisor_comments or None
+
+    def set_supervisor_comments(self, request_id, comments):
+        LeaveRequest.objects.filter(pk=request_id).update(supervisor_comments=comments)
+
+    def history(self, request_id):
+        return list(
+            LeaveHistory.objects.filter(leave_request_id=request_id).order_by('id')
+            .values_list('action', 'performed_by_id', 'comments')
+        )
+
+class SQLAlchemyStoreContractTests(LeaveServiceContract, SQLAlchemyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = LeaveService(SQLAlchemyStore())
+        with self.session() as db:
+            supervisor = self.add_profile(db, 'boss@tempo.fit', is_supervisor=True)
+            employee = self.add_profile(db, 'worker@tempo.fit', supervisor_id=supervisor.id)
+            pto, sick = database.LeaveType(name='PTO'), database.LeaveType(name='Sick')
+            db.add_all([pto, sick])
+            db.commit()
+            self.supervisor_id, self.employee_id = supervisor.id, employee.id
+            self.pto_id, self.sick_id = pto.id, sick.id
+
+    def add_balance(self, employee_id, leave_type_id, allocated_days, used_days=0):
+        with self.session() as db:
+            db.add(database.LeaveBalance(
+                user_id=employee_id, leave_type_id=leave_type_id, year=self.service.store.today().year,
+                allocated_days=allocated_days, used_days=used_days, carry_over_days=0
+            ))
+            db.commit()
+
+    def stored(self, request_id):
+        with self.session() as db:
+            leave_request = db.get(database.LeaveRequest, request_id)
+            return leave_request.status, leave_request.approved_by_id, leave_request.supervisor_comments or None
+
+    def set_supervisor_comments(self, request_id, comments):
+        with self.session() as db:
+            db.get(database.LeaveRequest, request_id).supervisor_comments = comments
+            db.commit()
+
+    def history(self, request_id):
+        with self.session() as db:
+            return [
+                (entry.action, entry.performed_by_id, entry.comments)
+                for entry in db.query(database.LeaveHistory).filter_by(leave_request_id=request_id).order_by('id')
+            ]
+
+class ReplicaRoutingTests(SimpleTestCase):
+    """Routing decisions only; a second SQLite alias mirrors the test database"""
+
+    def setUp(self):
+        replica = {**settings.DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+        self.enterContext(mock.patch.dict(settings.DATABASES, {routing.REPLICA_DB_ALIAS: replica}))
+        self.factory = RequestFactory()
+        self.read_from = []
+
+    def view(self, write=False):
+        @routing.replica_reads
+        def view(request):
+            if write:
+                db_router.db_for_write(LeaveRequest)
+            self.read_from.append(LeaveRequest.objects.all().db)
+            return HttpResponse()
+        return routing.ReplicaRoutingMiddleware(view)
+
+    def test_marked_reads_go_to_replica(self):
+        with routing.reading_from_replica():
+            self.assertEqual(LeaveRequest.objects.all().db, 'replica')
+        self.assertEqual(LeaveRequest.objects.all().db, 'default')
+
+        response = self.view()(self.factory.get('/'))
+        self.assertEqual(self.read_from, ['replica'])
+        self.assertNotIn(routing.PIN_COOKIE, response.cookies)
+
+    def test_post_pins_next_request_to_primary(self):
+        response = self.view()(self.factory.post('/'))
+        self.assertIn(routing.PIN_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[routing.PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        request = self.factory.get('/')
+        request.COOKIES[routing.PIN_COOKIE] = response.cookies[routing.PIN_COOKIE].value
+        self.view()(request)
+        self.assertEqual(self.read_from, ['replica', 'default'])
+
+    def test_write_in_get_reads_primary_and_pins(self):
+        response = self.view(write=True)(self.factory.get('/'))
+        self.assertEqual(self.read_from, ['default'])
+        self.assertIn(routing.PIN_COOKIE, response.cookies)
+
+    def test_expired_pin_reads_replica(self):
+        request = self.factory.get('/')
+        request.COOKIES[routing.PIN_COOKIE] = str(int(time.time()) - 1)
+        self.view()(request)
+        request.COOKIES[routing.PIN_COOKIE] = 'garbage'
+        self.view()(request)
+        self.assertEqual(self.read_from, ['replica', 'replica'])
+
+    def test_atomic_block_reads_primary(self):
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True):
+            response = self.view()(self.factory.get('/'))
+        self.assertEqual(self.read_from, ['default'])
+        self.assertNotIn(routing.PIN_COOKIE, response.cookies)
+
+    def test_streamed_body_keeps_pin(self):
+        def rows():
+            yield LeaveRequest.objects.all().db
+
+        with routing.reading_from_replica():
+            self.assertEqual(list(routing.iter_from_replica(rows())), ['replica'])
+            db_router.db_for_write(LeaveRequest)
+            self.assertEqual(list(routing.iter_from_replica(rows())), ['default'])
+
+    def test_no_replica_configured(self):
+        del settings.DATABASES[routing.REPLICA_DB_ALIAS]
+        response = self.view()(self.factory.post('/'))
+        self.assertEqual(self.read_from, ['default'])
+        self.assertNotIn(routing.PIN_COOKIE, response.cookies)
+
+class ConcurrentQueryTests(LeaveTestCase):
+    def test_inline_queries_see_the_test_transaction(self):
+        make_request(self.employee, self.pto, date(self.year, 3, 2))
+
+        count, names = async_to_sync(parallel.run_concurrently)(
+            lambda: LeaveRequest.objects.filter(user=self.employee).count(),
+            lambda: list(LeaveType.objects.order_by('name').values_list('name', flat=True)),
+        )
+
+        self.assertEqual((count, names), (1, ['PTO', 'Sick']))
+
+    def test_employee_dashboard(self):
+        LeaveBalance.objects.create(user=self.employee, leave_type=self.pto, year=self.year, allocated_days=21)
+        make_request(self.employee, self.pto, date(self.year, 3, 2))
+        self.client.force_login(self.employee.user)
+
+        response = self.client.get(reverse('leaves:employee_dashboard'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['pending_requests'], 1)
+        self.assertEqual(len(response.context['recent_requests']), 1)
+        self.assertEqual([balance.leave_type.name for balance in response.context['leave_balances']], ['PTO'])
+
+class MetricsRenderTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.requests = metrics.Counter('test_requests_total', 'Requests', ('view',), registry=self.registry)
+        self.latency = metrics.Histogram('test_latency_seconds', 'Latency', buckets=(0.1, 1.0), registry=self.registry)
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+
+    def test_text_exposition(self):
+        self.requests.inc(view='say "hi"\n')
+        self.requests.inc(2, view='dashboard')
+        for seconds in (0.05, 0.5, 5):
+            self.latency.observe(seconds)
+        metrics.Gauge('test_broken', 'Broken collector', collect=lambda: 1 / 0, registry=self.registry)
+
+        self.assertEqual(metrics.render(self.registry, directory='').splitlines(), [
+            '# HELP test_requests_total Requests',
+            '# TYPE test_requests_total counter',
+            'test_requests_total{view="dashboard"} 2',
+            'test_requests_total{view="say \\"hi\\"\\n"} 1',
+            '# HELP test_latency_seconds Latency',
+            '# TYPE test_latency_seconds histogram',
+            'test_latency_seconds_bucket{le="0.1"} 1',
+            'test_latency_seconds_bucket{le="1.0"} 2',
+            'test_latency_seconds_bucket{le="+Inf"} 3',
+            'test_latency_seconds_sum 5.55',
+            'test_latency_seconds_count 3',
+            '# HELP test_broken Broken collector',
+            '# TYPE test_broken gauge',
+        ])
+
+    def test_workers_sharing_a_directory_are_summed(self):
+        other = metrics.Registry()
+        metrics.Counter('test_requests_total', 'Requests', ('view',), registry=other).inc(3, view='dashboard')
+        metrics.Histogram('test_latency_seconds', 'Latency', buckets=(0.1, 1.0), registry=other).observe(0.5)
+        metrics.Counter('test_emails_total', 'Emails', registry=other).inc()
+        metrics.Gauge('test_workers', 'Workers', registry=other).set(1)
+        with mock.patch.object(metrics.os, 'getpid', return_value=4242):
+            metrics.write_snapshot(self.directory, other)
+
+        self.requests.inc(view='dashboard')
+        self.latency.observe(0.05)
+        metrics.Gauge('test_pool', 'Pool', collect=lambda: [({}, 7)], registry=self.registry)
+        lines = metrics.render(self.registry, directory=self.directory).splitlines()
+
+        self.assertIn('test_requests_total{view="dashboard"} 4', lines)
+        self.assertIn('test_latency_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_latency_seconds_bucket{le="1.0"} 2', lines)
+        self.assertIn('test_latency_seconds_count 2', lines)
+        self.assertIn('test_emails_total 1', lines)
+        self.assertIn('test_workers{pid="4242"} 1', lines)
+        self.assertIn('test_pool 7', lines)
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(['4242.json', f'{os.getpid()}.json']))
+
+class MetricsEndpointTests(LeaveTestCase):
+    def test_staff_only(self):
+        url = reverse('leaves:metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.employee.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.employee.user.is_staff = True
+        self.employee.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn(b'# TYPE leave_http_request_duration_seconds histogram', response.content)
+
+    def test_bearer_token(self):
+        url = reverse('leaves:metrics')
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+        with override_settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='s3cret').status_code, 403)
+
+@override_settings(QUERY_WATCH='raise', TEMPLATES=page_templates())
+class QueryBudgetTests(LeaveTestCase):
+    """Every page within its QUERY_BUDGETS entry and free of N+1s, for a whole team"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.team = [cls.employee] + [make_profile(f'member{index}@tempo.fit', supervisor=cls.supervisor) for index in range(3)]
+        cls.requests = []
+        for member in cls.team:
+            for leave_type in (cls.pto, cls.sick):
+                LeaveBalance.objects.create(user=member, leave_type=leave_type, year=cls.year, allocated_days=21)
+            for month in (3, 4, 5):
+                cls.requests.append(make_request(member, cls.pto, date(cls.year, month, 2), reason='Family trip'))
+        LeaveHistory.objects.create(
+            leave_request=cls.requests[0], action='created', performed_by=cls.employee, comments='Submitted'
+        )
+
+    def get(self, profile, name, *args, **params):
+        self.client.force_login(profile.user)
+        return self.client.get(reverse(f'leaves:{name}', args=args), params)
+
+    def post(self, profile, name, *args, **data):
+        self.client.force_login(profile.user)
+        return self.client.post(reverse(f'leaves:{name}', args=args), data)
+
+    def test_budgets_are_enforced(self):
+        with override_settings(QUERY_BUDGETS={'leaves:employee_dashboard': 1}):
+            with self.assertRaises(querywatch.QueryBudgetExceeded):
+                self.get(self.employee, 'employee_dashboard')
+
+    def test_employee_pages(self):
+        pending = self.requests[0]
+        self.assertEqual(self.get(self.employee, 'employee_dashboard').status_code, 200)
+        self.assertEqual(self.get(self.employee, 'leave_balance', sort='-used_percentage').status_code, 200)
+        self.assertEqual(self.get(self.employee, 'leave_request_detail', pending.pk).status_code, 200)
+        self.assertEqual(self.get(self.employee, 'create_leave_request').status_code, 200)
+        self.assertEqual(self.get(self.employee, 'cancel_leave_request', pending.pk).status_code, 200)
+
+        start = timezone.now().date() + timedelta(days=30)
+        response = self.post(
+            self.employee, 'create_leave_request',
+            leave_type=self.sick.pk, start_date=start.isoformat(), end_date=start.isoformat(), duration_type='full_day'
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.post(self.employee, 'cancel_leave_request', pending.pk).status_code, 302)
+
+    def test_supervisor_pages(self):
+        first, second = self.requests[1], self.requests[2]
+        self.assertEqual(self.get(self.supervisor, 'supervisor_dashboard').status_code, 200)
+        self.assertEqual(self.get(self.supervisor, 'leave_request_detail', first.pk).status_code, 200)
+        self.assertEqual(self.get(self.supervisor, 'approve_leave_request', first.pk).status_code, 200)
+        self.assertEqual(self.post(self.supervisor, 'approve_leave_request', first.pk, comments='Enjoy').status_code, 302)
+        self.assertEqual(self.post(self.supervisor, 'reject_leave_request', second.pk, comments='Busy week').status_code, 302)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('approved', 'rejected'))
+
+    def test_api(self):
+        self.assertEqual(self.get(self.employee, 'api_balance_list').status_code, 200)
+        self.assertEqual(self.get(self.supervisor, 'api_request_list', scope='team').status_code, 200)
+        self.assertEqual(self.get(self.supervisor, 'api_request_search', q='family').status_code, 200)
+        self.assertEqual(self.get(self.supervisor, 'api_team_summary').status_code, 200)
+
+class RequestProfilingTests(LeaveTestCase):
+    def setUp(self):
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(PROFILE_DIR=self.directory, METRICS_TOKEN=''))
+        self.staff = User.objects.create_user('ops@tempo.fit', 'ops@tempo.fit', 'password', is_staff=True)
+
+    def profiled_get(self, mode='1'):
+        return self.client.get(reverse('leaves:metrics'), {'_profile': mode})
+
+    def test_only_staff_requests_are_profiled(self):
+        self.client.force_login(self.employee.user)
+        response = self.client.get(reverse('leaves:dashboard'), HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+        self.client.force_login(self.staff)
+        response = self.profiled_get('cprofile')
+        profile_id = response['X-Profile-Id']
+        self.assertTrue(response['X-Profile-Url'].endswith(f'/profiles/{profile_id}.prof'))
+        self.assertEqual(sorted(os.listdir(self.directory)), [f'{profile_id}.json', f'{profile_id}.prof'])
+
+    def test_list_and_download_are_staff_only(self):
+        self.client.force_login(self.staff)
+        profile_id = self.profiled_get()['X-Profile-Id']
+        list_url = reverse('leaves:profile_list')
+        download_url = reverse('leaves:profile_download', args=[profile_id, 'json'])
+
+        profiles = self.client.get(list_url).json()['profiles']
+        self.assertEqual([summary['id'] for summary in profiles], [profile_id])
+        self.assertNotIn('queries', profiles[0])
+        self.assertEqual(sorted(profiles[0]['downloads']), ['folded', 'json'])
+        response = self.client.get(download_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(b''.join(response.streaming_content))['id'], profile_id)
+
+        for user in (None, self.employee.user):
+            self.client.logout()
+            if user:
+                self.client.force_login(user)
+            self.assertEqual(self.client.get(list_url).status_code, 403)
+            self.assertEqual(self.client.get(download_url).status_code, 403)
+
+    def test_download_rejects_unknown_files(self):
+        self.client.force_login(self.staff)
+        profile_id = self.profiled_get()['X-Profile-Id']
+        for args in ([profile_id, 'prof'], [profile_id, 'py'], ['missing', 'json']):
+            self.assertEqual(self.client.get(reverse('leaves:profile_download', args=args)).status_code, 404)
+
+    def test_profile_file_checks_ids_and_kinds(self):
+        with open(os.path.join(self.directory, 'good-id.json'), 'w') as handle:
+            handle.write('{}')
+        for name in ('good-id.py', 'good-id\n.json'):
+            open(os.path.join(self.directory, name), 'w').close()
+
+        self.assertEqual(profiling.profile_file('good-id', 'json', self.directory), os.path.join(self.directory, 'good-id.json'))
+        self.assertIsNone(profiling.profile_file('good-id', 'py', self.directory))
+        self.assertIsNone(profiling.profile_file('good-id', 'prof', self.directory))
+        for bad_id in ('../good-id', f'{self.directory}/good-id', 'good id', '', 'good-id\n'):
+            self.assertIsNone(profiling.profile_file(bad_id, 'json', self.directory))
+
+def slow_query_entry(ms, plan=None, sql='SELECT * FROM leaves_leaverequest WHERE id = %s'):
+    shape = querywatch.fingerprint(sql)
+    return slowlog.SlowQueryEntry(
+        slowlog.digest(shape), shape, sql, ['<int>'], 'leaves/views.py:1', 'default', ms, plan,
+        datetime(2026, 10, 19, 12, 0, tzinfo=dt_timezone.utc)
+    )
+
+class SlowQueryRecorderTests(SimpleTestCase):
+    def test_only_selects_are_explained(self):
+        select = 'SELECT id FROM leaves_leaverequest'
+        self.assertEqual(slowlog.explain_statement('postgresql', select), f'EXPLAIN {select}')
+        self.assertEqual(slowlog.explain_statement('postgresql', select, analyze=True), f'EXPLAIN (ANALYZE, BUFFERS) {select}')
+        self.assertEqual(slowlog.explain_statement('mysql', '  select 1'), 'EXPLAIN   select 1')
+        self.assertEqual(slowlog.explain_statement('sqlite', select, analyze=True), f'EXPLAIN QUERY PLAN {select}')
+        self.assertIsNone(slowlog.explain_statement('oracle', select))
+        for statement in (
+            'UPDATE leaves_leavebalance SET used_days = 0',
+            'DELETE FROM leaves_leaverequest',
+            'INSERT INTO leaves_leavehistory SELECT * FROM leaves_leavehistory',
+            'WITH gone AS (DELETE FROM leaves_leaverequest RETURNING id) SELECT * FROM gone',
+            'SELECTED',
+        ):
+            self.assertIsNone(slowlog.explain_statement('postgresql', statement), statement)
+
+    def test_slow_statements_are_stored_with_one_plan_per_interval(self):
+        stored, explained = [], []
+        recorder = slowlog.Recorder(stored.append, threshold_ms=100)
+
+        def run_explain(statement):
+            explained.append(statement)
+            return [(0, 0, 0, 'SCAN leaves_leaverequest')]
+
+        sql = 'SELECT * FROM leaves_leaverequest WHERE id = %s'
+        recorder.observe('sqlite', sql, [42], 0.05, 'default', run_explain)
+        recorder.observe('sqlite', sql, [42], 0.2, 'default', run_explain)
+        recorder.observe('sqlite', sql, [43], 0.3, 'default', run_explain)
+        recorder.observe('sqlite', 'UPDATE leaves_leaverequest SET status = %s', ['x'], 0.2, 'default', run_explain)
+        recorder.flush()
+
+        self.assertEqual(explained, [f'EXPLAIN QUERY PLAN {sql}'])
+        self.assertEqual([(entry.ms, entry.plan, entry.params) for entry in stored[:2]], [(200, 'SCAN leaves_leaverequest', ['<int>']), (300, None, ['<int>'])])
+        self.assertEqual(stored[0].digest, stored[1].digest)
+        self.assertIsNone(stored[2].plan)
+
+class SlowQueryStoreTests(LeaveTestCase):
+    def race(self, manager):
+        """Create the row from "another process" between store()'s update and insert"""
+        real_filter = manager.filter
+        raced = []
+
+        def filter(**kwargs):
+            if raced:
+                return real_filter(**kwargs)
+            raced.append(True)
+
+            def update(**fields):
+                slow_queries.store(slow_query_entry(100))
+                return 0
+            return mock.Mock(update=update)
+        return mock.patch.object(manager, 'filter', side_effect=filter)
+
+    def test_store_aggregates_per_fingerprint(self):
+        slow_queries.store(slow_query_entry(300, plan='SCAN leaves_leaverequest'))
+        slow_queries.store(slow_query_entry(250))
+
+        row = SlowQuery.objects.get()
+        self.assertEqual((row.count, row.total_ms, row.max_ms, row.mean_ms), (2, 550, 300, 275))
+        self.assertEqual(row.plan, 'SCAN leaves_leaverequest')
+
+    def test_store_adds_to_a_row_created_concurrently(self):
+        with self.race(SlowQuery.objects):
+            slow_queries.store(slow_query_entry(300))
+
+        row = SlowQuery.objects.get()
+        self.assertEqual((row.count, row.total_ms, row.max_ms), (2, 400, 300))
+
+class SQLAlchemySlowQueryStoreTests(SQLAlchemyTestCase):
+    def stored(self):
+        with self.engine.connect() as conn:
+            return conn.execute(text('SELECT count, total_ms, max_ms FROM slow_queries')).all()
+
+    def test_store_aggregates_per_fingerprint(self):
+        database.store_slow_query(slow_query_entry(300))
+        database.store_slow_query(slow_query_entry(250))
+        self.assertEqual(self.stored(), [(2, 550, 300)])
+
+    def test_store_adds_to_a_row_created_concurrently(self):
+        real_insert = database.insert
+        raced = []
+
+        def insert(table):
+            if not raced:
+                raced.append(True)
+                with self.engine.begin() as conn:
+                    conn.execute(real_insert(table).values(
+                        digest=slow_query_entry(100).digest, fingerprint='', count=1, total_ms=100, max_ms=100
+                    ))
+            return real_insert(table)
+
+        with mock.patch.object(database, 'insert', side_effect=insert):
+            database.store_slow_query(slow_query_entry(300))
+
+        self.assertEqual(self.stored(), [(2, 400, 300)])
+
+class SeedLoadTestDataTests(TestCase):
+    def setUp(self):
+        LeaveType.objects.create(name='PTO')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.users_file = os.path.join(directory.name, 'users.json')
+
+    def test_refuses_non_local_database(self):
+        with mock.patch.object(connection, 'vendor', 'postgresql'), self.settings(DEBUG=False):
+            with self.assertRaises(CommandError):
+                call_command('seed_load_test_data', users_file=self.users_file, stdout=io.StringIO())
+        self.assertFalse(User.objects.exists())
+
+    def test_seeds_with_a_random_password(self):
+        call_command('seed_load_test_data', supervisors=1, employees=2, users_file=self.users_file, stdout=io.StringIO())
+
+        with open(self.users_file) as handle:
+            accounts = json.load(handle)
+        self.assertEqual(len(accounts), 3)
+        password = accounts[0]['password']
+        self.assertGreaterEqual(len(password), 20)
+        self.assertTrue(User.objects.get(email=accounts[1]['email']).check_password(password))
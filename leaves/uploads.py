@@ -0,0 +1,136 @@
+"""
+Streaming, content-addressed uploads for supporting documents.
+
+HashingUploadHandler (installed per view with install_upload_handler(), so
+admin and import uploads keep Django's own handlers and limits) streams each
+uploaded file to a temporary file in chunks, hashing it with sha256 as it
+goes, and refuses files over settings.DOCUMENT_MAX_UPLOAD_SIZE: up front when
+the request's Content-Length already exceeds the limit, and otherwise as soon
+as the running byte count passes it. A refused file is never written to
+disk, though Django still reads the rest of its part from the request body to
+get to the fields after it. Nothing is held in memory beyond one chunk.
+
+ContentAddressedStorage then stores each distinct file once, under
+documents/<aa>/<bb>/<sha256><ext>. A re-uploaded duplicate resolves to the
+existing file and is never written again; on the same filesystem the first
+copy is a rename of the temporary file rather than a copy.
+"""
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+import hashlib
+import os
+import re
+
+DOCUMENT_DIR = 'documents'
+HASH_CHUNK_SIZE = 64 * 2 ** 10
+# Room for the other form fields and multipart boundaries in Content-Length
+FORM_OVERHEAD = 64 * 2 ** 10
+
+EXTENSION_RE = re.compile(r'^\.[a-z0-9]{1,9}$')
+DOCUMENT_NAME_RE = re.compile(rf'^{DOCUMENT_DIR}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/(?P<sha256>[0-9a-f]{{64}})(\.[a-z0-9]+)?$')
+
+def max_upload_size():
+    return getattr(settings, 'DOCUMENT_MAX_UPLOAD_SIZE', 10 * 2 ** 20)
+
+def content_name(sha256, original_name=''):
+    """Storage name for content with this digest, keeping a sane extension"""
+    ext = os.path.splitext(original_name or '')[1].lower()
+    if not EXTENSION_RE.match(ext):
+        ext = ''
+    return f'{DOCUMENT_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}'
+
+def sha256_from_name(name):
+    """Digest encoded in a content-addressed name, or None for legacy paths"""
+    match = DOCUMENT_NAME_RE.match(name or '')
+    return match.group('sha256') if match else None
+
+def file_sha256(content):
+    """Hash a file by streaming it, leaving it rewound"""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+def install_upload_handler(request):
+    """
+    Use HashingUploadHandler for this request's files. Must run before
+    request.POST or request.FILES is read, so views calling it are
+    csrf_exempt and apply csrf_protect themselves afterwards.
+    """
+    request.upload_handlers = [HashingUploadHandler(request)]
+
+def upload_errors(request):
+    """{field name: message} for files the handler refused on this request"""
+    return getattr(request, '_upload_errors', {})
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """Stream uploads to disk while hashing them, enforcing the size limit"""
+
+    chunk_size = HASH_CHUNK_SIZE
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request_length = content_length
+        self.max_size = max_upload_size()
+
+    def _reject(self, message):
+        if self.request is not None:
+            if not hasattr(self.request, '_upload_errors'):
+                self.request._upload_errors = {}
+            self.request._upload_errors[self.field_name] = message
+        raise SkipFile()
+
+    def new_file(self, field_name, *args, **kwargs):
+        self.field_name = field_name
+        # The whole body is too big for any file in it to fit: skip the file without
+        # writing it (the parser still reads past it to the remaining fields)
+        if self.request_length and self.request_length > self.max_size + FORM_OVERHEAD:
+            self._reject(f'File is too large (maximum {filesizeformat(self.max_size)}).')
+
+        super().new_file(field_name, *args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.upload_interrupted()
+            self._reject(f'File is too large (maximum {filesizeformat(self.max_size)}).')
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.digest.hexdigest()
+        return uploaded
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Stores each distinct file once, named by the sha256 of its content"""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        # Uploads arrive already hashed by HashingUploadHandler
+        sha256 = getattr(content, 'sha256', None) or file_sha256(content)
+        name = content_name(sha256, name)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def save_as(self, name, content):
+        """Store under the given name (derived files such as previews)"""
+        return super().save(name, content)
+
+document_storage = ContentAddressedStorage()
+
+def get_document_storage():
+    return document_storage
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, api, monitoring, request_profiling
 
 app_name = 'leaves'
 
@@ -20,10 +20,29 @@ urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('balance/', views.leave_balance, name='leave_balance'),
     
+    # Calendar feeds
+    path('calendar/<str:token>/<str:feed>.ics', views.calendar_feed, name='calendar_feed'),
+    path('calendar/rotate/', views.rotate_calendar_token, name='rotate_calendar_token'),
+    
     # Admin views
     path('admin/import-employees/', views.import_employees, name='import_employees'),
     path('admin/export-template/', views.export_template, name='export_template'),
+    path('admin/payroll-export/', views.payroll_export, name='payroll_export'),
     
     # Authentication helper
     path('auth/complete/', views.auth_complete, name='auth_complete'),
+    
+    # Prometheus metrics
+    path('metrics', monitoring.metrics_view, name='metrics'),
+    
+    # On-demand request profiles (staff)
+    path('profiles/', request_profiling.profile_list, name='profile_list'),
+    path('profiles/<str:profile_id>.<str:kind>', request_profiling.profile_download, name='profile_download'),
+    
+    # Read-only JSON API
+    path('api/v1/balances/', api.balance_list, name='api_balance_list'),
+    path('api/v1/requests/', api.request_list, name='api_request_list'),
+    path('api/v1/search/', api.request_search, name='api_request_search'),
+    path('api/v1/requests/<int:request_id>/', api.request_detail, name='api_request_detail'),
+    path('api/v1/team/', api.team_summary, name='api_team_summary'),
 ] 
\ No newline at end of file
@@ -2,20 +2,34 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.contrib import messages
-from django.db import transaction
+from asgiref.sync import sync_to_async
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_GET, require_POST
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.contrib.admin.views.decorators import staff_member_required
 from django.core.mail import send_mail
 from django.conf import settings
 from django.urls import reverse
-from django.db.models import Q, Sum
+from django.db.models import Q, Sum, Count
 from decimal import Decimal
 import csv
 import io
+import time
 from datetime import datetime, timedelta
 
-from .models import UserProfile, LeaveType, LeaveBalance, LeaveRequest, LeaveHistory
+from .models import UserProfile, LeaveType, LeaveBalance, LeaveRequest, LeaveHistory, CalendarFeedToken, BALANCE_SORTS
 from .forms import LeaveRequestForm, EmployeeImportForm
+from .pagination import paginate_keyset, clamp_page_size, InvalidCursor
+from . import ical, uploads, documents
+from . import history as leave_history
+from .payroll import iter_payroll_csv
+from .routing import replica_reads, iter_from_replica
+from .parallel import async_login_required, get_user_profile, run_concurrently
+from leave_service import ServiceError, default_allocation
+from leave_service.django_store import service as leave_service
+import metrics
 
 def dashboard(request):
     """Main dashboard that redirects based on user type"""
@@ -32,31 +46,25 @@ def dashboard(request):
         # User doesn't have a profile, redirect to auth completion
         return redirect('leaves:auth_complete')
 
-@login_required
-def employee_dashboard(request):
+@async_login_required
+@replica_reads
+async def employee_dashboard(request):
     """Employee dashboard showing leave balances and request history"""
-    try:
-        user_profile = request.user.userprofile
-    except UserProfile.DoesNotExist:
+    user_profile = await get_user_profile(request)
+    if user_profile is None:
         return redirect('leaves:auth_complete')
     
-    # Get current year leave balances
-    current_year = timezone.now().year
-    leave_balances = LeaveBalance.objects.filter(
-        user=user_profile, 
-        year=current_year
-    ).select_related('leave_type')
-    
-    # Get recent leave requests
-    recent_requests = LeaveRequest.objects.filter(
-        user=user_profile
-    ).order_by('-created_at')[:10]
-    
-    # Get pending requests count
-    pending_requests = LeaveRequest.objects.filter(
-        user=user_profile,
-        status='pending'
-    ).count()
+    # Current year balances, one keyset page of recent requests and the
+    # pending count are independent: run them concurrently
+    leave_balances, recent_requests, pending_requests = await run_concurrently(
+        lambda: leave_service().balances(user_profile.id),
+        lambda: get_keyset_page(
+            request,
+            LeaveRequest.objects.filter(user=user_profile).select_related('leave_type'),
+            'cursor'
+        ),
+        lambda: LeaveRequest.objects.filter(user=user_profile, status='pending').count(),
+    )
     
     context = {
         'user_profile': user_profile,
@@ -65,61 +73,67 @@ def employee_dashboard(request):
         'pending_requests': pending_requests,
     }
     
-    return render(request, 'leaves/employee_dashboard.html', context)
+    return await sync_to_async(render)(request, 'leaves/employee_dashboard.html', context)
 
-@login_required
-def supervisor_dashboard(request):
+@async_login_required
+@replica_reads
+async def supervisor_dashboard(request):
     """Supervisor dashboard showing team members and pending requests"""
-    try:
-        user_profile = request.user.userprofile
-    except UserProfile.DoesNotExist:
+    user_profile = await get_user_profile(request)
+    if user_profile is None:
         return redirect('leaves:auth_complete')
     
     if not user_profile.is_supervisor:
         return redirect('leaves:employee_dashboard')
     
-    # Get all subordinates
-    subordinates = user_profile.get_subordinates()
-    
-    # Get pending requests from subordinates
-    pending_requests = LeaveRequest.objects.filter(
-        user__in=subordinates,
-        status='pending'
-    ).order_by('-created_at')
-    
-    # Get all requests from subordinates (recent)
-    all_requests = LeaveRequest.objects.filter(
-        user__in=subordinates
-    ).order_by('-created_at')[:20]
-    
-    # Get team leave summary
-    team_summary = []
-    for subordinate in subordinates:
-        current_year = timezone.now().year
-        balances = LeaveBalance.objects.filter(
-            user=subordinate,
-            year=current_year
-        ).select_related('leave_type')
-        
-        team_summary.append({
-            'employee': subordinate,
-            'balances': balances,
-            'pending_requests': pending_requests.filter(user=subordinate).count()
-        })
+    today = timezone.now().date()
+    
+    # The approval inbox, the request history, the team summary (balances,
+    # most used first, and request counts for every member) and this month's
+    # usage are independent: run them concurrently. Each builds its own
+    # querysets, as querysets must not be shared between threads.
+    pending_requests, all_requests, team_summary, team_usage = await run_concurrently(
+        lambda: get_keyset_page(
+            request,
+            LeaveRequest.objects.filter(
+                user__in=user_profile.get_subordinates(),
+                status='pending'
+            ).select_related('user__user', 'leave_type'),
+            'pending_cursor'
+        ),
+        lambda: get_keyset_page(
+            request,
+            LeaveRequest.objects.filter(
+                user__in=user_profile.get_subordinates()
+            ).select_related('user__user', 'leave_type'),
+            'cursor',
+            default_page_size=20
+        ),
+        lambda: leave_service().team_summary(user_profile.id),
+        lambda: leave_service().team_monthly_usage(user_profile.id, today.year, today.month),
+    )
     
     context = {
         'user_profile': user_profile,
-        'subordinates': subordinates,
+        'subordinates': [entry['employee'] for entry in team_summary],
         'pending_requests': pending_requests,
         'all_requests': all_requests,
         'team_summary': team_summary,
+        'team_usage': team_usage,
     }
     
-    return render(request, 'leaves/supervisor_dashboard.html', context)
+    return await sync_to_async(render)(request, 'leaves/supervisor_dashboard.html', context)
 
-@login_required
+@csrf_exempt
 def create_leave_request(request):
     """Create a new leave request"""
+    # The document upload handler has to be in place before CSRF checking reads the body
+    uploads.install_upload_handler(request)
+    return _create_leave_request(request)
+
+@csrf_protect
+@login_required
+def _create_leave_request(request):
     try:
         user_profile = request.user.userprofile
     except UserProfile.DoesNotExist:
@@ -127,17 +141,20 @@ def create_leave_request(request):
     
     if request.method == 'POST':
         form = LeaveRequestForm(request.POST, request.FILES, user=user_profile)
+        form.add_upload_errors(uploads.upload_errors(request))
         if form.is_valid():
-            leave_request = form.save(commit=False)
-            leave_request.user = user_profile
-            leave_request.save()
-            
-            # Create history entry
-            LeaveHistory.objects.create(
-                leave_request=leave_request,
-                action='created',
-                performed_by=user_profile,
-                comments=f'Leave request created for {leave_request.total_days} days'
+            data = form.cleaned_data
+            leave_request = leave_service().insert_request(
+                user_profile.id,
+                data['leave_type'].id,
+                data['total_days'],
+                start_date=data['start_date'],
+                end_date=data['end_date'],
+                start_time=data.get('start_time'),
+                end_time=data.get('end_time'),
+                duration_type=data['duration_type'],
+                reason=data.get('reason', ''),
+                supporting_document=data.get('supporting_document') or None,
             )
             
             # Send email notification to supervisor
@@ -151,32 +168,48 @@ def create_leave_request(request):
     
     return render(request, 'leaves/create_request.html', {'form': form})
 
-@login_required
-def leave_request_detail(request, request_id):
+@async_login_required
+async def leave_request_detail(request, request_id):
     """View details of a leave request"""
-    try:
-        user_profile = request.user.userprofile
-    except UserProfile.DoesNotExist:
+    # The profile and the request are looked up concurrently
+    user_profile, leave_request = await run_concurrently(
+        lambda: UserProfile.objects.filter(user_id=request.user.id).first(),
+        lambda: LeaveRequest.objects.select_related('user__user', 'leave_type').filter(id=request_id).first(),
+    )
+    if user_profile is None:
         return redirect('leaves:auth_complete')
+    if leave_request is None:
+        raise Http404('No LeaveRequest matches the given query.')
     
-    leave_request = get_object_or_404(LeaveRequest, id=request_id)
-    
-    # Check permissions
-    if not (leave_request.user == user_profile or 
-            (user_profile.is_supervisor and leave_request.can_be_approved_by(user_profile))):
+    # Check permissions (the requester's supervisor is already loaded)
+    is_approver = user_profile.is_supervisor and leave_request.user.supervisor_id == user_profile.id
+    if not (leave_request.user_id == user_profile.id or is_approver):
         messages.error(request, 'You do not have permission to view this request.')
         return redirect('leaves:dashboard')
     
-    # Get request history
-    history = LeaveHistory.objects.filter(leave_request=leave_request)
+    def archived_history():
+        # Archived years are only read when the request is that old
+        request_years = set(range(leave_request.created_at.year, timezone.now().year + 1))
+        return leave_history.load_archived_history(
+            leave_request.id, request_years & leave_history.archived_years()
+        )
+    
+    # Hot history rows, archived history and the stored document are independent
+    history, archived, document = await run_concurrently(
+        lambda: list(LeaveHistory.objects.filter(leave_request_id=leave_request.id).select_related('performed_by__user')),
+        archived_history,
+        lambda: documents.for_request(leave_request) if leave_request.supporting_document else None,
+    )
     
     context = {
         'leave_request': leave_request,
         'history': history,
-        'can_approve': user_profile.is_supervisor and leave_request.can_be_approved_by(user_profile) and leave_request.status == 'pending',
+        'archived_history': archived,
+        'document': document,
+        'can_approve': is_approver and leave_request.status == 'pending',
     }
     
-    return render(request, 'leaves/request_detail.html', context)
+    return await sync_to_async(render)(request, 'leaves/request_detail.html', context)
 
 @login_required
 def approve_leave_request(request, request_id):
@@ -199,31 +232,12 @@ def approve_leave_request(request, request_id):
     if request.method == 'POST':
         comments = request.POST.get('comments', '')
         
-        with transaction.atomic():
-            # Update request status
-            leave_request.status = 'approved'
-            leave_request.approved_by = user_profile
-            leave_request.approved_date = timezone.now()
-            leave_request.supervisor_comments = comments
-            leave_request.save()
-            
-            # Update leave balance
-            leave_balance, created = LeaveBalance.objects.get_or_create(
-                user=leave_request.user,
-                leave_type=leave_request.leave_type,
-                year=timezone.now().year,
-                defaults={'allocated_days': get_default_allocation(leave_request.user, leave_request.leave_type)}
-            )
-            leave_balance.used_days += leave_request.total_days
-            leave_balance.save()
-            
-            # Create history entry
-            LeaveHistory.objects.create(
-                leave_request=leave_request,
-                action='approved',
-                performed_by=user_profile,
-                comments=comments
-            )
+        try:
+            # Status, balance, rollup and history in one transaction
+            leave_request = leave_service().approve(leave_request.id, user_profile.id, comments)
+        except ServiceError as e:
+            messages.error(request, str(e))
+            return redirect('leaves:supervisor_dashboard')
         
         # Send notification email
         send_leave_status_notification(leave_request, 'approved')
@@ -254,19 +268,11 @@ def reject_leave_request(request, request_id):
     if request.method == 'POST':
         comments = request.POST.get('comments', '')
         
-        leave_request.status = 'rejected'
-        leave_request.approved_by = user_profile
-        leave_request.approved_date = timezone.now()
-        leave_request.supervisor_comments = comments
-        leave_request.save()
-        
-        # Create history entry
-        LeaveHistory.objects.create(
-            leave_request=leave_request,
-            action='rejected',
-            performed_by=user_profile,
-            comments=comments
-        )
+        try:
+            leave_request = leave_service().reject(leave_request.id, user_profile.id, comments)
+        except ServiceError as e:
+            messages.error(request, str(e))
+            return redirect('leaves:supervisor_dashboard')
         
         # Send notification email
         send_leave_status_notification(leave_request, 'rejected')
@@ -295,16 +301,12 @@ def cancel_leave_request(request, request_id):
         return redirect('leaves:dashboard')
     
     if request.method == 'POST':
-        leave_request.status = 'cancelled'
-        leave_request.save()
-        
-        # Create history entry
-        LeaveHistory.objects.create(
-            leave_request=leave_request,
-            action='cancelled',
-            performed_by=user_profile,
-            comments='Request cancelled by employee'
-        )
+        try:
+            # Status, rollup and history in one transaction
+            leave_service().cancel(leave_request.id, user_profile.id)
+        except ServiceError as e:
+            messages.error(request, str(e))
+            return redirect('leaves:dashboard')
         
         messages.success(request, 'Leave request cancelled.')
         return redirect('leaves:employee_dashboard')
@@ -319,23 +321,87 @@ def profile(request):
     except UserProfile.DoesNotExist:
         return redirect('leaves:auth_complete')
     
-    return render(request, 'leaves/profile.html', {'user_profile': user_profile})
+    feed_token = ical.get_or_create_token(user_profile)
+    calendar_feeds = {
+        'personal': request.build_absolute_uri(
+            reverse('leaves:calendar_feed', args=[feed_token.token, 'personal'])
+        ),
+    }
+    if user_profile.is_supervisor:
+        calendar_feeds['team'] = request.build_absolute_uri(
+            reverse('leaves:calendar_feed', args=[feed_token.token, 'team'])
+        )
+    
+    return render(request, 'leaves/profile.html', {
+        'user_profile': user_profile,
+        'calendar_feeds': calendar_feeds,
+    })
 
 @login_required
-def leave_balance(request):
-    """View leave balances"""
+@require_POST
+def rotate_calendar_token(request):
+    """Issue a new calendar feed token, revoking the old feed URLs"""
     try:
         user_profile = request.user.userprofile
     except UserProfile.DoesNotExist:
         return redirect('leaves:auth_complete')
     
+    ical.rotate_token(user_profile)
+    messages.success(request, 'Calendar feed links reset. Re-subscribe with the new links.')
+    return redirect('leaves:profile')
+
+@require_GET
+def calendar_feed(request, token, feed):
+    """iCalendar feed of approved and pending leave, authenticated by token"""
+    try:
+        feed_token = CalendarFeedToken.objects.select_related('user__user').get(token=token)
+    except CalendarFeedToken.DoesNotExist:
+        raise Http404
+    
+    user_profile = feed_token.user
+    if feed == 'personal':
+        scope = ical.user_scope(user_profile.id)
+        name = f'{user_profile.user.get_full_name()} - Leave'
+    elif feed == 'team' and user_profile.is_supervisor:
+        scope = ical.team_scope(user_profile.id)
+        name = f'{user_profile.user.get_full_name()} - Team Leave'
+    else:
+        raise Http404
+    
+    etag, body = ical.get_feed(scope, name)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    
+    response = HttpResponse(body, content_type='text/calendar; charset=utf-8')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=300'
+    return response
+
+@async_login_required
+@replica_reads
+async def leave_balance(request):
+    """View leave balances"""
     current_year = timezone.now().year
     leave_balances = LeaveBalance.objects.filter(
-        user=user_profile,
+        user__user_id=request.user.id,
         year=current_year
-    ).select_related('leave_type')
+    ).with_usage().select_related('leave_type')
+    
+    # ?sort=available_days / -used_percentage etc., done in the database
+    sort = request.GET.get('sort')
+    if sort in BALANCE_SORTS:
+        leave_balances = leave_balances.order_by(BALANCE_SORTS[sort], 'leave_type__name')
     
-    return render(request, 'leaves/leave_balance.html', {'leave_balances': leave_balances})
+    # Filtering on the user rather than the profile lets both queries run at once
+    user_profile, leave_balances = await run_concurrently(
+        lambda: UserProfile.objects.filter(user_id=request.user.id).first(),
+        lambda: list(leave_balances),
+    )
+    if user_profile is None:
+        return redirect('leaves:auth_complete')
+    
+    return await sync_to_async(render)(request, 'leaves/leave_balance.html', {'leave_balances': leave_balances, 'sort': sort})
 
 def auth_complete(request):
     """Complete authentication setup for new users"""
@@ -371,26 +437,42 @@ def export_template(request):
     # This would be implemented as an admin-only view
     pass
 
+@staff_member_required
+def payroll_export(request):
+    """Stream the payroll period export as CSV"""
+    try:
+        start = datetime.strptime(request.GET.get('start', ''), '%Y-%m-%d').date()
+        end = datetime.strptime(request.GET.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return HttpResponse('start and end must be dates in YYYY-MM-DD format.', status=400)
+    
+    if start > end:
+        return HttpResponse('End date cannot be before start date.', status=400)
+    
+    response = StreamingHttpResponse(iter_from_replica(iter_payroll_csv(start, end)), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="payroll_{start}_{end}.csv"'
+    return response
+
 # Helper functions
+def get_keyset_page(request, queryset, cursor_param, default_page_size=10):
+    """Get a keyset page of requests using the cursor in the query string"""
+    page_size = clamp_page_size(request.GET.get('page_size'), default=default_page_size)
+    try:
+        return paginate_keyset(queryset, request.GET.get(cursor_param), page_size)
+    except InvalidCursor:
+        # Stale or tampered cursor - start again from the newest requests
+        return paginate_keyset(queryset, None, page_size)
+
 def get_default_allocation(user_profile, leave_type):
     """Get default allocation for a user and leave type"""
-    if leave_type.name == 'PTO':
-        return Decimal('30' if user_profile.is_senior else '21')
-    elif leave_type.name == 'PPTO':
-        return Decimal('21')
-    elif leave_type.name == 'Paternal':
-        return Decimal('21')
-    elif leave_type.name == 'Maternal':
-        return Decimal('90')
-    elif leave_type.name == 'Bereavement':
-        return Decimal('3')
-    elif leave_type.name == 'Sick':
-        return Decimal('19')  # 12 + 7
-    else:
-        return Decimal('0')
+    return default_allocation(leave_type.name, user_profile.is_senior)
 
 def send_leave_request_notification(leave_request):
     """Send email notification to supervisor about new leave request"""
+    # Requester, supervisor and their users in one query
+    leave_request = LeaveRequest.objects.select_related(
+        'user__user', 'user__supervisor__user', 'leave_type'
+    ).get(pk=leave_request.pk)
     if leave_request.user.supervisor and leave_request.user.supervisor.user.email:
         subject = f'New Leave Request from {leave_request.user.user.get_full_name()}'
         message = f"""
@@ -405,13 +487,7 @@ def send_leave_request_notification(leave_request):
         Please review and approve/reject the request.
         """
         
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [leave_request.user.supervisor.user.email],
-            fail_silently=True,
-        )
+        send_notification(subject, message, [leave_request.user.supervisor.user.email])
 
 def send_leave_status_notification(leave_request, status):
     """Send email notification to employee about leave request status change"""
@@ -426,10 +502,17 @@ def send_leave_status_notification(leave_request, status):
     Supervisor Comments: {leave_request.supervisor_comments or 'None'}
     """
     
-    send_mail(
+    send_notification(subject, message, [leave_request.user.user.email])
+
+def send_notification(subject, message, recipients):
+    """Send a notification email (failures are counted, not raised)"""
+    started = time.perf_counter()
+    sent = send_mail(
         subject,
         message,
         settings.DEFAULT_FROM_EMAIL,
-        [leave_request.user.user.email],
+        recipients,
         fail_silently=True,
     )
+    metrics.EMAIL_SECONDS.observe(time.perf_counter() - started)
+    metrics.EMAILS.inc(result='sent' if sent else 'failed')
@@ -0,0 +1,501 @@
+"""
+Load test for the Django and Streamlit frontends, against local instances
+seeded with synthetic accounts:
+
+    python manage.py seed_load_test_data --supervisors 10 --employees 8
+    python manage.py runserver        # or the production server setup
+    python loadtest.py django --base-url http://localhost:8000 --users 50 --duration 60
+
+    python loadtest.py seed-streamlit --supervisors 10 --employees 8
+    python loadtest.py streamlit --users 10 --duration 60
+
+Every virtual user replays a journey in a loop, with some think time in
+between: log in, open the dashboard, view the balance, create a request
+and, for supervisors, approve one pending request of their team. Each step
+is timed; the report gives requests, errors, throughput and latency
+percentiles per endpoint. --json saves the report and --compare prints the
+change against a saved one, e.g. from the previous release.
+
+The Streamlit journeys run app.py through streamlit.testing, one process
+per virtual user (no browser or websocket), so they measure the
+server-side script reruns.
+"""
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from http.cookiejar import CookieJar
+import argparse
+import functools
+import json
+import math
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_USERS_FILE = "loadtest_users.json"
+EMAIL_PREFIX = "loadtest."
+# Enough for any run: requests are never refused for lack of balance
+ALLOCATED_DAYS = Decimal("365")
+
+# Synthetic accounts
+def generate_password():
+    """Password for a seeding run; only ever written to the users file"""
+    return secrets.token_urlsafe(18)
+
+def synthetic_people(supervisors, employees_per_supervisor):
+    """Supervisors, each followed by their employees (dicts for either ORM)"""
+    for team in range(1, supervisors + 1):
+        supervisor_email = f"{EMAIL_PREFIX}sup{team:03d}@tempo.fit"
+        yield {
+            "email": supervisor_email,
+            "first_name": "Load",
+            "last_name": f"Supervisor {team}",
+            "employee_id": f"LTS{team:04d}",
+            "position": "Team Lead",
+            "department": f"Load Test {team}",
+            "starting_date": date(2020, 1, 1),
+            "gender": "Female",
+            "is_supervisor": True,
+            "supervisor_email": None,
+        }
+        for member in range(1, employees_per_supervisor + 1):
+            yield {
+                "email": f"{EMAIL_PREFIX}emp{team:03d}.{member:03d}@tempo.fit",
+                "first_name": "Load",
+                "last_name": f"Employee {team}.{member}",
+                "employee_id": f"LT{team:03d}{member:03d}",
+                "position": "Engineer",
+                "department": f"Load Test {team}",
+                "starting_date": date(2022, 1, 1),
+                "gender": "Male",
+                "is_supervisor": False,
+                "supervisor_email": supervisor_email,
+            }
+
+def write_users_file(path, profiles, password):
+    accounts = [
+        {"email": profile.user.email, "supervisor": bool(profile.is_supervisor), "password": password}
+        for profile in profiles
+    ]
+    with open(path, "w") as handle:
+        json.dump(accounts, handle, indent=2)
+
+def seed_streamlit(supervisors, employees_per_supervisor, users_file, allow_non_local=False):
+    """
+    Synthetic accounts in the database.py schema (no passwords: the app logs
+    in by e-mail). Refuses anything but SQLite unless allow_non_local is set.
+    """
+    from database import SessionLocal, User, UserProfile, LeaveType, LeaveBalance, create_initial_data, engine
+    import schema_migrations
+
+    if engine.dialect.name != "sqlite" and not allow_non_local:
+        sys.exit(
+            f"Refusing to create load-test accounts in a {engine.dialect.name} database: "
+            "point DATABASE_URL at a local SQLite file or pass --allow-non-local."
+        )
+
+    schema_migrations.migrate(log=lambda message: None)
+    create_initial_data()
+    db = SessionLocal()
+    try:
+        leave_types = db.query(LeaveType).filter(LeaveType.is_active == True).all()
+        year = date.today().year
+        profiles = {}
+        for person in synthetic_people(supervisors, employees_per_supervisor):
+            user = db.query(User).filter(User.email == person["email"]).first()
+            if user is None:
+                user = User(email=person["email"], first_name=person["first_name"], last_name=person["last_name"])
+                db.add(user)
+                db.flush()
+            profile = db.query(UserProfile).filter(UserProfile.user_id == user.id).first()
+            if profile is None:
+                profile = UserProfile(user_id=user.id, employee_id=person["employee_id"])
+                db.add(profile)
+            profile.position = person["position"]
+            profile.department = person["department"]
+            profile.starting_date = person["starting_date"]
+            profile.gender = person["gender"]
+            profile.is_supervisor = person["is_supervisor"]
+            supervisor = profiles.get(person["supervisor_email"])
+            profile.supervisor_id = supervisor.id if supervisor else None
+            db.flush()
+            profiles[person["email"]] = profile
+
+            existing = {
+                balance.leave_type_id: balance
+                for balance in db.query(LeaveBalance).filter(LeaveBalance.user_id == profile.id, LeaveBalance.year == year)
+            }
+            for leave_type in leave_types:
+                balance = existing.get(leave_type.id)
+                if balance is None:
+                    balance = LeaveBalance(user_id=profile.id, leave_type_id=leave_type.id, year=year)
+                    db.add(balance)
+                balance.allocated_days = ALLOCATED_DAYS
+                balance.used_days = 0
+                balance.carry_over_days = 0
+        db.commit()
+        write_users_file(users_file, profiles.values(), password=None)
+        return len(profiles)
+    finally:
+        db.close()
+
+def load_accounts(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        sys.exit(f"{path} not found: seed the load-test accounts first (see loadtest.py)")
+
+# Results
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+class Results:
+    """Latencies and errors per endpoint, shared by all virtual users"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, error=None):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if error:
+                self.errors[endpoint][error] += 1
+
+    def merge(self, latencies, errors):
+        with self._lock:
+            for endpoint, values in latencies.items():
+                self.latencies[endpoint].extend(values)
+            for endpoint, counts in errors.items():
+                self.errors[endpoint].update(counts)
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            errors = sum(self.errors[endpoint].values())
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "errors": errors,
+                "error_rate": errors / len(latencies),
+                "throughput": len(latencies) / elapsed,
+                "p50_ms": percentile(latencies, 0.50) * 1000,
+                "p90_ms": percentile(latencies, 0.90) * 1000,
+                "p95_ms": percentile(latencies, 0.95) * 1000,
+                "p99_ms": percentile(latencies, 0.99) * 1000,
+                "max_ms": latencies[-1] * 1000,
+                "top_errors": dict(self.errors[endpoint].most_common(3)),
+            }
+        total = sum(row["requests"] for row in endpoints.values())
+        errors = sum(row["errors"] for row in endpoints.values())
+        return {
+            "elapsed_s": elapsed,
+            "requests": total,
+            "errors": errors,
+            "error_rate": errors / total if total else 0.0,
+            "throughput": total / elapsed,
+            "endpoints": endpoints,
+        }
+
+def format_report(report):
+    header = f"{'Endpoint':<40} {'Reqs':>6} {'Err %':>6} {'Req/s':>7} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+    lines = [header, "-" * len(header)]
+    for endpoint, row in report["endpoints"].items():
+        lines.append(
+            f"{endpoint:<40} {row['requests']:>6} {row['error_rate'] * 100:>6.1f} {row['throughput']:>7.2f} "
+            f"{row['p50_ms']:>8.0f} {row['p90_ms']:>8.0f} {row['p95_ms']:>8.0f} {row['p99_ms']:>8.0f} {row['max_ms']:>8.0f}"
+        )
+    lines.append("-" * len(header))
+    lines.append(
+        f"{report['requests']} requests in {report['elapsed_s']:.1f} s: {report['throughput']:.2f} req/s, "
+        f"{report['error_rate'] * 100:.1f}% errors (latencies in ms)"
+    )
+    for endpoint, row in report["endpoints"].items():
+        for error, count in row["top_errors"].items():
+            lines.append(f"  {endpoint}: {count}x {error}")
+    return "\n".join(lines)
+
+def format_comparison(report, baseline):
+    """p95, throughput and error rate against a saved report"""
+    lines = [f"{'Endpoint':<40} {'p95 before':>10} {'p95 now':>10} {'change':>8} {'req/s before':>12} {'req/s now':>10} {'err % now':>9}"]
+    for endpoint, row in report["endpoints"].items():
+        before = baseline["endpoints"].get(endpoint)
+        if before is None:
+            lines.append(f"{endpoint:<40} {'-':>10} {row['p95_ms']:>10.0f}")
+            continue
+        change = (row["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0.0
+        lines.append(
+            f"{endpoint:<40} {before['p95_ms']:>10.0f} {row['p95_ms']:>10.0f} {change:>+7.0f}% "
+            f"{before['throughput']:>12.2f} {row['throughput']:>10.2f} {row['error_rate'] * 100:>9.1f}"
+        )
+    return "\n".join(lines)
+
+class StepFailed(Exception):
+    """Ends the current journey; the failure is already recorded"""
+
+# Django, over HTTP
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Redirects are the expected answer to logins and form posts: time them, do not follow
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class DjangoClient:
+    """One browser-like session: cookies, CSRF token, no redirects followed"""
+
+    def __init__(self, base_url, results, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.results = results
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect)
+
+    def csrf_token(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == "csrftoken"), "")
+
+    def step(self, endpoint, path, data=None, expect=200):
+        """Request path, recording it under endpoint; returns the body or raises StepFailed"""
+        url = self.base_url + path
+        headers = {"Referer": url}
+        if data is not None:
+            data = urllib.parse.urlencode({**data, "csrfmiddlewaretoken": self.csrf_token()}).encode()
+        request = urllib.request.Request(url, data=data, headers=headers)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as error:
+            status, body = error.code, error.read()
+        except Exception as exc:
+            self.results.record(endpoint, time.perf_counter() - started, type(exc).__name__)
+            raise StepFailed(endpoint)
+        error = None if status == expect else f"HTTP {status} (expected {expect})"
+        self.results.record(endpoint, time.perf_counter() - started, error)
+        if error:
+            raise StepFailed(endpoint)
+        return body.decode("utf-8", "replace")
+
+_LEAVE_TYPE_OPTION = re.compile(r'<option value="(\d+)"[^>]*>\s*([^<]+?)\s*</option>')
+
+def django_journey(account, rng, results, base_url):
+    client = DjangoClient(base_url, results)
+    client.step("GET /accounts/login/", "/accounts/login/")
+    client.step(
+        "POST /accounts/login/", "/accounts/login/",
+        {"login": account["email"], "password": account["password"]}, expect=302
+    )
+    dashboard = "/supervisor/" if account["supervisor"] else "/employee/"
+    client.step(f"GET {dashboard}", dashboard)
+    client.step("GET /balance/", "/balance/")
+
+    form = client.step("GET /request/", "/request/")
+    leave_types = dict((name, value) for value, name in _LEAVE_TYPE_OPTION.findall(form))
+    start = date.today() + timedelta(days=rng.randint(1, 300))
+    client.step("POST /request/", "/request/", {
+        "leave_type": leave_types.get("PPTO") or next(iter(leave_types.values()), ""),
+        "start_date": start.isoformat(),
+        "end_date": start.isoformat(),
+        "duration_type": "half_day",
+        "reason": "Load test",
+    }, expect=302)
+
+    if account["supervisor"]:
+        pending = json.loads(client.step(
+            "GET /api/v1/requests/?scope=team", "/api/v1/requests/?scope=team&status=pending&page_size=10"
+        ))["results"]
+        if pending:
+            request_id = rng.choice(pending)["id"]
+            client.step(
+                "POST /request/<id>/approve/", f"/request/{request_id}/approve/",
+                {"comments": "Load test"}, expect=302
+            )
+
+# Streamlit, in-process
+SUPERVISOR_PAGE = f"""
+import sys
+sys.path.insert(0, {PROJECT_ROOT!r})
+import app
+app.init_db()
+with app.page_render("Supervisor View"):
+    app.supervisor_dashboard()
+"""
+
+def _streamlit_step(results, endpoint, run, check=None):
+    started = time.perf_counter()
+    try:
+        at = run()
+        error = at.exception[0].message if at.exception else None
+        if error is None and check is not None:
+            error = check(at)
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+    results.record(endpoint, time.perf_counter() - started, error)
+    if error:
+        raise StepFailed(endpoint)
+    return at
+
+def _button(at, label):
+    return next(button for button in at.button if button.label == label)
+
+def streamlit_journey(account, rng, results, timeout=60):
+    from streamlit.testing.v1 import AppTest
+
+    app_script = os.path.join(PROJECT_ROOT, "app.py")
+    at = AppTest.from_file(app_script, default_timeout=timeout)
+
+    def login():
+        at.run()
+        at.text_input[0].input(account["email"])
+        return _button(at, "Sign In").click().run()
+    _streamlit_step(results, "login", login, lambda at: None if "user" in at.session_state else "not logged in")
+
+    if account["supervisor"]:
+        page = AppTest.from_string(SUPERVISOR_PAGE, default_timeout=timeout)
+        page.session_state["user"] = at.session_state["user"]
+        page.session_state["user_profile"] = at.session_state["user_profile"]
+        _streamlit_step(results, "supervisor dashboard", page.run)
+    _streamlit_step(results, "dashboard", at.run)
+    _streamlit_step(results, "view balance", lambda: _button(at, "📊 View All Balances").click().run())
+
+    _button(at, "📝 New Leave Request").click().run()
+    start = date.today() + timedelta(days=rng.randint(1, 300))
+
+    def create():
+        next(box for box in at.selectbox if box.label == "Leave Type").set_value("PPTO")
+        next(box for box in at.selectbox if box.label == "Duration Type").set_value("half_day")
+        next(field for field in at.date_input if field.label == "Start Date").set_value(start)
+        next(field for field in at.date_input if field.label == "End Date").set_value(start)
+        at.text_area[0].input("Load test")
+        return _button(at, "Submit Request").click().run()
+    _streamlit_step(
+        results, "create request", create,
+        lambda at: at.error[0].value if at.error else None
+    )
+
+    if account["supervisor"]:
+        approve = [button for button in page.button if (button.key or "").startswith("approve_")]
+        if approve:
+            _streamlit_step(
+                results, "approve", lambda: rng.choice(approve).click().run(),
+                lambda page: page.error[0].value if page.error else None
+            )
+
+# Runner
+def _virtual_user(journey, index, account, users, deadline, ramp_up, think, results):
+    rng = random.Random(index)
+    time.sleep(ramp_up * index / users)
+    while time.time() < deadline:
+        try:
+            journey(account, rng, results)
+        except StepFailed:
+            pass
+        time.sleep(min(rng.uniform(0, 2 * think), max(0, deadline - time.time())))
+    return results
+
+def _process_user(*args):
+    # In a worker process: hand back plain data
+    results = _virtual_user(*args, Results())
+    return dict(results.latencies), {endpoint: dict(errors) for endpoint, errors in results.errors.items()}
+
+def run_load(journey, accounts, users, duration, ramp_up, think, supervisor_share, processes=False):
+    """
+    Run users virtual users for duration seconds; returns the report.
+    With processes=True each user runs in its own process (for journeys
+    that are not thread-safe, like streamlit.testing).
+    """
+    supervisors = [account for account in accounts if account["supervisor"]]
+    employees = [account for account in accounts if not account["supervisor"]]
+    supervisor_users = min(users, round(users * supervisor_share)) if supervisors else 0
+    if not employees:
+        supervisor_users = users
+    assigned = [
+        supervisors[index % len(supervisors)] if index < supervisor_users else employees[index % len(employees)]
+        for index in range(users)
+    ]
+
+    results = Results()
+    started = time.time()
+    deadline = started + duration
+    if processes:
+        with ProcessPoolExecutor(max_workers=users) as pool:
+            futures = [
+                pool.submit(_process_user, journey, index, account, users, deadline, ramp_up, think)
+                for index, account in enumerate(assigned)
+            ]
+            for future in futures:
+                results.merge(*future.result())
+    else:
+        threads = [
+            threading.Thread(
+                target=_virtual_user, args=(journey, index, account, users, deadline, ramp_up, think, results),
+                daemon=True
+            )
+            for index, account in enumerate(assigned)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return results.report(time.time() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the leave management frontends")
+    parser.add_argument("target", choices=["django", "streamlit", "seed-streamlit"])
+    parser.add_argument("--base-url", default="http://localhost:8000", help="Django instance (django)")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run")
+    parser.add_argument("--ramp-up", type=float, default=10, help="Seconds over which the users start")
+    parser.add_argument("--think", type=float, default=1.0, help="Mean pause between journeys, in seconds")
+    parser.add_argument("--supervisor-share", type=float, default=0.2, help="Share of users that are supervisors")
+    parser.add_argument("--users-file", default=DEFAULT_USERS_FILE, help="Accounts written by the seed step")
+    parser.add_argument("--json", help="Save the report to this file")
+    parser.add_argument("--compare", help="Compare with a report saved with --json")
+    parser.add_argument("--supervisors", type=int, default=5, help="Supervisors to create (seed-streamlit)")
+    parser.add_argument("--employees", type=int, default=8, help="Employees per supervisor (seed-streamlit)")
+    parser.add_argument(
+        "--allow-non-local", action="store_true", help="Seed a database other than SQLite (seed-streamlit)"
+    )
+    args = parser.parse_args()
+
+    if args.target == "seed-streamlit":
+        count = seed_streamlit(args.supervisors, args.employees, args.users_file, args.allow_non_local)
+        print(f"✅ {count} load-test accounts ready; written to {args.users_file}")
+        return
+
+    accounts = load_accounts(args.users_file)
+    if args.target == "django":
+        journey = functools.partial(django_journey, base_url=args.base_url)
+    else:
+        journey = streamlit_journey
+
+    print(f"🚀 {args.users} {args.target} users for {args.duration:.0f} s...")
+    report = run_load(
+        journey, accounts, args.users, args.duration, args.ramp_up, args.think, args.supervisor_share,
+        processes=args.target == "streamlit"
+    )
+    print(format_report(report))
+
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump({"target": args.target, "users": args.users, **report}, handle, indent=2)
+    if args.compare:
+        with open(args.compare) as handle:
+            print()
+            print(format_comparison(report, json.load(handle)))
+
+if __name__ == "__main__":
+    main()
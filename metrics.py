@@ -0,0 +1,449 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Both frontends record into the registry here: the Django app through the
+middleware and query hook in leaves/monitoring.py (served at /metrics), the
+Streamlit app through the SQLAlchemy engine hooks installed by database.py
+and page timers in app.py (shown on the Metrics page for HR). Each process
+keeps its own numbers. When several worker processes serve one address,
+set METRICS_MULTIPROC_DIR to a directory shared by them (emptied on each
+deploy): every process writes a snapshot of its registry there once a
+second and at exit, and render() adds up the snapshots of all of them, live
+or exited, so a scrape of any worker reports the whole server. Gauges read
+at scrape time (collect=...) describe the scraping process only.
+
+Only the standard library is used, so recording costs a lock and a few
+additions per observation.
+"""
+from contextlib import contextmanager
+import atexit
+import bisect
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+
+MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR", "")
+FLUSH_INTERVAL = 1.0
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # Re-registering a name (e.g. on module reload) replaces the metric
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+REGISTRY = Registry()
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        return tuple(zip(self.labelnames, key)) + tuple(extra)
+
+    def samples(self):
+        """[(sample name, ((label, value), ...), value)]"""
+        raise NotImplementedError
+
+    def render(self):
+        return _render_family(self.name, self.kind, self.documentation, self.samples())
+
+def _render_family(name, kind, documentation, samples):
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for sample, labels, value in samples:
+        lines.append(f"{sample}{_format_labels(labels)} {_format_value(value)}")
+    return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, self._labels(key), value) for key, value in items]
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down. With collect, values are read at scrape
+    time instead: collect() returns [(labels dict, value)].
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), collect=None, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.collect = collect
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.collect is not None:
+            try:
+                items = [(self._key(labels), value) for labels, value in self.collect()]
+            except Exception:
+                # A failing collector must not break the whole scrape
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [(self.name, self._labels(key), value) for key, value in sorted(items)]
+
+class _HistogramValue:
+    __slots__ = ("buckets", "count", "sum")
+
+    def __init__(self, size):
+        self.buckets = [0] * size
+        self.count = 0
+        self.sum = 0.0
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.upper_bounds = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.upper_bounds, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = _HistogramValue(len(self.upper_bounds))
+            entry.buckets[index] += 1
+            entry.count += 1
+            entry.sum += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _snapshot(self):
+        with self._lock:
+            return sorted((key, list(entry.buckets), entry.count, entry.sum) for key, entry in self._values.items())
+
+    def samples(self):
+        samples = []
+        for key, buckets, count, total in self._snapshot():
+            cumulative = 0
+            for upper_bound, bucket in zip(self.upper_bounds, buckets):
+                cumulative += bucket
+                samples.append((f"{self.name}_bucket", self._labels(key, [("le", _format_value(float(upper_bound)))]), cumulative))
+            samples.append((f"{self.name}_sum", self._labels(key), total))
+            samples.append((f"{self.name}_count", self._labels(key), count))
+        return samples
+
+    def summary(self, quantiles=(0.5, 0.95)):
+        """[{labels..., 'count', 'mean', 'p50', 'p95'}] for display; quantiles are estimated from the buckets"""
+        rows = []
+        for key, buckets, count, total in self._snapshot():
+            row = dict(zip(self.labelnames, key))
+            row["count"] = count
+            row["mean"] = total / count if count else 0.0
+            for quantile in quantiles:
+                row[f"p{int(quantile * 100)}"] = self._quantile(buckets, count, quantile)
+            rows.append(row)
+        return rows
+
+    def _quantile(self, buckets, count, quantile):
+        # Linear interpolation within the bucket, like PromQL histogram_quantile()
+        rank = quantile * count
+        cumulative = 0
+        lower = 0.0
+        for upper_bound, bucket in zip(self.upper_bounds, buckets):
+            if bucket and cumulative + bucket >= rank:
+                if upper_bound == float("inf"):
+                    return lower
+                return lower + (upper_bound - lower) * (rank - cumulative) / bucket
+            cumulative += bucket
+            if upper_bound != float("inf"):
+                lower = upper_bound
+        return lower
+
+def _shared(metric):
+    # Scrape-time gauges are read fresh by whichever process renders
+    return getattr(metric, "collect", None) is None
+
+def write_snapshot(directory, registry=REGISTRY):
+    """Write this process's samples to <directory>/<pid>.json for render() in the other workers"""
+    pid = str(os.getpid())
+    snapshot = []
+    for metric in registry.metrics():
+        if not _shared(metric):
+            continue
+        samples = metric.samples()
+        if metric.kind == "gauge":
+            # Gauge values do not add up across processes; report each one
+            samples = [(name, labels + (("pid", pid),), value) for name, labels, value in samples]
+        snapshot.append((metric.name, metric.kind, metric.documentation, samples))
+    path = os.path.join(directory, f"{pid}.json")
+    partial = f"{path}.tmp"
+    with open(partial, "w") as f:
+        json.dump(snapshot, f)
+    # Readers never see a half-written file
+    os.replace(partial, path)
+
+def _read_snapshots(directory):
+    """{name: (kind, documentation, {(sample, labels): value})} summed over all snapshots"""
+    families = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, kind, documentation, samples in snapshot:
+            values = families.setdefault(name, (kind, documentation, {}))[2]
+            for sample, labels, value in samples:
+                key = (sample, tuple(tuple(label) for label in labels))
+                values[key] = values.get(key, 0) + value
+    return families
+
+def render(registry=REGISTRY, directory=None):
+    """
+    The registry in Prometheus text exposition format (version 0.0.4),
+    summed over every process sharing directory (default MULTIPROC_DIR)
+    """
+    directory = MULTIPROC_DIR if directory is None else directory
+    families = {}
+    if directory:
+        write_snapshot(directory, registry)
+        families = _read_snapshots(directory)
+
+    lines = []
+    for metric in registry.metrics():
+        family = families.pop(metric.name, None)
+        if family is None or not _shared(metric):
+            lines.extend(metric.render())
+        else:
+            samples = [(sample, labels, value) for (sample, labels), value in family[2].items()]
+            lines.extend(_render_family(metric.name, metric.kind, metric.documentation, samples))
+    # Metrics only registered in other processes
+    for name, (kind, documentation, values) in families.items():
+        samples = [(sample, labels, value) for (sample, labels), value in values.items()]
+        lines.extend(_render_family(name, kind, documentation, samples))
+    return "\n".join(lines) + "\n"
+
+def _flush():
+    try:
+        write_snapshot(MULTIPROC_DIR)
+    except OSError:
+        pass
+
+def _flush_periodically():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        _flush()
+
+def _start_flushing():
+    threading.Thread(target=_flush_periodically, name="metrics-flush", daemon=True).start()
+
+if MULTIPROC_DIR:
+    _start_flushing()
+    # Forked workers (e.g. gunicorn --preload) do not inherit the thread
+    os.register_at_fork(after_in_child=_start_flushing)
+    atexit.register(_flush)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Metrics shared by both frontends
+HTTP_REQUEST_SECONDS = Histogram(
+    "leave_http_request_duration_seconds", "Django request latency by view", ("view", "method", "status")
+)
+HTTP_REQUEST_QUERIES = Histogram(
+    "leave_http_request_db_queries", "Database queries per Django request", ("view",), QUERY_COUNT_BUCKETS
+)
+HTTP_REQUEST_DB_SECONDS = Histogram(
+    "leave_http_request_db_seconds", "Time spent in database queries per Django request", ("view",)
+)
+PAGE_SECONDS = Histogram(
+    "leave_streamlit_page_duration_seconds", "Streamlit page render latency", ("page",)
+)
+PAGE_QUERIES = Histogram(
+    "leave_streamlit_page_db_queries", "Database queries per Streamlit page render", ("page",), QUERY_COUNT_BUCKETS
+)
+PAGE_DB_SECONDS = Histogram(
+    "leave_streamlit_page_db_seconds", "Time spent in database queries per Streamlit page render", ("page",)
+)
+DB_QUERY_SECONDS = Histogram(
+    "leave_db_query_duration_seconds", "Duration of single database queries", ("database",)
+)
+CACHE_REQUESTS = Counter(
+    "leave_cache_requests_total", "Cache lookups by cache and result (hit or miss)", ("cache", "result")
+)
+EMAILS = Counter(
+    "leave_emails_total", "Notification emails by result (sent or failed)", ("result",)
+)
+EMAIL_SECONDS = Histogram(
+    "leave_email_send_duration_seconds", "Time spent sending a notification email"
+)
+
+# Per-request / per-page query accounting
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        # Several threads may report into one request (see leaves.parallel)
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+
+_query_stats = contextvars.ContextVar("metrics_query_stats", default=None)
+
+@contextmanager
+def track_queries():
+    """Count the queries (and their time) run in this context"""
+    stats = QueryStats()
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+# Statement capture for profiles (see profiling.py)
+_statements = contextvars.ContextVar("metrics_statements", default=None)
+
+@contextmanager
+def collect_statements():
+    """Collect (database, sql, seconds) for every query run in this context"""
+    statements = []
+    token = _statements.set(statements)
+    try:
+        yield statements
+    finally:
+        _statements.reset(token)
+
+def record_query(database, seconds, sql=None):
+    DB_QUERY_SECONDS.observe(seconds, database=database)
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.add(seconds)
+    statements = _statements.get()
+    if statements is not None:
+        # list.append is atomic, so worker threads can share the list
+        statements.append((database, sql, seconds))
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+def cache_hit_ratios():
+    """{cache name: (hits, misses, ratio)}"""
+    totals = {}
+    for name, labels, value in CACHE_REQUESTS.samples():
+        labels = dict(labels)
+        hits, misses = totals.get(labels["cache"], (0, 0))
+        if labels["result"] == "hit":
+            hits += value
+        else:
+            misses += value
+        totals[labels["cache"]] = (hits, misses)
+    return {cache: (hits, misses, hits / (hits + misses) if hits + misses else 0.0)
+            for cache, (hits, misses) in totals.items()}
+
+@contextmanager
+def timed_page(page):
+    """Time a Streamlit page render and count its queries"""
+    started = time.perf_counter()
+    with track_queries() as stats:
+        try:
+            yield stats
+        finally:
+            PAGE_SECONDS.observe(time.perf_counter() - started, page=page)
+            PAGE_QUERIES.observe(stats.count, page=page)
+            PAGE_DB_SECONDS.observe(stats.seconds, page=page)
+
+# SQLAlchemy
+_engines = {}
+
+def _pool_connections():
+    for name, engine in list(_engines.items()):
+        pool = engine.pool
+        for state, method in (("checked_out", "checkedout"), ("idle", "checkedin"), ("overflow", "overflow"), ("size", "size")):
+            if hasattr(pool, method):
+                # QueuePool counts overflow from -size while the pool is not full
+                yield {"engine": name, "state": state}, max(0, getattr(pool, method)())
+
+DB_POOL_CONNECTIONS = Gauge(
+    "leave_db_pool_connections", "SQLAlchemy connection pool usage by state", ("engine", "state"),
+    collect=_pool_connections
+)
+
+def instrument_engine(engine, name):
+    """Time every query on a SQLAlchemy engine and report its pool"""
+    from sqlalchemy import event
+
+    if name in _engines:
+        return
+    _engines[name] = engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        record_query(name, time.perf_counter() - started, statement)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # The failed statement never reaches after_cursor_execute
+        conn = context.connection
+        if conn is not None and conn.info.get("metrics_started"):
+            conn.info["metrics_started"].pop()
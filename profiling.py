@@ -0,0 +1,227 @@
+"""
+On-demand profiling of single requests (Django) and page reruns (Streamlit).
+
+capture() profiles the enclosed block and stores the result in a profile
+directory, together with the SQL it ran (statements, timings and totals per
+querywatch fingerprint). Two modes:
+
+- "sample" (default): a sampler thread records the stack of every busy
+  thread in the process each interval, so the leaves.parallel worker
+  threads and the async views' event loop are included. Stored as folded
+  stacks (<id>.folded), the input of flamegraph.pl, inferno and speedscope.
+  On a busy server, threads serving other requests are sampled too.
+- "cprofile": deterministic cProfile of the calling thread (<id>.prof), for
+  snakeviz, gprof2dot or pstats. Slower, but exact call counts.
+
+Nothing is hooked while no capture is running: the Django middleware and
+the Streamlit toggle only enter capture() when a profile is requested.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+import cProfile
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+
+import metrics
+import querywatch
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.environ.get("LEAVE_PROFILE_DIR", os.path.join(PROJECT_ROOT, "profiles"))
+MODES = ("sample", "cprofile")
+DEFAULT_INTERVAL = 0.005
+DEFAULT_KEEP = 50
+# Statements stored one by one; the per-fingerprint totals cover all of them
+MAX_STATEMENTS = 1000
+
+FILE_KINDS = {"json": "application/json", "folded": "text/plain", "prof": "application/octet-stream"}
+_PROFILE_ID = re.compile(r"[\w.-]+")
+
+# Innermost frames of threads that are blocked waiting for work
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("selectors.py", "select"),
+    ("socket.py", "accept"),
+    ("socketserver.py", "serve_forever"),
+}
+
+def _frame_label(code):
+    filename = code.co_filename
+    if filename.startswith(PROJECT_ROOT):
+        filename = os.path.relpath(filename, PROJECT_ROOT)
+    elif "site-packages" in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[-1]
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+class Sampler:
+    """Samples the stacks of all busy threads into folded-stack counts"""
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                # Pool threads are numbered; group them under one root
+                stack.append(re.sub(r"[-_\d]+$", "", names.get(thread_id, "thread")) or "thread")
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+class Profile:
+    """A capture in progress; files are known once it has been saved"""
+
+    def __init__(self, name, mode):
+        slug = re.sub(r"[^\w]+", "-", name).strip("-")[:40] or "profile"
+        self.id = f"{datetime.now():%Y%m%d-%H%M%S}-{slug}-{secrets.token_hex(3)}"
+        self.name = name
+        self.mode = mode
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.seconds = None
+        self.files = {}
+
+def _sql_summary(statements):
+    shapes = {}
+    for database, sql, seconds in statements:
+        shape_key = querywatch.fingerprint(sql or "")
+        shape = shapes.setdefault(
+            (database, shape_key), {"database": database, "fingerprint": shape_key, "count": 0, "ms": 0.0}
+        )
+        shape["count"] += 1
+        shape["ms"] += seconds * 1000
+    by_fingerprint = sorted(shapes.values(), key=lambda shape: -shape["ms"])
+    for shape in by_fingerprint:
+        shape["ms"] = round(shape["ms"], 3)
+    return {
+        "query_count": len(statements),
+        "query_ms": round(sum(seconds for _, _, seconds in statements) * 1000, 3),
+        "queries_by_fingerprint": by_fingerprint,
+        "queries": [
+            {"database": database, "sql": sql, "ms": round(seconds * 1000, 3)}
+            for database, sql, seconds in statements[:MAX_STATEMENTS]
+        ],
+    }
+
+def _save(profile, profiler, statements, directory, keep):
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, profile.id)
+    summary = {
+        "id": profile.id,
+        "name": profile.name,
+        "mode": profile.mode,
+        "started_at": profile.started_at,
+        "duration_ms": round(profile.seconds * 1000, 3),
+    }
+    if profile.mode == "cprofile":
+        profiler.dump_stats(base + ".prof")
+        profile.files["prof"] = base + ".prof"
+    else:
+        with open(base + ".folded", "w") as handle:
+            handle.write(profiler.folded())
+        profile.files["folded"] = base + ".folded"
+        summary["samples"] = profiler.samples
+        summary["interval_ms"] = profiler.interval * 1000
+    summary.update(_sql_summary(list(statements)))
+    summary["files"] = sorted(profile.files) + ["json"]
+    with open(base + ".json", "w") as handle:
+        json.dump(summary, handle, indent=2)
+    profile.files["json"] = base + ".json"
+    _prune(directory, keep)
+
+def _stored_ids(directory):
+    """Ids of the stored profiles, newest first"""
+    summaries = [name for name in os.listdir(directory) if name.endswith(".json")]
+    summaries.sort(key=lambda name: os.path.getmtime(os.path.join(directory, name)), reverse=True)
+    return [name[:-len(".json")] for name in summaries]
+
+def _prune(directory, keep):
+    for profile_id in _stored_ids(directory)[keep:]:
+        for kind in FILE_KINDS:
+            path = os.path.join(directory, f"{profile_id}.{kind}")
+            if os.path.exists(path):
+                os.remove(path)
+
+@contextmanager
+def capture(name, directory=PROFILE_DIR, mode="sample", interval=DEFAULT_INTERVAL, keep=DEFAULT_KEEP):
+    """
+    Profile the block and store it in directory (keeping the newest `keep`
+    profiles). Yields the Profile; its id is known up front, its files
+    once the block has ended. Failing blocks are stored too.
+
+        with profiling.capture("supervisor dashboard") as profile:
+            render()
+        print(profile.files["folded"])
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown profiling mode {mode!r}; use one of {', '.join(MODES)}")
+    profile = Profile(name, mode)
+    profiler = cProfile.Profile() if mode == "cprofile" else Sampler(interval)
+    started = time.perf_counter()
+    with metrics.collect_statements() as statements:
+        if mode == "cprofile":
+            profiler.enable()
+        else:
+            profiler.start()
+        try:
+            yield profile
+        finally:
+            if mode == "cprofile":
+                profiler.disable()
+            else:
+                profiler.stop()
+            profile.seconds = time.perf_counter() - started
+            _save(profile, profiler, statements, directory, keep)
+
+def list_profiles(directory=PROFILE_DIR):
+    """Summaries of the stored profiles, newest first (without the statements)"""
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for profile_id in _stored_ids(directory):
+        with open(os.path.join(directory, f"{profile_id}.json")) as handle:
+            summary = json.load(handle)
+        summary.pop("queries", None)
+        summary.pop("queries_by_fingerprint", None)
+        found.append(summary)
+    return found
+
+def profile_file(profile_id, kind, directory=PROFILE_DIR):
+    """Path of a stored profile file, or None (ids are checked, so safe for user input)"""
+    if kind not in FILE_KINDS or not _PROFILE_ID.fullmatch(profile_id):
+        return None
+    path = os.path.join(directory, f"{profile_id}.{kind}")
+    return path if os.path.exists(path) else None
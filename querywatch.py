@@ -0,0 +1,176 @@
+"""
+N+1 query detection with per-page query budgets (development and staging).
+
+Every query run inside watch() is fingerprinted: literals and parameter
+placeholders are replaced and IN lists collapsed, so the same statement
+issued once per row of a loop yields one fingerprint seen many times. When
+the block ends, statement shapes repeated at least repeat_threshold times
+and totals over the budget are reported with the project code that issued
+them, either logged or raised as QueryBudgetExceeded (so that tests fail).
+
+The Django app feeds it through leaves.query_budget (middleware plus a
+connection hook); the Streamlit app through instrument_engine() on the
+SQLAlchemy engines and watch() around each page render.
+"""
+from collections import namedtuple
+from contextlib import contextmanager
+import contextvars
+import logging
+import os
+import re
+import sys
+import threading
+
+logger = logging.getLogger("querywatch")
+
+DEFAULT_REPEAT_THRESHOLD = 3
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Call sites are reported from project code, skipping this machinery
+_IGNORED_FILES = {
+    os.path.join(PROJECT_ROOT, name)
+    for name in (
+        "querywatch.py", "metrics.py", "slowlog.py",
+        os.path.join("leaves", "query_budget.py"), os.path.join("leaves", "monitoring.py"),
+        os.path.join("leaves", "slow_queries.py")
+    )
+}
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised on N+1 patterns or budget overruns when the action is "raise" """
+
+Violation = namedtuple("Violation", ["kind", "message", "fingerprint", "count", "call_sites"])
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s|\?|:\w+|\$\d+")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+def fingerprint(sql):
+    """The shape of a statement: literals and parameters replaced by ?, IN lists collapsed"""
+    sql = _STRING.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+def call_site():
+    """file:line in function of the innermost project frame issuing a query"""
+    frame = sys._getframe(1)
+    via_template = False
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PROJECT_ROOT) and filename not in _IGNORED_FILES and "site-packages" not in filename:
+            site = f"{os.path.relpath(filename, PROJECT_ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}"
+            return site + " (from a template)" if via_template else site
+        if f"{os.sep}template{os.sep}" in filename:
+            via_template = True
+        frame = frame.f_back
+    return "unknown"
+
+class _Shape:
+    __slots__ = ("sql", "count", "call_sites")
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.call_sites = {}
+
+class QueryLog:
+    """Statement shapes seen in one request or page render"""
+
+    def __init__(self, name, budget=None, repeat_threshold=DEFAULT_REPEAT_THRESHOLD):
+        self.name = name
+        self.budget = budget
+        self.repeat_threshold = repeat_threshold
+        self.total = 0
+        self.shapes = {}
+        self._lock = threading.Lock()
+
+    def record(self, sql):
+        shape_key = fingerprint(sql)
+        site = call_site()
+        # Queries may come from several threads (see leaves.parallel)
+        with self._lock:
+            self.total += 1
+            shape = self.shapes.get(shape_key)
+            if shape is None:
+                shape = self.shapes[shape_key] = _Shape(sql)
+            shape.count += 1
+            shape.call_sites[site] = shape.call_sites.get(site, 0) + 1
+
+    def violations(self):
+        found = []
+        for shape_key, shape in self.shapes.items():
+            if shape.count >= self.repeat_threshold:
+                found.append(Violation(
+                    "repeated", f"same query ran {shape.count} times (likely N+1): {shape_key[:300]}",
+                    shape_key, shape.count, dict(shape.call_sites)
+                ))
+        if self.budget is not None and self.total > self.budget:
+            found.append(Violation(
+                "budget", f"{self.total} queries, budget is {self.budget}", None, self.total, {}
+            ))
+        return found
+
+def format_violations(name, violations):
+    lines = [f"Query problems in {name}:"]
+    for violation in violations:
+        lines.append(f"  - {violation.message}")
+        for site, count in sorted(violation.call_sites.items(), key=lambda item: -item[1]):
+            lines.append(f"      {count}x at {site}")
+    return "\n".join(lines)
+
+def report(query_log, action="log"):
+    """Log or raise the violations of a finished query log; returns them"""
+    violations = query_log.violations()
+    if violations:
+        message = format_violations(query_log.name, violations)
+        if action == "raise":
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    return violations
+
+_current = contextvars.ContextVar("querywatch_log", default=None)
+
+@contextmanager
+def watch(name, budget=None, repeat_threshold=DEFAULT_REPEAT_THRESHOLD, action="log"):
+    """
+    Record the queries of the block and report N+1 patterns and budget
+    overruns when it ends. In tests:
+
+        with querywatch.watch("team summary", budget=3, action="raise"):
+            service().team_summary(supervisor_id)
+    """
+    query_log = QueryLog(name, budget, repeat_threshold)
+    token = _current.set(query_log)
+    try:
+        yield query_log
+    finally:
+        _current.reset(token)
+    report(query_log, action)
+
+def record(sql):
+    """Hook for database drivers: count a statement in the current watch() block"""
+    query_log = _current.get()
+    if query_log is not None:
+        query_log.record(sql)
+
+# Streamlit / SQLAlchemy
+def settings_from_env():
+    """(action, default budget, repeat threshold) from LEAVE_QUERY_WATCH*; action is None when off"""
+    action = os.environ.get("LEAVE_QUERY_WATCH", "").lower() or None
+    if action not in (None, "log", "raise"):
+        action = "log"
+    budget = os.environ.get("LEAVE_QUERY_BUDGET")
+    threshold = int(os.environ.get("LEAVE_QUERY_REPEAT_THRESHOLD", DEFAULT_REPEAT_THRESHOLD))
+    return action, int(budget) if budget else None, threshold
+
+def instrument_engine(engine):
+    """Feed a SQLAlchemy engine's statements to watch() blocks"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record(statement)
@@ -0,0 +1,143 @@
+"""
+Versioned schema migrations for the SQLAlchemy models in database.py.
+
+Base.metadata.create_all() only creates missing tables: it cannot add an
+index or a column to a table that already exists. Schema changes are
+therefore numbered migrations, recorded in the schema_version table and
+applied once, at deploy time:
+
+    python deploy.py migrate
+
+A brand-new database gets the current models in one create_all() and is
+stamped with the latest version. A database created before versioning
+(tables but no schema_version) runs every migration; they are written to
+skip work that is already done. The app only compares versions when it
+boots (schema_is_current), a single query.
+
+To change the schema, append a migration to MIGRATIONS and make the same
+change to the models in database.py, so that fresh and migrated databases
+end up identical.
+"""
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, insert, select, text
+from sqlalchemy.exc import DBAPIError
+
+from database import Base, engine
+
+VERSION_TABLE = "schema_version"
+
+version_metadata = MetaData()
+schema_version = Table(
+    VERSION_TABLE, version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+# Helpers for migrations
+def create_table(conn, table_name):
+    """Create a model's table (with its indexes) if it does not exist"""
+    Base.metadata.tables[table_name].create(conn, checkfirst=True)
+
+def create_index(conn, table_name, index_name):
+    """Create one of a model's declared indexes if the table lacks it"""
+    existing = {index["name"] for index in inspect(conn).get_indexes(table_name)}
+    if index_name in existing:
+        return
+    table = Base.metadata.tables[table_name]
+    next(index for index in table.indexes if index.name == index_name).create(conn)
+
+def add_column(conn, table_name, column_name):
+    """Add one of a model's columns to an existing table if it is missing"""
+    existing = {column["name"] for column in inspect(conn).get_columns(table_name)}
+    if column_name in existing:
+        return
+    column = Base.metadata.tables[table_name].c[column_name]
+    quote = conn.dialect.identifier_preparer.quote
+    conn.execute(text(
+        f"ALTER TABLE {quote(table_name)} ADD COLUMN {quote(column_name)} {column.type.compile(dialect=conn.dialect)}"
+    ))
+
+# Migrations
+def _baseline(conn):
+    """Tables of the first release"""
+    for table_name in ("users", "user_profiles", "leave_types", "leave_balances", "leave_requests"):
+        create_table(conn, table_name)
+
+def _leave_request_keyset_indexes(conn):
+    create_index(conn, "leave_requests", "ix_leave_requests_employee_created")
+    create_index(conn, "leave_requests", "ix_leave_requests_status_created")
+
+def _leave_usage_rollups(conn):
+    create_table(conn, "leave_usage_rollups")
+
+def _leave_request_department(conn):
+    add_column(conn, "leave_requests", "department")
+    # Best known value for existing requests: the requester's current department
+    conn.execute(text(
+        "UPDATE leave_requests SET department = "
+        "(SELECT department FROM user_profiles WHERE user_profiles.id = leave_requests.employee_id) "
+        "WHERE department IS NULL"
+    ))
+
+def _leave_balance_user_year_index(conn):
+    create_index(conn, "leave_balances", "ix_leave_balances_user_year")
+
+def _leave_history(conn):
+    create_table(conn, "leave_history")
+
+def _slow_queries(conn):
+    create_table(conn, "slow_queries")
+
+MIGRATIONS = [
+    (1, "baseline", _baseline),
+    (2, "leave request keyset indexes", _leave_request_keyset_indexes),
+    (3, "leave usage rollups", _leave_usage_rollups),
+    (4, "leave request department", _leave_request_department),
+    (5, "leave balance user/year index", _leave_balance_user_year_index),
+    (6, "leave history", _leave_history),
+    (7, "slow query log", _slow_queries),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def current_version():
+    """Applied schema version, or None for an unversioned database"""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(func.max(schema_version.c.version))).scalar()
+    except DBAPIError:
+        # No schema_version table yet
+        return None
+
+def schema_is_current():
+    """Cheap boot-time check: one query, no reflection"""
+    version = current_version()
+    # A newer schema is fine while an older app version is still running
+    return version is not None and version >= LATEST_VERSION
+
+def migrate(log=print):
+    """Apply pending migrations, each in its own transaction; returns the applied names"""
+    with engine.begin() as conn:
+        version_metadata.create_all(conn)
+        version = conn.execute(select(func.max(schema_version.c.version))).scalar()
+
+        if version is None and not set(inspect(conn).get_table_names()) - {VERSION_TABLE}:
+            # Empty database: create the current schema and stamp it
+            Base.metadata.create_all(conn)
+            conn.execute(insert(schema_version), [
+                {"version": number, "name": name, "applied_at": datetime.utcnow()}
+                for number, name, apply in MIGRATIONS
+            ])
+            log(f"Created schema at version {LATEST_VERSION}")
+            return [name for number, name, apply in MIGRATIONS]
+
+    applied = []
+    for number, name, apply in MIGRATIONS:
+        if version is not None and number <= version:
+            continue
+        with engine.begin() as conn:
+            apply(conn)
+            conn.execute(insert(schema_version).values(version=number, name=name, applied_at=datetime.utcnow()))
+        log(f"Applied migration {number}: {name}")
+        applied.append(name)
+    return applied
@@ -0,0 +1,204 @@
+"""
+Slow-query log with automatic EXPLAIN capture, for both ORMs.
+
+A Recorder is fed every statement's duration by a driver hook (see
+leaves.slow_queries for Django and instrument_engine() for SQLAlchemy).
+Statements over the threshold are fingerprinted (querywatch.fingerprint),
+their bind parameters redacted to types, and SELECTs explained on the
+same connection right away, at most once per fingerprint per
+EXPLAIN_INTERVAL; EXPLAIN ANALYZE runs the query again, so it is opt-in.
+Entries are handed to a store function on a background thread, off the
+request path and outside the caller's transaction; the stores aggregate
+them per fingerprint (count, total and max time, latest plan).
+"""
+from collections import namedtuple
+from datetime import datetime, timezone
+import atexit
+import contextvars
+import hashlib
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+import querywatch
+
+logger = logging.getLogger("slowlog")
+
+DEFAULT_THRESHOLD_MS = 200
+EXPLAIN_INTERVAL = 3600
+MAX_PENDING = 1000
+
+SlowQueryEntry = namedtuple(
+    "SlowQueryEntry",
+    ["digest", "fingerprint", "sql", "params", "call_site", "database", "ms", "plan", "seen_at"]
+)
+
+_EXPLAINABLE = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+
+# Set while the log runs its own statements (EXPLAIN, storing entries)
+_suppressed = contextvars.ContextVar("slowlog_suppressed", default=False)
+
+def digest(fingerprint):
+    return hashlib.sha256(fingerprint.encode()).hexdigest()
+
+def redact(value):
+    """Bind parameters with their values replaced by type names (and string lengths)"""
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, (str, bytes)):
+        return f"<{type(value).__name__}:{len(value)}>"
+    return f"<{type(value).__name__}>"
+
+def explain_statement(vendor, sql, analyze=False):
+    """EXPLAIN for a SELECT on this database vendor, or None"""
+    if not _EXPLAINABLE.match(sql):
+        return None
+    if vendor == "postgresql":
+        return ("EXPLAIN (ANALYZE, BUFFERS) " if analyze else "EXPLAIN ") + sql
+    if vendor == "mysql":
+        return ("EXPLAIN ANALYZE " if analyze else "EXPLAIN ") + sql
+    if vendor == "sqlite":
+        # SQLite has no ANALYZE variant
+        return "EXPLAIN QUERY PLAN " + sql
+    return None
+
+def format_plan(vendor, rows):
+    if vendor == "sqlite":
+        # (id, parent, notused, detail): keep the detail
+        return "\n".join(str(row[-1]) for row in rows)
+    return "\n".join(
+        str(row[0]) if len(row) == 1 else " | ".join(str(column) for column in row)
+        for row in rows
+    )
+
+class Recorder:
+    """Detects slow statements and hands them to store(entry) on a background thread"""
+
+    def __init__(self, store, threshold_ms=DEFAULT_THRESHOLD_MS, analyze=False, explain_interval=EXPLAIN_INTERVAL):
+        self.store = store
+        self.threshold_ms = threshold_ms
+        self.analyze = analyze
+        self.explain_interval = explain_interval
+        self._explained = {}
+        self._pending = queue.Queue(MAX_PENDING)
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def observe(self, vendor, sql, params, seconds, database, run_explain):
+        """
+        Called by a driver hook after each statement; run_explain(statement)
+        runs an EXPLAIN with the same parameters and returns its rows.
+        """
+        ms = seconds * 1000
+        if ms < self.threshold_ms or _suppressed.get():
+            return
+        token = _suppressed.set(True)
+        try:
+            shape = querywatch.fingerprint(sql)
+            plan = self._explain(vendor, sql, shape, run_explain)
+            entry = SlowQueryEntry(
+                digest(shape), shape, sql, redact(params), querywatch.call_site(),
+                database, ms, plan, datetime.now(timezone.utc)
+            )
+        finally:
+            _suppressed.reset(token)
+        self._submit(entry)
+
+    def _explain(self, vendor, sql, shape, run_explain):
+        statement = explain_statement(vendor, sql, self.analyze)
+        if statement is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if now - self._explained.get(shape, -self.explain_interval) < self.explain_interval:
+                return None
+            self._explained[shape] = now
+        try:
+            return format_plan(vendor, run_explain(statement))
+        except Exception as exc:
+            logger.warning("EXPLAIN failed for %s: %s", shape[:200], exc)
+            return f"EXPLAIN failed: {exc}"
+
+    def _submit(self, entry):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_entries, name="slowlog-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+        try:
+            self._pending.put_nowait(entry)
+        except queue.Full:
+            logger.warning("Slow-query log backlog full, dropping an entry")
+
+    def _write_entries(self):
+        _suppressed.set(True)
+        while True:
+            entry = self._pending.get()
+            try:
+                self.store(entry)
+            except Exception as exc:
+                # e.g. while the log's table is being created by a migration
+                logger.warning("Could not store a slow query: %s", exc)
+            finally:
+                self._pending.task_done()
+
+    def flush(self):
+        """Wait until every submitted entry has been stored"""
+        if self._writer is not None:
+            self._pending.join()
+
+# Streamlit / SQLAlchemy
+def settings_from_env():
+    """(threshold in ms, analyze) from LEAVE_SLOW_QUERY_MS / LEAVE_SLOW_QUERY_ANALYZE; threshold 0 is off"""
+    threshold = float(os.environ.get("LEAVE_SLOW_QUERY_MS", DEFAULT_THRESHOLD_MS))
+    analyze = os.environ.get("LEAVE_SLOW_QUERY_ANALYZE", "").lower() in ("1", "true", "yes")
+    return threshold, analyze
+
+def instrument_engine(engine, name, recorder):
+    """Feed a SQLAlchemy engine's statement timings to a Recorder"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slowlog_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info["slowlog_started"].pop()
+        if executemany:
+            return
+
+        def run_explain(explain):
+            # A raw cursor on the same connection: same transaction, no events
+            explain_cursor = conn.connection.dbapi_connection.cursor()
+            # A failed statement aborts a PostgreSQL transaction; contain it
+            savepoint = conn.dialect.name == "postgresql"
+            try:
+                if savepoint:
+                    explain_cursor.execute("SAVEPOINT slowlog_explain")
+                explain_cursor.execute(explain, parameters)
+                rows = explain_cursor.fetchall()
+                if savepoint:
+                    explain_cursor.execute("RELEASE SAVEPOINT slowlog_explain")
+                return rows
+            except Exception:
+                if savepoint:
+                    explain_cursor.execute("ROLLBACK TO SAVEPOINT slowlog_explain")
+                raise
+            finally:
+                explain_cursor.close()
+
+        recorder.observe(conn.dialect.name, statement, parameters, seconds, name, run_explain)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("slowlog_started"):
+            conn.info["slowlog_started"].pop()
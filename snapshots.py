@@ -0,0 +1,303 @@
+"""
+Columnar snapshot store for analytics.
+
+Exports leave_requests, leave_balances and the small reference tables from
+the transactional database into Arrow IPC (default) or Parquet files,
+partitioned by year:
+
+    <snapshot dir>/leave_requests/year=2025/part.arrow
+    <snapshot dir>/leave_balances/year=2025/part.arrow
+    <snapshot dir>/user_profiles/part.arrow
+    <snapshot dir>/leave_types/part.arrow
+    <snapshot dir>/_state.json
+
+leave_requests is exported incrementally: only rows whose updated_at is at
+or after the stored watermark are read from the database and merged into
+the existing partitions by id. Arrow IPC files are read back through a
+memory map, so analytics get zero-copy access without touching the
+production database. Deleted requests are only dropped by a --full export.
+leave_balances is rewritten in full on every export, and partitions for
+years that no longer have balances are removed.
+"""
+from datetime import datetime
+from sqlalchemy import select
+import json
+import os
+
+from database import engine, User, UserProfile, LeaveType, LeaveBalance, LeaveRequest
+
+DEFAULT_SNAPSHOT_DIR = os.environ.get('LEAVE_SNAPSHOT_DIR', 'snapshots')
+FORMATS = ('arrow', 'parquet')
+CHUNK_SIZE = 10000
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Snapshots need pyarrow: pip install pyarrow")
+    return pa, pc, pq
+
+def _schemas(pa):
+    status = pa.dictionary(pa.int8(), pa.string())
+    return {
+        'leave_requests': pa.schema([
+            ('id', pa.int64()),
+            ('employee_id', pa.int32()),
+            ('leave_type_id', pa.int32()),
+            ('start_date', pa.date32()),
+            ('end_date', pa.date32()),
+            ('start_time', pa.time64('us')),
+            ('end_time', pa.time64('us')),
+            ('duration_type', status),
+            ('total_days', pa.decimal128(6, 2)),
+            ('reason', pa.string()),
+            ('status', status),
+            ('approved_by_id', pa.int32()),
+            ('approved_date', pa.timestamp('us')),
+            ('supervisor_comments', pa.string()),
+            ('created_at', pa.timestamp('us')),
+            ('updated_at', pa.timestamp('us')),
+        ]),
+        'leave_balances': pa.schema([
+            ('id', pa.int64()),
+            ('user_id', pa.int32()),
+            ('leave_type_id', pa.int32()),
+            ('year', pa.int16()),
+            ('allocated_days', pa.decimal128(6, 2)),
+            ('used_days', pa.decimal128(6, 2)),
+            ('carry_over_days', pa.decimal128(6, 2)),
+        ]),
+        'user_profiles': pa.schema([
+            ('id', pa.int32()),
+            ('employee_id', pa.string()),
+            ('first_name', pa.string()),
+            ('last_name', pa.string()),
+            ('position', pa.string()),
+            ('department', pa.dictionary(pa.int16(), pa.string())),
+            ('starting_date', pa.date32()),
+            ('supervisor_id', pa.int32()),
+            ('is_supervisor', pa.bool_()),
+            ('is_senior', pa.bool_()),
+            ('is_active', pa.bool_()),
+        ]),
+        'leave_types': pa.schema([
+            ('id', pa.int32()),
+            ('name', pa.string()),
+            ('pay_percentage', pa.decimal128(5, 2)),
+        ]),
+    }
+
+def _queries():
+    requests = LeaveRequest.__table__
+    balances = LeaveBalance.__table__
+    return {
+        'leave_requests': select(*[requests.c[name] for name in (
+            'id', 'employee_id', 'leave_type_id', 'start_date', 'end_date', 'start_time',
+            'end_time', 'duration_type', 'total_days', 'reason', 'status', 'approved_by_id',
+            'approved_date', 'supervisor_comments', 'created_at', 'updated_at'
+        )]),
+        'leave_balances': select(*[balances.c[name] for name in (
+            'id', 'user_id', 'leave_type_id', 'year', 'allocated_days', 'used_days', 'carry_over_days'
+        )]),
+        'user_profiles': select(
+            UserProfile.id, UserProfile.employee_id, User.first_name, User.last_name,
+            UserProfile.position, UserProfile.department, UserProfile.starting_date,
+            UserProfile.supervisor_id, UserProfile.is_supervisor, UserProfile.is_senior,
+            UserProfile.is_active
+        ).join(User, User.id == UserProfile.user_id),
+        'leave_types': select(LeaveType.id, LeaveType.name, LeaveType.pay_percentage),
+    }
+
+# File helpers
+def _extension(fmt):
+    return 'parquet' if fmt == 'parquet' else 'arrow'
+
+def _partition_path(root, table_name, fmt, year=None):
+    parts = [root, table_name]
+    if year is not None:
+        parts.append(f'year={year}')
+    return os.path.join(*parts, f'part.{_extension(fmt)}')
+
+def _write_table(table, path, fmt):
+    """Write atomically so readers never see a half-written partition"""
+    pa, pc, pq = _pyarrow()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    if fmt == 'parquet':
+        pq.write_table(table, tmp_path, compression='zstd')
+    else:
+        # Uncompressed IPC so that memory-mapped reads are zero-copy
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    os.replace(tmp_path, path)
+
+def _read_file(path):
+    pa, pc, pq = _pyarrow()
+    if path.endswith('.parquet'):
+        return pq.read_table(path, memory_map=True)
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all()
+
+def _partition_files(root, table_name):
+    """{year: path} for a partitioned table (year None when unpartitioned)"""
+    table_dir = os.path.join(root, table_name)
+    if not os.path.isdir(table_dir):
+        return {}
+    files = {}
+    for entry in sorted(os.listdir(table_dir)):
+        entry_path = os.path.join(table_dir, entry)
+        if entry.startswith('year=') and os.path.isdir(entry_path):
+            for name in os.listdir(entry_path):
+                if name.startswith('part.') and not name.endswith('.tmp'):
+                    files[int(entry.split('=', 1)[1])] = os.path.join(entry_path, name)
+        elif entry.startswith('part.') and not entry.endswith('.tmp'):
+            files[None] = entry_path
+    return files
+
+def _remove_partition(path):
+    """Delete a partition file, and its year= directory once empty"""
+    os.remove(path)
+    year_dir = os.path.dirname(path)
+    if os.path.basename(year_dir).startswith('year=') and not os.listdir(year_dir):
+        os.rmdir(year_dir)
+
+def _load_state(root):
+    path = os.path.join(root, '_state.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+def _save_state(root, state):
+    path = os.path.join(root, '_state.json')
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(f'{path}.tmp', path)
+
+# Export
+def _fetch(conn, query, schema):
+    """Stream query results into an Arrow table in chunks"""
+    pa, pc, pq = _pyarrow()
+    result = conn.execution_options(stream_results=True).execute(query)
+    batches = []
+    while True:
+        rows = result.mappings().fetchmany(CHUNK_SIZE)
+        if not rows:
+            break
+        batches.append(pa.RecordBatch.from_pylist([dict(row) for row in rows], schema=schema))
+    return pa.Table.from_batches(batches, schema=schema)
+
+def _split_by_year(table, column):
+    pa, pc, pq = _pyarrow()
+    if table.num_rows == 0:
+        return {}
+    years = pc.year(table[column])
+    return {
+        year: table.filter(pc.equal(years, year))
+        for year in pc.unique(years).to_pylist()
+        if year is not None
+    }
+
+def _export_requests(conn, root, fmt, schema, query, watermark):
+    pa, pc, pq = _pyarrow()
+    if watermark:
+        query = query.where(LeaveRequest.updated_at >= datetime.fromisoformat(watermark))
+    delta = _fetch(conn, query, schema)
+    if delta.num_rows == 0:
+        return 0, watermark
+
+    delta_ids = delta['id']
+    new_by_year = _split_by_year(delta, 'start_date')
+    existing = _partition_files(root, 'leave_requests')
+
+    # Drop stale copies of changed rows from every partition that has them,
+    # then append the fresh rows to the partition for their start year
+    for year in sorted(set(existing) | set(new_by_year)):
+        current = None
+        if year in existing:
+            current = _read_file(existing[year])
+            stale = pc.is_in(current['id'], value_set=delta_ids)
+            if not pc.any(stale).as_py() and year not in new_by_year:
+                continue
+            current = current.filter(pc.invert(stale))
+        parts = [t for t in (current, new_by_year.get(year)) if t is not None]
+        merged = pa.concat_tables(parts).sort_by('id')
+        if merged.num_rows == 0:
+            # Every request of that year moved to another one
+            _remove_partition(existing[year])
+            continue
+        _write_table(merged, _partition_path(root, 'leave_requests', fmt, year), fmt)
+
+    new_watermark = pc.max(delta['updated_at']).as_py()
+    return delta.num_rows, new_watermark.isoformat() if new_watermark else watermark
+
+def export_snapshots(root=DEFAULT_SNAPSHOT_DIR, fmt='arrow', full=False):
+    """
+    Export or refresh the snapshot store.
+
+    Returns {table name: rows written} for reporting.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown snapshot format: {fmt}')
+    pa, pc, pq = _pyarrow()
+    schemas = _schemas(pa)
+    queries = _queries()
+
+    state = {} if full else _load_state(root)
+    if state.get('format', fmt) != fmt:
+        raise ValueError(f"Snapshot store at {root} uses {state['format']}; export with --full to switch")
+    if full:
+        for table_name in ('leave_requests', 'leave_balances'):
+            for path in _partition_files(root, table_name).values():
+                _remove_partition(path)
+
+    written = {}
+    with engine.connect() as conn:
+        written['leave_requests'], state['leave_requests_watermark'] = _export_requests(
+            conn, root, fmt, schemas['leave_requests'], queries['leave_requests'],
+            state.get('leave_requests_watermark')
+        )
+
+        # Balances and reference tables are small: always re-export in full
+        balances = _fetch(conn, queries['leave_balances'], schemas['leave_balances'])
+        balance_years = set(pc.unique(balances['year']).to_pylist())
+        for year in balance_years:
+            _write_table(
+                balances.filter(pc.equal(balances['year'], year)),
+                _partition_path(root, 'leave_balances', fmt, year),
+                fmt
+            )
+        # Years whose balances were all deleted would otherwise be read forever
+        for year, path in _partition_files(root, 'leave_balances').items():
+            if year not in balance_years:
+                _remove_partition(path)
+        written['leave_balances'] = balances.num_rows
+
+        for table_name in ('user_profiles', 'leave_types'):
+            table = _fetch(conn, queries[table_name], schemas[table_name])
+            _write_table(table, _partition_path(root, table_name, fmt), fmt)
+            written[table_name] = table.num_rows
+
+    state['format'] = fmt
+    state['exported_at'] = datetime.utcnow().isoformat()
+    _save_state(root, state)
+    return written
+
+# Reading
+def has_snapshots(root=DEFAULT_SNAPSHOT_DIR):
+    return os.path.exists(os.path.join(root, '_state.json'))
+
+def read_snapshot(table_name, root=DEFAULT_SNAPSHOT_DIR, years=None):
+    """Read a snapshot table (optionally only some years) as an Arrow table"""
+    pa, pc, pq = _pyarrow()
+    files = _partition_files(root, table_name)
+    if years is not None:
+        years = set(years)
+        files = {year: path for year, path in files.items() if year in years}
+    tables = [_read_file(path) for year, path in sorted(files.items(), key=lambda item: item[0] or 0)]
+    if not tables:
+        return _schemas(pa)[table_name].empty_table()
+    return pa.concat_tables(tables)
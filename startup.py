@@ -0,0 +1,64 @@
+"""
+Startup timing and lazy imports for the Streamlit app.
+
+Streamlit re-executes app.py on every rerun, but imported modules (this one
+included) live for the whole process, so the timings collected here cover
+the cold start: the first import of each module and the one-time database
+init. Heavy libraries (pandas, plotly, the analytics page) are imported
+through lazy_import() by the page that needs them instead of at the top of
+app.py, so the login page and dashboards paint without paying for them.
+
+Set LEAVE_STARTUP_TIMINGS=1 (or open the app with ?timings=1) to show the
+report in the sidebar; it is always written once to the process log.
+"""
+from contextlib import contextmanager
+import importlib
+import os
+import sys
+import time
+
+_process_started = time.perf_counter()
+_timings = {}
+_reported = False
+
+@contextmanager
+def timed(name):
+    """Record how long the block takes, the first time it runs in this process"""
+    if name in _timings:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timings[name] = time.perf_counter() - started
+
+def lazy_import(module_name):
+    """Import a module on first use, timing the import"""
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    with timed(f"import {module_name}"):
+        return importlib.import_module(module_name)
+
+def timings():
+    """[(step, seconds)] in the order the steps first ran"""
+    return list(_timings.items())
+
+def since_process_start():
+    return time.perf_counter() - _process_started
+
+def log_report():
+    """Write the cold start timings to the process log, once"""
+    global _reported
+    if _reported:
+        return
+    _reported = True
+    steps = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings())
+    print(f"[startup] ready in {since_process_start() * 1000:.0f} ms ({steps})", file=sys.stderr)
+
+def show_timings(query_params=None):
+    """Whether the timing report should be rendered in the UI"""
+    if os.environ.get("LEAVE_STARTUP_TIMINGS", "").lower() in ("1", "true", "yes"):
+        return True
+    return bool(query_params and query_params.get("timings"))